@@ -0,0 +1,213 @@
+import asyncio
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+# Remote calls (LLM and translator) one user, session or IP may start:
+# a bucket of BURST tokens refilled at RATE tokens per second, kept in
+# the default Django cache. Worker processes share a bucket only when
+# that cache is shared (Redis, Memcached, the database cache); with the
+# default LocMemCache each process keeps its own, and a caller gets the
+# rate once per process.
+REMOTE_CALL_RATE = getattr(settings, "CHATBOT_REMOTE_CALL_RATE", 1.0)
+REMOTE_CALL_BURST = getattr(settings, "CHATBOT_REMOTE_CALL_BURST", 20)
+
+WAIT_SAMPLES = 1024
+
+
+class Overloaded(Exception):
+    """The remote call was refused: the caller should answer without it."""
+
+
+class Limiter:
+    """
+    Caps the calls one process has in flight to a remote service. When
+    all `limit` slots are taken, up to `queue_size` callers wait at most
+    `timeout` seconds for one; anyone beyond that is refused at once, so
+    a burst turns into fast fallback answers instead of a growing queue.
+    """
+
+    def __init__(self, name, limit, queue_size, timeout):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.waits = deque(maxlen=WAIT_SAMPLES)
+        self._cond = threading.Condition()
+        LIMITERS[name] = self
+
+    def acquire(self):
+        start = time.monotonic()
+        with self._cond:
+            if self.in_flight >= self.limit:
+                if self.waiting >= self.queue_size:
+                    self.rejected += 1
+                    raise Overloaded(f"{self.name} queue is full")
+
+                self.waiting += 1
+                try:
+                    deadline = start + self.timeout
+                    while self.in_flight >= self.limit:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.timed_out += 1
+                            raise Overloaded(f"no free {self.name} slot")
+                        self._cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+
+            self.in_flight += 1
+            self.admitted += 1
+            self.waits.append(time.monotonic() - start)
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def snapshot(self):
+        with self._cond:
+            waits = sorted(self.waits)
+            counts = {
+                "in_flight": self.in_flight,
+                "queue_depth": self.waiting,
+                "limit": self.limit,
+                "queue_size": self.queue_size,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+            }
+
+        def pct(p):
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))] * 1000, 2) if waits else 0.0
+
+        counts["wait_ms"] = {"p50": pct(0.5), "p95": pct(0.95), "max": pct(1.0)}
+        return counts
+
+
+LIMITERS = {}
+
+
+# ---------------- Per-caller token buckets ----------------
+
+_identity = contextvars.ContextVar("chatbot_caller", default=None)
+throttled = 0
+
+
+def identity_for(request):
+    if request.user.is_authenticated:
+        return f"user:{request.user.pk}"
+    if request.session.session_key:
+        return f"session:{request.session.session_key}"
+    return f"ip:{request.META.get('REMOTE_ADDR', '')}"
+
+
+def charge_caller(view):
+    """
+    View decorator: remote calls made while the view runs are charged to
+    the request's user, session or IP.
+    """
+    if asyncio.iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            identity = await sync_to_async(identity_for)(request)
+            with acting_as(identity):
+                return await view(request, *args, **kwargs)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with acting_as(identity_for(request)):
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def acting_as(identity):
+    """Charges the remote calls made inside the block to identity."""
+    previous = _identity.get()
+    _identity.set(identity)
+    try:
+        yield
+    finally:
+        _identity.set(previous)
+
+
+def take_token(identity, rate=REMOTE_CALL_RATE, burst=REMOTE_CALL_BURST):
+    """
+    Takes one token from identity's bucket in the default cache (see
+    REMOTE_CALL_RATE for when that is per process). The read and the
+    write are not atomic, so concurrent requests of one caller can
+    overdraw it by a call or two; that is fine for keeping one user from
+    crowding out the others.
+    """
+    key = f"chatbot:bucket:{identity}"
+    now = time.time()
+    tokens, stamp = cache.get(key) or (burst, now)
+    tokens = min(burst, tokens + (now - stamp) * rate)
+    if tokens < 1:
+        return False
+    cache.set(key, (tokens - 1, now), timeout=int(burst / rate) + 60)
+    return True
+
+
+def claim(limiter):
+    """
+    Charges one remote call to the current caller and takes a slot of
+    limiter, which the caller must release. Raises Overloaded instead.
+    """
+    global throttled
+    identity = _identity.get()
+    if identity is not None and not take_token(identity):
+        throttled += 1
+        raise Overloaded(f"{identity} is over its remote call rate")
+    limiter.acquire()
+
+
+@contextmanager
+def admit(limiter):
+    """
+    Runs the block as one remote call: charged to the current caller's
+    bucket and holding one of limiter's slots. Raises Overloaded when
+    either refuses.
+    """
+    claim(limiter)
+    try:
+        yield
+    finally:
+        limiter.release()
+
+
+@asynccontextmanager
+async def admit_async(limiter):
+    """admit() for coroutines; the wait for a slot happens in a worker thread."""
+    waiter = asyncio.ensure_future(sync_to_async(claim, thread_sensitive=False)(limiter))
+    try:
+        await asyncio.shield(waiter)
+    except asyncio.CancelledError:
+        # The slot may still be granted after we stopped waiting.
+        waiter.add_done_callback(lambda f: f.cancelled() or f.exception() or limiter.release())
+        raise
+    try:
+        yield
+    finally:
+        limiter.release()
+
+
+def metrics():
+    return {
+        "limiters": {name: limiter.snapshot() for name, limiter in LIMITERS.items()},
+        "throttled": throttled,
+    }
@@ -1,13 +1,18 @@
 import re
-import requests
-from django.conf import settings
+from django.utils.html import escape, format_html
 from core.models import Order
 from .models import Conversation, Message
-
-HF_HEADERS = {
-    "Authorization": f"Bearer {settings.HF_API_KEY}",
-    "Content-Type": "application/json",
-}
+from .llm_cache import cached_generate, cached_generate_async, cached_stream
+from .hf_client import chat_completion, hf_generate_async, hf_stream
+from .persistence import persist_turn
+from .replies import Reply
+from .lexical import answer as knowledge_answer
+from .retrieval import answer as semantic_answer
+from .intents import (
+    ROUTER, GREETINGS, CART_KEYWORDS, WISHLIST_KEYWORDS, PAYMENT_KEYWORDS,
+    TRACKING_KEYWORDS, AVAILABILITY_KEYWORDS, HEALTH_BENEFIT_KEYWORDS,
+    GENERAL_HEALTH_KEYWORDS, OFFER_KEYWORDS
+)
 
 STOPWORDS = {
     "what","is","are","the","in","of","and","to","me",
@@ -19,23 +24,6 @@ STORE_KEYWORDS = {
     "cart","wishlist","offer","discount","available"
 }
 
-GREETINGS = {
-    "morning": [
-        "good morning", "gm", "morning"
-    ],
-    "afternoon": [
-        "good afternoon", "good noon"
-    ],
-    "evening": [
-        "good evening", "evening"
-    ],
-    "night": [
-        "good night", "gn"
-    ],
-    "general": [
-        "hi", "hello", "hey", "hai", "hii", "hola"
-    ]
-}
 
 MEANINGLESS_WORDS = {"a", "an", "the"}
 
@@ -58,20 +46,41 @@ def is_meaningless_input(query):
 
 from difflib import SequenceMatcher
 
-def match_product(query, products, threshold=0.75):
-    q = normalize(query)
+def _best_ratio(q, products):
     best, score = None, 0
 
     for p in products:
         title = normalize(p.get("title", ""))
 
         if q == title or q in title:
-            return p
+            return p, 1.0
 
         r = SequenceMatcher(None, q, title).ratio()
         if r > score:
             best, score = p, r
 
+    return best, score
+
+
+def match_product(query, products, threshold=0.75, index=None):
+    q = normalize(query)
+
+    if index is not None:
+        contained = index.containing(q)
+        if contained is not None:
+            for p in contained:
+                title = normalize(p.get("title", ""))
+                if q == title or q in title:
+                    return p
+
+            # Trigram overlap is no bound on SequenceMatcher: "ured" shares
+            # no trigram with "curd" yet scores 0.75. Only trust the
+            # shortlist when it has a hit; otherwise scan the whole catalog.
+            best, score = _best_ratio(q, index.candidates(q))
+            if score >= threshold:
+                return best
+
+    best, score = _best_ratio(q, products)
     return best if score >= threshold else None
 
 
@@ -90,56 +99,74 @@ def match_category(query, categories):
 
     return None
 
-def related_products(category, products, limit=6):
+def related_sort_key(p):
+    return (
+        p.get("stock", 0) <= 0,     
+        not p.get("is_offer", False),  
+        -p.get("rating", 0)
+    )
+
+def related_products(category, products, limit=6, index=None):
+    if index is not None:
+        return index.related(category)[:limit]
+
     items = [
         p for p in products
         if p.get("category", "").lower() == category.lower()
     ]
 
-    items.sort(key=lambda x: (
-        x.get("stock", 0) <= 0,     
-        not x.get("is_offer", False),  
-        -x.get("rating", 0)
-    ))
+    items.sort(key=related_sort_key)
 
     return items[:limit]
 
 
 def hf_generate(prompt, max_tokens=60):
     try:
-        res = requests.post(
-            "https://router.huggingface.co/v1/chat/completions",
-            headers=HF_HEADERS,
-            json={
-                "model": settings.HF_MODEL,
-                "messages": [{"role": "user", "content": prompt}],
-                "max_tokens": max_tokens,
-            },
-            timeout=15
+        return chat_completion(
+            [{"role": "user", "content": prompt}], max_tokens=max_tokens
         )
-        return res.json()["choices"][0]["message"]["content"]
     except Exception:
         return ""
 
-def product_benefit(name):
-    return hf_generate(
-        f"Give 1 short health benefit of {name}.",
-        max_tokens=40
-    )
+def cached_hf_generate(prompt, max_tokens=60, refresh=False):
+    return cached_generate(hf_generate, prompt, max_tokens, refresh=refresh)
+
+def benefit_prompt(name):
+    return f"Give 1 short health benefit of {name}."
+
+def product_benefit(name, refresh=False):
+    return cached_hf_generate(benefit_prompt(name), max_tokens=40, refresh=refresh)
+
+async def product_benefit_async(name):
+    return await cached_generate_async(hf_generate_async, benefit_prompt(name), 40)
+
+def product_benefit_stream(name):
+    return cached_stream(hf_stream, benefit_prompt(name), 40)
 
 def save_bot(conversation, user_msg, reply):
-    bot = Message.objects.create(
+    """
+    Writes the turn: the conversation if it is new, the user message if
+    it is not saved yet and the bot reply, in one transaction.
+    """
+    bot = Message(
         conversation=conversation,
         sender="bot",
         content=fix_article(reply)
     )
-    return {
+    persist_turn(conversation, user_msg, bot)
+    result = {
         "conversation_id": conversation.id,
         "user_message_id": user_msg.id,
         "bot_message_id": bot.id,
         "response": bot.content,
         "title": conversation.title,
     }
+    # Canned replies are localized from the reply catalog instead of
+    # being machine-translated (chatbot.replies.localize).
+    if isinstance(reply, Reply):
+        result["reply_key"] = reply.key
+        result["reply_params"] = reply.params
+    return result
 
 def get_category_url(category_name, categories):
     for c in categories:
@@ -147,7 +174,17 @@ def get_category_url(category_name, categories):
             return c.get("url")
     return "#"
 
-def get_offer_products(products, category=None, product_name=None, limit=6):
+def offer_sort_key(p):
+    return (
+        p.get("stock", 0) <= 0,
+        -p.get("discount_percent", 0)
+    )
+
+def get_offer_products(products, category=None, product_name=None, limit=6, index=None):
+    if index is not None:
+        products = index.offers(category)
+        category = None
+
     items = []
 
     for p in products:
@@ -162,61 +199,33 @@ def get_offer_products(products, category=None, product_name=None, limit=6):
 
         items.append(p)
 
-    items.sort(key=lambda x: (
-        x.get("stock", 0) <= 0,
-        -x.get("discount_percent", 0)
-    ))
+    items.sort(key=offer_sort_key)
 
     return items[:limit]
 
 def is_offer_query(query):
     q = normalize(query)
-    return "offer" in q or "discount" in q or "sale" in q
+    return any(k in q for k in OFFER_KEYWORDS)
 
 def is_cart_query(query):
     q = normalize(query)
-    return any(
-        k in q for k in [
-            "cart", "my cart", "show cart",
-            "what in my cart", "items in cart"
-        ]
-    )
+    return any(k in q for k in CART_KEYWORDS)
 
 def is_wishlist_query(query):
     q = normalize(query)
-    return any(
-        k in q for k in [
-            "wishlist", "wish list", "my wishlist",
-            "show wishlist", "items in wishlist"
-        ]
-    )
+    return any(k in q for k in WISHLIST_KEYWORDS)
     
 def is_payment_query(query):
     q = normalize(query)
-    return any(
-        k in q for k in [
-            "payment", "razorpay", "transaction",
-            "payment status", "payment id"
-        ]
-    )
+    return any(k in q for k in PAYMENT_KEYWORDS)
 
 def is_tracking_query(query):
     q = normalize(query)
-    return any(
-        k in q for k in [
-            "track order", "where is my order",
-            "order location", "delivery status"
-        ]
-    )
+    return any(k in q for k in TRACKING_KEYWORDS)
 
 def is_availability_query(query):
     q = normalize(query)
-    return any(
-        k in q for k in [
-            "available", "in stock", "stock",
-            "out of stock", "availability"
-        ]
-    )
+    return any(k in q for k in AVAILABILITY_KEYWORDS)
 
 def extract_order_id(query):
     q = query.lower()
@@ -264,19 +273,41 @@ def build_category_vocabulary(products):
 
     return vocab
 
-def infer_category_for_missing_product(query, products):
+def infer_category_for_missing_product(query, products, index=None, fuzzy_index=None):
     q = normalize(query)
 
     if not looks_like_grocery_word(q):
         return None
 
-    category_vocab = build_category_vocabulary(products)
+    if index is not None:
+        category = index.infer_category(q)
+        if category:
+            return category
+    else:
+        category_vocab = build_category_vocabulary(products)
 
-    for category, words in category_vocab.items():
-        for w in words:
-            if q in w or w in q:
-                return category
+        for category, words in category_vocab.items():
+            for w in words:
+                if q in w or w in q:
+                    return category
+
+    if fuzzy_index is not None:
+        return fuzzy_category(q, fuzzy_index)
+
+    return None
 
+
+def fuzzy_category(word, fuzzy_index):
+    """
+    Category of the product whose title or search term is the fewest
+    edits from word ("tomoto" -> tomato's), so a misspelt item still
+    finds its shelf without asking the LLM.
+    """
+    for _, key in fuzzy_index.lookup(word):
+        for pos in fuzzy_index.keys[key]:
+            category = fuzzy_index.products[pos].get("category")
+            if category:
+                return category
     return None
 
 
@@ -293,7 +324,7 @@ def ai_guess_category(word, categories):
         f"- Do not explain\n"
     )
 
-    result = hf_generate(prompt, max_tokens=10).lower().strip()
+    result = cached_hf_generate(prompt, max_tokens=10).lower().strip()
 
     for c in categories:
         if normalize(c.get("name")) == normalize(result):
@@ -389,22 +420,14 @@ def is_general_health_query(query, product=None):
         return False  # 🔴 IMPORTANT: product queries handled separately
 
     q = normalize(query)
-    return any(k in q for k in {
-        "health", "healthy",
-        "nutritious", "good food"
-    })
+    return any(k in q for k in GENERAL_HEALTH_KEYWORDS)
 
 
 GENERAL_HEALTH_CATEGORIES = ["fruits", "vegetables", "nuts"]
 
 def is_product_health_benefit_query(query):
     q = normalize(query)
-    keywords = {
-        "health benefit", "health benefits",
-        "benefits", "good for health",
-        "is it healthy", "nutrition"
-    }
-    return any(k in q for k in keywords)
+    return any(k in q for k in HEALTH_BENEFIT_KEYWORDS)
 
 def extract_context(raw, product, category):
     q = normalize(raw)
@@ -433,24 +456,43 @@ def detect_greeting(raw):
     return None
 
 def greeting_reply(greeting_type):
-    if greeting_type == "morning":
-        return "🌅 Good morning! Hope you have a fresh and healthy day 😊"
-    if greeting_type == "afternoon":
-        return "☀️ Good afternoon! How can I help you today?"
-    if greeting_type == "evening":
-        return "🌆 Good evening! Looking for something fresh today?"
-    if greeting_type == "night":
-        return "🌙 Good night! Take care and eat healthy 🌿"
+    if greeting_type in ("morning", "afternoon", "evening", "night"):
+        return Reply(f"greeting_{greeting_type}")
 
-    return "👋 Hello! How can I help you today?"
+    return Reply("greeting")
 
 
+def benefit_product_for(query, project_data):
+    """
+    The product handle_chat will ask product_benefit() about for this
+    query, or None. Lets the async view start the LLM call early.
+    """
+    raw = normalize(query)
+    route = ROUTER.route(raw)
+
+    if route.greeting or is_meaningless_input(query):
+        return None
+
+    products = project_data.get("products", [])
+    product = match_product(clean_query(raw), products, index=project_data.get("product_index"))
+    if not product:
+        return None
+
+    if "cart" in route or "wishlist" in route or "offer" in route:
+        return None
+
+    if "availability" in route and "health_benefit" not in route:
+        return None
+
+    return product
+
 def handle_chat(user, query, conversation=None, project_data=None):
 
+    # Nothing is written until save_bot stores the whole turn.
     if not conversation:
-        conversation = Conversation.objects.create(user=user)
+        conversation = Conversation(user=user)
 
-    user_msg = Message.objects.create(
+    user_msg = Message(
         conversation=conversation,
         sender="user",
         content=query
@@ -458,14 +500,14 @@ def handle_chat(user, query, conversation=None, project_data=None):
 
     raw = normalize(query)
     clean = clean_query(raw)
+    route = ROUTER.route(raw)
 
     # ---------------- Greeting ----------------
-    greeting_type = detect_greeting(raw)
-    if greeting_type:
+    if route.greeting:
         return save_bot(
             conversation,
             user_msg,
-            greeting_reply(greeting_type)
+            greeting_reply(route.greeting)
         )
 
     # ---------------- Meaningless input ----------------
@@ -473,23 +515,24 @@ def handle_chat(user, query, conversation=None, project_data=None):
         return save_bot(
             conversation,
             user_msg,
-            "🙂 Please type a product or category name, for example: apple, milk, vegetables."
+            Reply("meaningless")
         )
 
     products = project_data.get("products", [])
     categories = project_data.get("categories", [])
+    category_index = project_data.get("category_index")
 
-    product = match_product(clean, products)
+    product = match_product(clean, products, index=project_data.get("product_index"))
     category = match_category(clean, categories)
     
     #  CART
 
-    if is_cart_query(raw):
+    if "cart" in route:
         if user and user.is_authenticated:
             cart_items = user.cart_items.select_related("product")
 
             if not cart_items.exists():
-                return save_bot(conversation, user_msg, "Your cart is empty 🛒")
+                return save_bot(conversation, user_msg, Reply("cart_empty"))
 
             reply = "<b>🛒 Your cart items:</b><br>"
             for item in cart_items:
@@ -500,16 +543,16 @@ def handle_chat(user, query, conversation=None, project_data=None):
 
             return save_bot(conversation, user_msg, reply)
 
-        return save_bot(conversation, user_msg, "Please log in to view your cart 😊")
+        return save_bot(conversation, user_msg, Reply("cart_login"))
     
     #  WISHLIST
 
-    if is_wishlist_query(raw):
+    if "wishlist" in route:
         if user and user.is_authenticated:
             items = user.wishlist.all()
 
             if not items.exists():
-                return save_bot(conversation, user_msg, "Your wishlist is empty ⭐")
+                return save_bot(conversation, user_msg, Reply("wishlist_empty"))
 
             reply = "<b>⭐ Your wishlist items:</b><br>"
             for p in items:
@@ -517,17 +560,17 @@ def handle_chat(user, query, conversation=None, project_data=None):
 
             return save_bot(conversation, user_msg, reply)
 
-        return save_bot(conversation, user_msg, "Please log in to view wishlist 😊")
+        return save_bot(conversation, user_msg, Reply("wishlist_login"))
 
     #  OFFERS
 
-    if is_offer_query(raw):
+    if "offer" in route:
         if product:
-            items = get_offer_products(products, product_name=product["title"])
+            items = get_offer_products(products, product_name=product["title"], index=category_index)
         elif category:
-            items = get_offer_products(products, category=category)
+            items = get_offer_products(products, category=category, index=category_index)
         else:
-            items = get_offer_products(products)
+            items = get_offer_products(products, index=category_index)
 
         if items:
             reply = "<b>🔥 Available Offers:</b><br>"
@@ -543,11 +586,11 @@ def handle_chat(user, query, conversation=None, project_data=None):
                 )
             return save_bot(conversation, user_msg, reply)
 
-        return save_bot(conversation, user_msg, "Currently there are no active offers 😔")
+        return save_bot(conversation, user_msg, Reply("no_offers"))
     
     # PRODUCT HEALTH BENEFITS
 
-    if product and is_product_health_benefit_query(raw):
+    if product and "health_benefit" in route:
         benefit = product_benefit(product["title"])
         reply = (
             f"<b>🌿 Health benefits of "
@@ -560,19 +603,18 @@ def handle_chat(user, query, conversation=None, project_data=None):
 
     #  PRODUCT AVAILABILITY
 
-    if product and is_availability_query(raw):
+    if product and "availability" in route:
         if product.get("stock", 0) > 0:
             return save_bot(
                 conversation,
                 user_msg,
-                f"✅ <b>{product['title']}</b> is available in stock.<br>"
-                f"Price: ₹{product['base_price']}"
+                Reply("in_stock", title=product["title"], price=product["base_price"])
             )
         else:
             return save_bot(
                 conversation,
                 user_msg,
-                f"❌ <b>{product['title']}</b> is currently out of stock."
+                Reply("out_of_stock", title=product["title"])
             )
 
     #  PRODUCT DETAILS
@@ -607,7 +649,7 @@ def handle_chat(user, query, conversation=None, project_data=None):
     # CATEGORY
 
     if category:
-        items = related_products(category, products)
+        items = related_products(category, products, index=category_index)
         if items:
             reply = f"<b>{category.title()} items available:</b><br>"
             for p in items:
@@ -632,7 +674,7 @@ def handle_chat(user, query, conversation=None, project_data=None):
 
     # DIET / NUTRITION
 
-    diet_type = detect_diet_type(raw, product)
+    diet_type = None if product else route.diet_type
     if diet_type:
         allowed_categories = DIET_CATEGORY_MAP.get(diet_type, [])
         intro = DIET_INTRO.get(diet_type, "")
@@ -652,7 +694,7 @@ def handle_chat(user, query, conversation=None, project_data=None):
 
     #  GENERAL HEALTH
 
-    if is_general_health_query(raw, product):
+    if not product and "general_health" in route:
         suggested_products = [
             p for p in products
             if p.get("category") in GENERAL_HEALTH_CATEGORIES and p.get("stock", 0) > 0
@@ -671,17 +713,35 @@ def handle_chat(user, query, conversation=None, project_data=None):
             )
             return save_bot(conversation, user_msg, reply)
 
+    #  KNOWLEDGE BASE (FAQ, documents, product descriptions)
+
+    if not product and not category and not route.intents:
+        hit = knowledge_answer(query) or semantic_answer(query)
+        if hit:
+            if hit["kind"] == "product":
+                p = next((p for p in products if p["id"] == hit["ref"]), None)
+                url = p.get("url", "#") if p else "#"
+                reply = format_html(
+                    "<b><a href='{}' target='_blank'>{}</a></b><br>{}",
+                    url, hit["title"], hit["text"],
+                )
+            else:
+                reply = escape(hit["text"])
+            return save_bot(conversation, user_msg, reply)
+
     #  PRODUCT NOT FOUND → CATEGORY FALLBACK
 
     if not product and not category and looks_like_grocery_word(query):
 
-        guessed_category = infer_category_for_missing_product(query, products)
+        guessed_category = infer_category_for_missing_product(
+            query, products, index=category_index, fuzzy_index=project_data.get("fuzzy_index")
+        )
 
         if not guessed_category:
             guessed_category = ai_guess_category(query, categories)
 
         if guessed_category:
-            items = related_products(guessed_category, products)
+            items = related_products(guessed_category, products, index=category_index)
             if items:
                 reply = (
                     f"Sorry, we don’t have <b>{query}</b> right now ❌<br><br>"
@@ -704,13 +764,13 @@ def handle_chat(user, query, conversation=None, project_data=None):
             
     # ORDER / PAYMENT / TRACKING (RESTORED)
 
-    if is_tracking_query(raw) or is_payment_query(raw) or "order" in raw:
+    if "tracking" in route or "payment" in route or "order" in route:
 
         if not user or not user.is_authenticated:
             return save_bot(
                 conversation,
                 user_msg,
-                "Please log in to view order details 🔐"
+                Reply("order_login")
             )
 
         order_id = extract_order_id(raw)
@@ -721,7 +781,7 @@ def handle_chat(user, query, conversation=None, project_data=None):
                 return save_bot(
                     conversation,
                     user_msg,
-                    f"No order found with ID {order_id} ❌"
+                    Reply("order_not_found", order_id=order_id)
                 )
         else:
             o = Order.objects.filter(user=user).order_by("-created_at").first()
@@ -729,7 +789,7 @@ def handle_chat(user, query, conversation=None, project_data=None):
                 return save_bot(
                     conversation,
                     user_msg,
-                    "You don’t have any orders yet 📦"
+                    Reply("no_orders")
                 )
 
         reply = (
@@ -751,6 +811,5 @@ def handle_chat(user, query, conversation=None, project_data=None):
     return save_bot(
         conversation,
         user_msg,
-        "👋 I’m your shopping assistant! "
-        "Try asking: product price, today’s offers, my cart, or order status."
+        Reply("fallback")
     )
@@ -0,0 +1,107 @@
+import logging
+import threading
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from .category_index import CategoryIndex
+from .fuzzy import FuzzyIndex
+from .product_index import ProductIndex
+
+logger = logging.getLogger(__name__)
+
+CATALOG_VERSION_KEY = "chatbot_catalog_version"
+
+# Offers switch on and off by time, not only by saves, so a snapshot is
+# also refreshed once it gets older than this.
+CATALOG_MAX_AGE = getattr(settings, "CHATBOT_CATALOG_MAX_AGE", 300)
+
+
+class CatalogSnapshot:
+    """
+    Process-level copy of the chatbot project data.
+
+    The data is built once and reused by every chat turn. Model signals
+    bump a version number in the Django cache; when a request sees that
+    its copy is older than that version it keeps serving the old copy
+    and rebuilds a new one in a background thread. Every build makes
+    new indexes and replaces (data, version, built_at) in one
+    assignment, so a request never sees parts of two builds.
+    """
+
+    def __init__(self):
+        self.current = None
+        self._lock = threading.Lock()
+        self._building = False
+
+    def current_version(self):
+        version = cache.get(CATALOG_VERSION_KEY)
+        if version is None:
+            cache.add(CATALOG_VERSION_KEY, 1, timeout=None)
+            version = cache.get(CATALOG_VERSION_KEY, 1)
+        return version
+
+    def invalidate(self):
+        try:
+            cache.incr(CATALOG_VERSION_KEY)
+        except ValueError:
+            cache.set(CATALOG_VERSION_KEY, 2, timeout=None)
+
+    def build(self):
+        version = self.current_version()
+        module = import_module(settings.PROJECT_CHAT_DATA)
+        data = module.get_project_data()
+
+        data["product_index"] = ProductIndex(data["products"])
+        data["category_index"] = CategoryIndex(data["products"])
+        data["fuzzy_index"] = FuzzyIndex(data["products"])
+
+        self.current = (data, version, time.monotonic())
+        return data
+
+    def _rebuild_in_background(self):
+        try:
+            self.build()
+        except Exception:
+            logger.exception("Chatbot catalog rebuild failed")
+        finally:
+            connection.close()
+            with self._lock:
+                self._building = False
+
+    def get(self):
+        current = self.current
+        if current is None:
+            return self.build()
+
+        data, version, built_at = current
+        fresh = time.monotonic() - built_at < CATALOG_MAX_AGE
+        if fresh and version == self.current_version():
+            return data
+
+        with self._lock:
+            start = not self._building
+            self._building = True
+
+        if start:
+            threading.Thread(
+                target=self._rebuild_in_background,
+                name="chatbot-catalog-rebuild",
+                daemon=True,
+            ).start()
+
+        return data
+
+
+snapshot = CatalogSnapshot()
+
+
+def get_catalog():
+    return snapshot.get()
+
+
+def invalidate_catalog(**kwargs):
+    snapshot.invalidate()
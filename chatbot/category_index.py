@@ -0,0 +1,90 @@
+from .api import normalize, offer_sort_key, related_sort_key
+
+# looks_like_grocery_word() rejects longer words, so no query that
+# reaches infer_category() is longer than this.
+MAX_WORD = 20
+
+
+class CategoryIndex:
+    """
+    Per-snapshot lookups for the category answers in handle_chat.
+
+    related(category) and offers(category) are the lists
+    related_products and get_offer_products used to filter and sort per
+    message, sorted once here. infer_category(word) answers
+    infer_category_for_missing_product with dictionary lookups: every
+    substring of every title word maps to the first category (in catalog
+    order) that has it, and so does every one-word title.
+    """
+
+    def __init__(self, products):
+        self.by_category = {}
+        self.offer_list = []
+        self.offers_by_category = {}
+        self.substrings = {}
+        self.titles = {}
+        self.order = {}
+
+        for p in products:
+            category = p.get("category") or ""
+            self.by_category.setdefault(category.lower(), []).append(p)
+
+            if p.get("is_offer"):
+                self.offer_list.append(p)
+                self.offers_by_category.setdefault(normalize(category), []).append(p)
+
+            title = normalize(p.get("title"))
+            if not category or not title:
+                continue
+            r = self.order.setdefault(category, len(self.order))
+            self._add_title(title, category, r)
+
+        for items in self.by_category.values():
+            items.sort(key=related_sort_key)
+        self.offer_list.sort(key=offer_sort_key)
+        for items in self.offers_by_category.values():
+            items.sort(key=offer_sort_key)
+
+        self.substrings = {s: c for s, (_, c) in self.substrings.items()}
+        self.titles = {t: c for t, (_, c) in self.titles.items()}
+
+    def _add_title(self, title, category, r):
+        def keep(table, key):
+            if key not in table or r < table[key][0]:
+                table[key] = (r, category)
+
+        if " " not in title and len(title) <= MAX_WORD:
+            keep(self.titles, title)
+
+        for word in set(title.split()):
+            for i in range(len(word)):
+                for j in range(i + 1, min(len(word), i + MAX_WORD) + 1):
+                    keep(self.substrings, word[i:j])
+
+    def related(self, category):
+        return self.by_category.get(category.lower(), [])
+
+    def offers(self, category=None):
+        if category:
+            return self.offers_by_category.get(normalize(category), [])
+        return self.offer_list
+
+    def infer_category(self, word):
+        """
+        First category with a title containing word, or a title that
+        word contains. word is a normalized single word.
+        """
+        found = []
+        if word in self.substrings:
+            found.append(self.substrings[word])
+
+        titles = self.titles
+        for i in range(len(word)):
+            for j in range(i + 1, len(word) + 1):
+                category = titles.get(word[i:j])
+                if category is not None:
+                    found.append(category)
+
+        if not found:
+            return None
+        return min(found, key=self.order.get)
@@ -0,0 +1,112 @@
+from django.conf import settings
+
+# Edit distance the index answers for, and how many leading characters
+# of each key it stores deletions of (SymSpell's prefix trick: enough to
+# find every candidate, at a fraction of the memory).
+FUZZY_MAX_DISTANCE = getattr(settings, "CHATBOT_FUZZY_MAX_DISTANCE", 2)
+FUZZY_PREFIX_LENGTH = 7
+
+
+def levenshtein(a, b, max_distance=None):
+    """
+    Edit distance between a and b. With max_distance, stops as soon as
+    the distance is known to be larger and returns max_distance + 1.
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    if max_distance is not None and len(a) - len(b) > max_distance:
+        return max_distance + 1
+    if not b:
+        return len(a)
+
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a):
+        current = [i + 1]
+        for j, cb in enumerate(b):
+            current.append(min(
+                previous[j + 1] + 1,
+                current[j] + 1,
+                previous[j] + (ca != cb),
+            ))
+        if max_distance is not None and min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+def deletes(word, distance):
+    """word and every string made by deleting up to distance characters."""
+    found = {word}
+    edge = {word}
+    for _ in range(distance):
+        edge = {w[:i] + w[i + 1:] for w in edge for i in range(len(w))} - found
+        found |= edge
+    return found
+
+
+class FuzzyIndex:
+    """
+    Symmetric-deletion dictionary over product titles and search terms,
+    normalized like the chatbot matchers compare them (lowercase, no
+    spaces). lookup() only generates the deletions of the query prefix,
+    so its cost depends on the query, not on the catalog size.
+    """
+
+    def __init__(self, products=(), max_distance=FUZZY_MAX_DISTANCE,
+                 prefix_length=FUZZY_PREFIX_LENGTH):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.products = list(products)
+        self.keys = {}
+        self.deletes = {}
+
+        for pos, p in enumerate(self.products):
+            for key in self.product_keys(p):
+                self.keys.setdefault(key, []).append(pos)
+
+        for key in self.keys:
+            for d in deletes(key[:prefix_length], max_distance):
+                self.deletes.setdefault(d, []).append(key)
+
+    @staticmethod
+    def product_keys(p):
+        title = p.get("title_lower") or (p.get("title") or "").lower()
+        keys = {title.replace(" ", "")}
+        for term in p.get("search_terms", []):
+            keys.add((term or "").lower().strip().replace(" ", ""))
+        keys.discard("")
+        return keys
+
+    def lookup(self, word, max_distance=None):
+        """
+        (distance, key) for every key within max_distance edits of word,
+        nearest first.
+        """
+        if max_distance is None or max_distance > self.max_distance:
+            max_distance = self.max_distance
+        word = word.lower().replace(" ", "")
+        if not word:
+            return []
+
+        seen = set()
+        matches = []
+        for d in deletes(word[:self.prefix_length], max_distance):
+            for key in self.deletes.get(d, ()):
+                if key in seen:
+                    continue
+                seen.add(key)
+                if abs(len(key) - len(word)) > max_distance:
+                    continue
+                dist = levenshtein(word, key, max_distance)
+                if dist <= max_distance:
+                    matches.append((dist, key))
+
+        matches.sort()
+        return matches
+
+    def lookup_products(self, word, max_distance=None):
+        """Products with a title or search term near word, in catalog order."""
+        positions = set()
+        for _, key in self.lookup(word, max_distance):
+            positions.update(self.keys[key])
+        return [self.products[pos] for pos in sorted(positions)]
@@ -0,0 +1,262 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+import weakref
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+from . import admission
+
+logger = logging.getLogger(__name__)
+
+# settings.HF_API_URL can point at a local stub (manage.py hf_stub_server)
+# for offline load tests.
+HF_URL = getattr(settings, "HF_API_URL", "https://router.huggingface.co/v1/chat/completions")
+
+HF_HEADERS = {
+    "Authorization": f"Bearer {settings.HF_API_KEY}",
+    "Content-Type": "application/json",
+}
+
+HF_TIMEOUT = getattr(settings, "CHATBOT_HF_TIMEOUT", 15)
+
+# Calls allowed in flight per process, how many more callers may wait
+# for a slot, and how long they wait before giving up with the fallback
+# answer (see chatbot.admission).
+HF_MAX_CONCURRENCY = getattr(settings, "CHATBOT_HF_MAX_CONCURRENCY", 8)
+HF_QUEUE_SIZE = getattr(settings, "CHATBOT_HF_QUEUE_SIZE", 32)
+HF_QUEUE_TIMEOUT = getattr(settings, "CHATBOT_HF_QUEUE_TIMEOUT", 2)
+
+# Consecutive failures that open the breaker, and seconds it stays open
+# before a single trial call is let through.
+HF_BREAKER_THRESHOLD = getattr(settings, "CHATBOT_HF_BREAKER_THRESHOLD", 5)
+HF_BREAKER_RESET = getattr(settings, "CHATBOT_HF_BREAKER_RESET", 30)
+
+
+class HFUnavailable(Exception):
+    """
+    The call was not made: the breaker is open, no slot was free or the
+    caller is over its rate.
+    """
+
+
+class CircuitBreaker:
+    """
+    Closed: calls go through. After `threshold` failures in a row it
+    opens and every call fails fast for `reset_timeout` seconds; then
+    one trial call is allowed (half-open), which closes it on success
+    or reopens it on failure.
+    """
+
+    def __init__(self, threshold=HF_BREAKER_THRESHOLD, reset_timeout=HF_BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def release_trial(self):
+        """Gives back a half-open trial that ended without calling the model."""
+        with self._lock:
+            self.trial_running = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.threshold:
+                if self.opened_at is None:
+                    logger.warning("HF circuit breaker opened after %s failures", self.failures)
+                self.opened_at = time.monotonic()
+            self.trial_running = False
+
+
+breaker = CircuitBreaker()
+limiter = admission.Limiter("llm", HF_MAX_CONCURRENCY, HF_QUEUE_SIZE, HF_QUEUE_TIMEOUT)
+
+
+class guarded_call:
+    """
+    Context manager around one HF call: checks the breaker, gets the call
+    admitted (caller's token bucket and a concurrency slot) and records
+    the outcome. Raises HFUnavailable instead of calling when any of
+    them refuses.
+    """
+
+    def __enter__(self):
+        if not breaker.allow():
+            raise HFUnavailable("circuit open")
+        try:
+            admission.claim(limiter)
+        except admission.Overloaded as e:
+            breaker.release_trial()
+            raise HFUnavailable(str(e)) from e
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        limiter.release()
+        # A stream closed early by its reader is not a model failure.
+        if exc_type is None or issubclass(exc_type, GeneratorExit):
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+        return False
+
+
+# ---------------- Sync client ----------------
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Process-wide requests.Session, so calls reuse kept-alive connections."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            session.headers.update(HF_HEADERS)
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HF_MAX_CONCURRENCY)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def chat_completion(messages, max_tokens=60, timeout=HF_TIMEOUT):
+    """
+    Returns the completion text for messages. Raises HFUnavailable when
+    the breaker or the limiter refuses the call, and the underlying
+    error when the call itself fails.
+    """
+    with guarded_call():
+        res = get_session().post(
+            HF_URL,
+            json={
+                "model": settings.HF_MODEL,
+                "messages": messages,
+                "max_tokens": max_tokens,
+            },
+            timeout=timeout
+        )
+        res.raise_for_status()
+        return res.json()["choices"][0]["message"]["content"]
+
+
+def hf_stream(prompt, max_tokens=60):
+    """
+    Streams a chat completion from the router, yielding text pieces as
+    they arrive. Yields nothing if the call fails.
+    """
+    try:
+        with guarded_call():
+            res = get_session().post(
+                HF_URL,
+                json={
+                    "model": settings.HF_MODEL,
+                    "messages": [{"role": "user", "content": prompt}],
+                    "max_tokens": max_tokens,
+                    "stream": True,
+                },
+                stream=True,
+                timeout=HF_TIMEOUT
+            )
+            with res:
+                res.raise_for_status()
+                for line in res.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    delta = json.loads(data)["choices"][0].get("delta", {})
+                    if delta.get("content"):
+                        yield delta["content"]
+    except Exception:
+        return
+
+
+# ---------------- Async client ----------------
+
+# One pooled client per event loop; an httpx.AsyncClient cannot be
+# shared between loops (each WSGI request gets a fresh one).
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            headers=HF_HEADERS,
+            timeout=httpx.Timeout(HF_TIMEOUT, pool=HF_QUEUE_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=HF_MAX_CONCURRENCY,
+                max_keepalive_connections=HF_MAX_CONCURRENCY,
+            ),
+        )
+        _async_clients[loop] = client
+    return client
+
+
+async def hf_generate_async(prompt, max_tokens=60):
+    """
+    Async twin of api.hf_generate: same payload, same "" on any failure.
+    Shares the sync calls' admission limiter.
+    """
+    if not breaker.allow():
+        return ""
+    try:
+        async with admission.admit_async(limiter):
+            res = await get_async_client().post(
+                HF_URL,
+                json={
+                    "model": settings.HF_MODEL,
+                    "messages": [{"role": "user", "content": prompt}],
+                    "max_tokens": max_tokens,
+                },
+            )
+        res.raise_for_status()
+        content = res.json()["choices"][0]["message"]["content"]
+    except (admission.Overloaded, httpx.PoolTimeout):
+        breaker.release_trial()
+        return ""
+    except Exception:
+        breaker.record_failure()
+        return ""
+    except BaseException:
+        # Cancelled, usually because the client went away: not the
+        # model's failure, but a half-open trial must not stay taken.
+        breaker.release_trial()
+        raise
+    breaker.record_success()
+    return content
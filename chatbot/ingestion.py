@@ -0,0 +1,234 @@
+import hashlib
+import logging
+import os
+import threading
+from array import array
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from . import lexical, retrieval
+from .retrieval import HASHED_EMBEDDER, chunk_text, hashed_embedding
+
+logger = logging.getLogger(__name__)
+
+INGEST_WORKERS = getattr(settings, "CHATBOT_INGEST_WORKERS", os.cpu_count() or 1)
+
+# Below this many changed documents chunking and hashing run in-process;
+# starting worker processes costs more than it saves.
+POOL_MIN_DOCUMENTS = 50
+BATCH_SIZE = 500
+# Work items handed to a pool worker at a time.
+POOL_CHUNKSIZE = 16
+EMBED_SLICE = 64
+VECTOR_REBUILD_DELAY = 5.0
+
+
+def chunk_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def document_hash(document):
+    return lexical.content_hash(document.title, document.content)
+
+
+# ---------------- Worker functions ----------------
+# These run in pool processes, so they only take and return plain data.
+
+def prepare(item):
+    """
+    (document id, content) -> (document id, [(text, hash), ...]): the
+    document's overlapping chunks, without repeats of an identical chunk.
+    """
+    doc_id, content = item
+    seen = set()
+    chunks = []
+    for text in chunk_text(content):
+        digest = chunk_hash(text)
+        if digest not in seen:
+            seen.add(digest)
+            chunks.append((text, digest))
+    return doc_id, chunks
+
+
+def embed_hashed(texts):
+    return [array("f", hashed_embedding(t)).tobytes() for t in texts]
+
+
+# ---------------- Pipeline ----------------
+
+@contextmanager
+def worker_pool(workers, jobs):
+    if workers > 1 and jobs >= POOL_MIN_DOCUMENTS:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            yield pool
+    else:
+        yield None
+
+
+def _map(pool, func, items):
+    if pool is None:
+        return list(map(func, items))
+    return list(pool.map(func, items, chunksize=POOL_CHUNKSIZE))
+
+
+def _embed(pool, texts, embedder):
+    if not texts:
+        return []
+    if embedder == HASHED_EMBEDDER and pool is not None:
+        slices = [texts[i:i + EMBED_SLICE] for i in range(0, len(texts), EMBED_SLICE)]
+        return [v for part in pool.map(embed_hashed, slices) for v in part]
+    return [array("f", v).tobytes() for v in retrieval.embed(texts, embedder)]
+
+
+def _stored_embeddings(hashes, embedder):
+    """Embeddings already computed for any of hashes, by any document."""
+    from .models import DocumentChunk
+
+    found = {}
+    hashes = list(hashes)
+    for start in range(0, len(hashes), BATCH_SIZE):
+        rows = DocumentChunk.objects.filter(
+            content_hash__in=hashes[start:start + BATCH_SIZE],
+            embedder=embedder,
+            embedding__isnull=False,
+        ).values_list("content_hash", "embedding")
+        for digest, vector in rows:
+            found.setdefault(digest, bytes(vector))
+    return found
+
+
+def _sync_batch(documents, pool, embedder, stats):
+    from .models import Document, DocumentChunk
+
+    prepared = dict(_map(pool, prepare, [(d.id, d.content) for d in documents]))
+
+    existing = {}
+    rows = DocumentChunk.objects.filter(document__in=documents).only(
+        "id", "document_id", "position", "content_hash", "embedder"
+    )
+    for row in rows:
+        existing.setdefault(row.document_id, {})[row.position] = row
+
+    changed, created, removed = [], [], []
+    for d in documents:
+        current = existing.get(d.id, {})
+        chunks = prepared[d.id]
+        for position, (text, digest) in enumerate(chunks):
+            row = current.get(position)
+            if row is None:
+                created.append(DocumentChunk(
+                    document_id=d.id, position=position, text=text, content_hash=digest,
+                ))
+            elif row.content_hash != digest or row.embedder != embedder:
+                row.text, row.content_hash = text, digest
+                changed.append(row)
+            else:
+                stats["chunks_unchanged"] += 1
+        removed += [row.id for position, row in current.items() if position >= len(chunks)]
+
+    pending = changed + created
+    vectors = _stored_embeddings({c.content_hash for c in pending}, embedder)
+    stats["embeddings_reused"] += sum(1 for c in pending if c.content_hash in vectors)
+
+    texts = {}
+    for c in pending:
+        if c.content_hash not in vectors:
+            texts.setdefault(c.content_hash, c.text)
+    vectors.update(zip(texts, _embed(pool, list(texts.values()), embedder)))
+    stats["embeddings_computed"] += len(texts)
+
+    for c in pending:
+        c.embedder, c.embedding = embedder, vectors[c.content_hash]
+
+    with transaction.atomic():
+        if removed:
+            DocumentChunk.objects.filter(id__in=removed).delete()
+        DocumentChunk.objects.bulk_update(
+            changed, ["text", "content_hash", "embedder", "embedding"], batch_size=BATCH_SIZE
+        )
+        DocumentChunk.objects.bulk_create(created, batch_size=BATCH_SIZE)
+        for d in documents:
+            d.indexed_hash = document_hash(d)
+            Document.objects.filter(pk=d.pk).update(indexed_hash=d.indexed_hash)
+
+    stats["chunks_updated"] += len(changed)
+    stats["chunks_created"] += len(created)
+    stats["chunks_deleted"] += len(removed)
+
+    lexical.store.update(lambda index: any([
+        lexical.index_document(index, d, [text for text, _ in prepared[d.id]])
+        for d in documents
+    ]))
+
+
+def ingest(documents, workers=None, force=False, embedder=None):
+    """
+    Brings the stored chunks of documents up to date and returns counts
+    of what it did.
+
+    A document whose title and content hash to its indexed_hash is
+    skipped without reading its chunks. The others are re-chunked (over
+    a process pool for large batches); only chunks whose hash changed are
+    written, and a chunk's embedding is computed once per distinct text
+    across the whole corpus. The BM25 index is updated for the changed
+    documents; the vector index is left to the caller (build_index).
+    """
+    workers = INGEST_WORKERS if workers is None else workers
+    embedder = embedder or retrieval.default_embedder()
+    stats = Counter()
+
+    stale = []
+    for d in documents:
+        stats["documents"] += 1
+        if force or d.indexed_hash != document_hash(d):
+            stale.append(d)
+    stats["documents_changed"] = len(stale)
+    if not stale:
+        return stats
+
+    with worker_pool(workers, len(stale)) as pool:
+        for start in range(0, len(stale), BATCH_SIZE):
+            _sync_batch(stale[start:start + BATCH_SIZE], pool, embedder, stats)
+    return stats
+
+
+# ---------------- Signal-driven updates ----------------
+
+_rebuild_timer = None
+_rebuild_lock = threading.Lock()
+
+
+def _rebuild_vector_index():
+    global _rebuild_timer
+    with _rebuild_lock:
+        _rebuild_timer = None
+    try:
+        retrieval.build_index()
+    except Exception:
+        logger.exception("Rebuilding the vector index failed")
+    finally:
+        connection.close()
+
+
+def schedule_vector_rebuild(delay=VECTOR_REBUILD_DELAY):
+    """
+    Rewrites the vector index from the stored chunk embeddings a few
+    seconds from now, once for any number of document changes.
+    """
+    global _rebuild_timer
+    with _rebuild_lock:
+        if _rebuild_timer is None:
+            _rebuild_timer = threading.Timer(delay, _rebuild_vector_index)
+            _rebuild_timer.daemon = True
+            _rebuild_timer.start()
+
+
+def ingest_document(document):
+    stats = ingest([document], workers=1)
+    if stats["documents_changed"]:
+        schedule_vector_rebuild()
+    return stats
@@ -0,0 +1,170 @@
+from collections import deque
+
+# Keyword lists for every chat intent. handle_chat routes on these
+# through ROUTER; the is_*_query helpers in api.py use the same lists.
+
+CART_KEYWORDS = ["cart", "my cart", "show cart", "what in my cart", "items in cart"]
+
+WISHLIST_KEYWORDS = ["wishlist", "wish list", "my wishlist", "show wishlist", "items in wishlist"]
+
+OFFER_KEYWORDS = ["offer", "discount", "sale"]
+
+PAYMENT_KEYWORDS = ["payment", "razorpay", "transaction", "payment status", "payment id"]
+
+TRACKING_KEYWORDS = ["track order", "where is my order", "order location", "delivery status"]
+
+AVAILABILITY_KEYWORDS = ["available", "in stock", "stock", "out of stock", "availability"]
+
+HEALTH_BENEFIT_KEYWORDS = [
+    "health benefit", "health benefits",
+    "benefits", "good for health",
+    "is it healthy", "nutrition"
+]
+
+GENERAL_HEALTH_KEYWORDS = ["health", "healthy", "nutritious", "good food"]
+
+ORDER_KEYWORDS = ["order"]
+
+GREETINGS = {
+    "morning": [
+        "good morning", "gm", "morning"
+    ],
+    "afternoon": [
+        "good afternoon", "good noon"
+    ],
+    "evening": [
+        "good evening", "evening"
+    ],
+    "night": [
+        "good night", "gn"
+    ],
+    "general": [
+        "hi", "hello", "hey", "hai", "hii", "hola"
+    ]
+}
+
+# detect_diet_type checks, in order: (diet type, keywords that must all
+# match, or None) then (keywords of which any may match, or None).
+DIET_RULES = [
+    ("morning", None, {"morning", "breakfast"}),
+    ("noon", None, {"noon", "lunch", "afternoon"}),
+    ("evening", None, {"evening", "snack"}),
+    ("night", None, {"night", "dinner"}),
+    ("kids_noon", {"kids", "noon"}, None),
+    ("kids_night", {"kids", "night"}, None),
+    ("gym_morning", {"gym", "morning"}, None),
+    ("gym_noon", {"gym", "noon"}, None),
+    ("gym_night", {"gym", "night"}, None),
+    ("weight_loss", None, {"weight", "loss", "slim"}),
+    ("gym", None, {"gym", "protein", "muscle"}),
+    ("kids", {"kids"}, None),
+    ("general", None, {"diet", "nutrition"}),
+]
+
+# Intents in the order handle_chat checks them.
+INTENT_KEYWORDS = {
+    "cart": CART_KEYWORDS,
+    "wishlist": WISHLIST_KEYWORDS,
+    "offer": OFFER_KEYWORDS,
+    "health_benefit": HEALTH_BENEFIT_KEYWORDS,
+    "availability": AVAILABILITY_KEYWORDS,
+    "general_health": GENERAL_HEALTH_KEYWORDS,
+    "tracking": TRACKING_KEYWORDS,
+    "payment": PAYMENT_KEYWORDS,
+    "order": ORDER_KEYWORDS,
+}
+
+INTENT_PRIORITY = {name: i for i, name in enumerate(INTENT_KEYWORDS)}
+
+
+class KeywordMatcher:
+    """
+    Aho-Corasick automaton: finds every keyword occurring as a substring
+    of a text in a single left-to-right pass.
+    """
+
+    def __init__(self, keywords):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [set()]
+
+        for word in keywords:
+            node = 0
+            for ch in word:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(set())
+                node = nxt
+            self.out[node].add(word)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self.goto[node].items():
+                queue.append(nxt)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] |= self.out[self.fail[nxt]]
+
+    def find(self, text):
+        goto, fail, out = self.goto, self.fail, self.out
+        found = set()
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                found |= out[node]
+        return found
+
+
+class Route:
+    """The intents, greeting and diet type found in one normalized query."""
+
+    def __init__(self, matched):
+        self.matched = matched
+        self.intents = sorted(
+            (name for name, words in INTENT_KEYWORDS.items() if matched.intersection(words)),
+            key=INTENT_PRIORITY.get
+        )
+        self.greeting = next(
+            (tod for tod, words in GREETINGS.items() if matched.intersection(words)),
+            None
+        )
+        self.diet_type = None
+        for diet, all_of, any_of in DIET_RULES:
+            if (all_of and all_of <= matched) or (any_of and matched & any_of):
+                self.diet_type = diet
+                break
+
+    def __contains__(self, intent):
+        return intent in self.intents
+
+    def __repr__(self):
+        return f"<Route {self.intents} greeting={self.greeting} diet={self.diet_type}>"
+
+
+class IntentRouter:
+    def __init__(self):
+        words = set()
+        for keywords in INTENT_KEYWORDS.values():
+            words.update(keywords)
+        for keywords in GREETINGS.values():
+            words.update(keywords)
+        for _, all_of, any_of in DIET_RULES:
+            words.update(all_of or ())
+            words.update(any_of or ())
+        self.matcher = KeywordMatcher(words)
+
+    def route(self, normalized_query):
+        return Route(self.matcher.find(normalized_query))
+
+
+ROUTER = IntentRouter()
@@ -0,0 +1,478 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import struct
+import threading
+import time
+from array import array
+from importlib import import_module
+
+from django.conf import settings
+
+from .retrieval import chunk_text
+
+logger = logging.getLogger(__name__)
+
+
+def index_path():
+    """Read at use so tests can point it elsewhere with override_settings."""
+    return getattr(
+        settings, "CHATBOT_BM25_INDEX_PATH", os.path.join(settings.BASE_DIR, "bm25.index")
+    )
+
+
+# Share of the query's terms a passage must contain to be used as an answer.
+BM25_MIN_COVERAGE = getattr(settings, "CHATBOT_BM25_MIN_COVERAGE", 0.5)
+
+K1 = 1.2
+B = 0.75
+
+MAGIC = b"VMBM2501"
+HEADER = struct.Struct("<8sI")
+
+# Rewrite the postings without deleted passages once this share of them
+# is dead.
+COMPACT_RATIO = 0.2
+SAVE_DELAY = 2.0
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "be", "to", "of", "in", "on", "for",
+    "and", "or", "it", "my", "me", "i", "you", "your", "we", "our", "do",
+    "does", "can", "how", "what", "when", "where", "which", "who", "why",
+    "with", "at", "by", "from", "this", "that", "there", "any", "about",
+    "please", "tell", "show",
+}
+
+
+def tokenize(text):
+    tokens = []
+    for word in TOKEN_RE.findall((text or "").lower()):
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+
+def content_hash(*parts):
+    return hashlib.sha1("\x00".join(p or "" for p in parts).encode("utf-8")).hexdigest()
+
+
+class BM25Index:
+    """
+    Okapi BM25 over short passages: FAQ entries, Document chunks and
+    product descriptions.
+
+    Postings are two parallel arrays per term (passage ids as uint32,
+    term counts as uint16). Passages are grouped by source ("faq:<key>",
+    "document:<id>", "product:<id>") so a source can be replaced when it
+    changes; replaced passages are only marked deleted until enough of
+    them pile up to compact the arrays.
+    """
+
+    def __init__(self):
+        self.postings = {}
+        self.doc_len = array("I")
+        self.doc_meta = []
+        self.deleted = set()
+        self.sources = {}
+        self.hashes = {}
+        self.total_len = 0
+        self._lock = threading.RLock()
+
+    # ---------------- Updates ----------------
+
+    def _add_passage(self, text, meta):
+        doc_id = len(self.doc_meta)
+        counts = {}
+        for term in tokenize(text):
+            counts[term] = counts.get(term, 0) + 1
+
+        for term, tf in counts.items():
+            entry = self.postings.get(term)
+            if entry is None:
+                entry = self.postings[term] = (array("I"), array("H"))
+            entry[0].append(doc_id)
+            entry[1].append(min(tf, 0xFFFF))
+
+        length = sum(counts.values())
+        self.doc_len.append(length)
+        self.doc_meta.append(meta)
+        self.total_len += length
+        return doc_id
+
+    def _remove_source(self, source):
+        for doc_id in self.sources.pop(source, []):
+            self.deleted.add(doc_id)
+            self.total_len -= self.doc_len[doc_id]
+        self.hashes.pop(source, None)
+
+    def replace(self, source, passages, digest):
+        """
+        Replaces the passages of source with passages, a list of
+        (text, meta) pairs. Returns False when digest shows the source
+        has not changed.
+        """
+        with self._lock:
+            if self.hashes.get(source) == digest:
+                return False
+            self._remove_source(source)
+            if passages:
+                self.sources[source] = [self._add_passage(text, meta) for text, meta in passages]
+                self.hashes[source] = digest
+            if len(self.deleted) > COMPACT_RATIO * max(len(self.doc_meta), 1):
+                self.compact()
+            return True
+
+    def remove(self, source):
+        with self._lock:
+            if source not in self.sources:
+                return False
+            self._remove_source(source)
+            return True
+
+    def compact(self):
+        with self._lock:
+            remap = {}
+            doc_len = array("I")
+            doc_meta = []
+            for doc_id, meta in enumerate(self.doc_meta):
+                if doc_id in self.deleted:
+                    continue
+                remap[doc_id] = len(doc_meta)
+                doc_len.append(self.doc_len[doc_id])
+                doc_meta.append(meta)
+
+            postings = {}
+            for term, (docs, tfs) in self.postings.items():
+                new_docs, new_tfs = array("I"), array("H")
+                for doc_id, tf in zip(docs, tfs):
+                    if doc_id in remap:
+                        new_docs.append(remap[doc_id])
+                        new_tfs.append(tf)
+                if new_docs:
+                    postings[term] = (new_docs, new_tfs)
+
+            self.postings = postings
+            self.doc_len = doc_len
+            self.doc_meta = doc_meta
+            self.sources = {s: [remap[d] for d in ids] for s, ids in self.sources.items()}
+            self.deleted = set()
+
+    # ---------------- Search ----------------
+
+    def search(self, query, k=3):
+        """
+        The k best passages for query as dicts (the passage meta plus
+        score and coverage, the share of query terms it contains).
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+
+        with self._lock:
+            live = len(self.doc_meta) - len(self.deleted)
+            if not live:
+                return []
+            avgdl = self.total_len / live
+
+            scores = {}
+            matched = {}
+            for term in terms:
+                entry = self.postings.get(term)
+                if entry is None:
+                    continue
+                docs, tfs = entry
+                idf = math.log(1 + (live - len(docs) + 0.5) / (len(docs) + 0.5))
+                for doc_id, tf in zip(docs, tfs):
+                    if doc_id in self.deleted:
+                        continue
+                    norm = K1 * (1 - B + B * self.doc_len[doc_id] / avgdl)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+                    matched[doc_id] = matched.get(doc_id, 0) + 1
+
+            best = sorted(scores, key=scores.get, reverse=True)[:k]
+            return [
+                dict(
+                    self.doc_meta[doc_id],
+                    score=scores[doc_id],
+                    coverage=matched[doc_id] / len(terms),
+                )
+                for doc_id in best
+            ]
+
+    # ---------------- Disk ----------------
+
+    def save(self, path=None):
+        """
+        Writes the index as a header, a JSON block (terms, passage meta,
+        sources) and the raw arrays, then renames it into place.
+        """
+        path = path or index_path()
+        with self._lock:
+            if self.deleted:
+                self.compact()
+
+            terms = []
+            offset = 0
+            for term, (docs, _) in self.postings.items():
+                terms.append([term, offset, len(docs)])
+                offset += len(docs)
+
+            meta = json.dumps({
+                "terms": terms,
+                "doc_meta": self.doc_meta,
+                "sources": self.sources,
+                "hashes": self.hashes,
+            }).encode("utf-8")
+
+            tmp = f"{path}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(HEADER.pack(MAGIC, len(meta)))
+                f.write(meta)
+                self.doc_len.tofile(f)
+                for docs, _ in self.postings.values():
+                    docs.tofile(f)
+                for _, tfs in self.postings.values():
+                    tfs.tofile(f)
+            os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path=None):
+        path = path or index_path()
+        with open(path, "rb") as f:
+            raw = f.read()
+
+        magic, meta_len = HEADER.unpack_from(raw, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a chatbot BM25 index")
+        pos = HEADER.size
+        meta = json.loads(raw[pos:pos + meta_len])
+        pos += meta_len
+
+        index = cls()
+        index.doc_meta = meta["doc_meta"]
+        index.sources = meta["sources"]
+        index.hashes = meta["hashes"]
+
+        count = len(index.doc_meta)
+        index.doc_len.frombytes(raw[pos:pos + 4 * count])
+        pos += 4 * count
+        index.total_len = sum(index.doc_len)
+
+        total = sum(n for _, _, n in meta["terms"])
+        all_docs = array("I")
+        all_docs.frombytes(raw[pos:pos + 4 * total])
+        pos += 4 * total
+        all_tfs = array("H")
+        all_tfs.frombytes(raw[pos:pos + 2 * total])
+
+        for term, offset, n in meta["terms"]:
+            index.postings[term] = (all_docs[offset:offset + n], all_tfs[offset:offset + n])
+        return index
+
+
+# ---------------- Sources ----------------
+
+def faq_entries():
+    module = import_module(settings.PROJECT_CHAT_DATA)
+    return getattr(module, "FAQ", {})
+
+
+def index_faq(index):
+    changed = False
+    faq = faq_entries()
+    for key, answer in faq.items():
+        question = key.replace("_", " ")
+        changed |= index.replace(
+            f"faq:{key}",
+            [(f"{question} {answer}", {"kind": "faq", "ref": key, "title": question, "text": answer})],
+            content_hash(question, answer),
+        )
+    for source in [s for s in index.sources if s.startswith("faq:")]:
+        if source[len("faq:"):] not in faq:
+            changed |= index.remove(source)
+    return changed
+
+
+def index_document(index, document, chunks=None):
+    """
+    Indexes document's chunks; chunks are the texts chatbot.ingestion
+    already cut, chunk_text(document.content) when not given.
+    """
+    if chunks is None:
+        chunks = chunk_text(document.content)
+    passages = [
+        (f"{document.title} {text}", {
+            "kind": "document", "ref": document.id, "title": document.title, "text": text,
+        })
+        for text in chunks
+    ]
+    return index.replace(
+        f"document:{document.id}", passages, content_hash(document.title, document.content)
+    )
+
+
+def index_product(index, product):
+    description = (product.description or "").strip()
+    passages = []
+    if description:
+        passages.append((f"{product.title} {description}", {
+            "kind": "product", "ref": product.id, "title": product.title, "text": description,
+        }))
+    return index.replace(
+        f"product:{product.id}", passages, content_hash(product.title, description)
+    )
+
+
+def build_bm25_index():
+    from core.models import Product
+    from .models import Document
+
+    index = BM25Index()
+    index_faq(index)
+    for document in Document.objects.all():
+        index_document(index, document)
+    for product in Product.objects.only("id", "title", "description"):
+        index_product(index, product)
+    return index
+
+
+# ---------------- Process-wide index ----------------
+
+class LexicalStore:
+    """
+    Holds this process's index. It is loaded from disk, kept up to date
+    by model signals, saved shortly after changes, and reloaded when
+    another process rewrites the file. Building it from scratch is the
+    job of `manage.py build_bm25_index`; when a search finds no file, a
+    process builds one in memory for itself but never writes it.
+    """
+
+    def __init__(self, path=None):
+        self._path = path
+        self.index = None
+        self.mtime = None
+        self.checked_at = 0
+        self._timer = None
+        # Updates applied since the last save, replayed onto the file
+        # when another process saved in between.
+        self._pending = []
+        self._lock = threading.Lock()
+
+    @property
+    def path(self):
+        return self._path or index_path()
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _load(self, mtime):
+        """Loads the file into self.index; False when it cannot be read."""
+        try:
+            self.index = BM25Index.load(self.path)
+        except (OSError, ValueError):
+            logger.exception("Could not load BM25 index %s", self.path)
+            return False
+        self.mtime = mtime
+        if index_faq(self.index):
+            self._changed(index_faq)
+        return True
+
+    def get(self):
+        with self._lock:
+            now = time.monotonic()
+            if self.index is not None and now - self.checked_at < 1:
+                return self.index
+            self.checked_at = now
+
+            mtime = self._file_mtime()
+            if self.index is not None and (mtime is None or mtime == self.mtime or self._timer):
+                return self.index
+            if mtime is not None and self._load(mtime):
+                return self.index
+
+            logger.warning(
+                "No usable BM25 index at %s, building one in memory; run "
+                "manage.py build_bm25_index on deploy", self.path,
+            )
+            self.index = build_bm25_index()
+            self.mtime = None
+            return self.index
+
+    def _save(self):
+        mtime = self._file_mtime()
+        if self._pending and mtime is not None and mtime != self.mtime:
+            # Another process saved since this one loaded: apply this
+            # process's updates to its file instead of overwriting it.
+            try:
+                merged = BM25Index.load(self.path)
+            except (OSError, ValueError):
+                logger.exception("Could not load BM25 index %s, overwriting it", self.path)
+            else:
+                for apply in self._pending:
+                    apply(merged)
+                self.index = merged
+        try:
+            self.index.save(self.path)
+            self.mtime = self._file_mtime()
+            self._pending = []
+        except OSError:
+            logger.exception("Could not save BM25 index %s", self.path)
+
+    def _save_now(self):
+        with self._lock:
+            self._timer = None
+            if self.index is not None:
+                self._save()
+
+    def _changed(self, apply):
+        if self.mtime is None:
+            # Built in memory: there is no file of ours to keep current.
+            return
+        self._pending.append(apply)
+        if self._timer is None:
+            self._timer = threading.Timer(SAVE_DELAY, self._save_now)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def update(self, apply):
+        """
+        Runs apply(index) and saves the index soon if it changed anything.
+        Without an index file there is nothing to update: whatever builds
+        it reads the change from the database.
+        """
+        with self._lock:
+            if self.index is None:
+                mtime = self._file_mtime()
+                if mtime is None or not self._load(mtime):
+                    return
+            if apply(self.index):
+                self._changed(apply)
+
+
+store = LexicalStore()
+
+
+def search(query, k=3):
+    return store.get().search(query, k)
+
+
+def answer(query):
+    """
+    The best passage for query when it contains enough of the query's
+    terms, else None.
+    """
+    hits = search(query, 1)
+    if hits and hits[0]["coverage"] >= BM25_MIN_COVERAGE:
+        return hits[0]
+    return None
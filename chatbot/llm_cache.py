@@ -0,0 +1,134 @@
+import hashlib
+import re
+import threading
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from .models import LLMResponse
+
+LLM_CACHE_TTL = getattr(settings, "CHATBOT_LLM_CACHE_TTL", 30 * 24 * 3600)
+LLM_CACHE_SIZE = getattr(settings, "CHATBOT_LLM_CACHE_SIZE", 10000)
+# The table may grow this many rows past LLM_CACHE_SIZE between evictions.
+EVICT_EVERY = getattr(settings, "CHATBOT_LLM_CACHE_EVICT_EVERY", 100)
+
+_inserted = 0
+_inserted_lock = threading.Lock()
+
+
+def normalize_prompt(prompt):
+    return re.sub(r"\s+", " ", (prompt or "").strip().lower())
+
+
+def cache_key(prompt, model=None, max_tokens=None):
+    model = model or settings.HF_MODEL
+    raw = f"{model}|{max_tokens}|{normalize_prompt(prompt)}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def lookup(key):
+    cutoff = timezone.now() - timedelta(seconds=LLM_CACHE_TTL)
+    row = LLMResponse.objects.filter(key=key, created_at__gte=cutoff).first()
+    if row:
+        LLMResponse.objects.filter(id=row.id).update(last_used_at=timezone.now())
+        return row.completion
+    return None
+
+
+def store(key, prompt, completion, model=None):
+    now = timezone.now()
+    _, created = LLMResponse.objects.update_or_create(
+        key=key,
+        defaults={
+            "model": model or settings.HF_MODEL,
+            "prompt": prompt,
+            "completion": completion,
+            "created_at": now,
+            "last_used_at": now,
+        },
+    )
+    if created:
+        _count_inserts(1)
+
+
+def evict():
+    """Deletes expired rows and the least recently used beyond LLM_CACHE_SIZE."""
+    expired = timezone.now() - timedelta(seconds=LLM_CACHE_TTL)
+    LLMResponse.objects.filter(created_at__lt=expired).delete()
+
+    cutoff = list(
+        LLMResponse.objects.order_by("-last_used_at")
+        .values_list("last_used_at", flat=True)[LLM_CACHE_SIZE:LLM_CACHE_SIZE + 1]
+    )
+    if cutoff:
+        LLMResponse.objects.filter(last_used_at__lte=cutoff[0]).delete()
+
+
+def _count_inserts(count):
+    """Runs evict() once every EVICT_EVERY inserted rows."""
+    global _inserted
+    with _inserted_lock:
+        _inserted += count
+        due = _inserted >= EVICT_EVERY
+        if due:
+            _inserted = 0
+    if due:
+        evict()
+
+
+def cached_generate(generate, prompt, max_tokens, model=None, refresh=False):
+    """
+    Returns the cached completion for prompt, or calls
+    generate(prompt, max_tokens) and caches its answer. Empty answers
+    (hf_generate's failure value) are never cached.
+    """
+    key = cache_key(prompt, model, max_tokens)
+
+    if not refresh:
+        completion = lookup(key)
+        if completion is not None:
+            return completion
+
+    completion = generate(prompt, max_tokens)
+    if completion and completion.strip():
+        store(key, prompt, completion, model)
+    return completion
+
+
+async def cached_generate_async(agenerate, prompt, max_tokens, model=None):
+    """Async version of cached_generate for a coroutine generate function."""
+    key = cache_key(prompt, model, max_tokens)
+
+    completion = await sync_to_async(lookup)(key)
+    if completion is not None:
+        return completion
+
+    completion = await agenerate(prompt, max_tokens)
+    if completion and completion.strip():
+        await sync_to_async(store)(key, prompt, completion, model)
+    return completion
+
+
+def cached_stream(stream, prompt, max_tokens, model=None):
+    """
+    Yields the cached completion for prompt in one piece, or the pieces
+    of stream(prompt, max_tokens) as they arrive, caching the joined text
+    once the stream ends.
+    """
+    key = cache_key(prompt, model, max_tokens)
+
+    completion = lookup(key)
+    if completion is not None:
+        yield completion
+        return
+
+    parts = []
+    for piece in stream(prompt, max_tokens):
+        parts.append(piece)
+        yield piece
+
+    completion = "".join(parts)
+    if completion.strip():
+        store(key, prompt, completion, model)
@@ -0,0 +1,265 @@
+import json
+import random
+import time
+import tracemalloc
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from chatbot import api, replies, translation
+from chatbot.catalog import CatalogSnapshot
+from chatbot.models import Conversation
+from core import ratings
+from core.models import CartItem, Category, Order, OrderItem, Product, Review
+
+CATEGORY_NAMES = [
+    "Fruits", "Vegetables", "Dairy", "Meat", "Snacks", "Bakery",
+    "Beverages", "Grains", "Oils", "Spices",
+]
+
+PRODUCT_WORDS = [
+    "apple", "banana", "mango", "orange", "grapes", "carrot", "beans",
+    "spinach", "onion", "tomato", "milk", "paneer", "curd", "butter",
+    "chicken", "mutton", "fish", "chips", "biscuit", "bread", "cake",
+    "juice", "tea", "coffee", "rice", "wheat", "ragi", "oil", "ghee",
+    "turmeric", "chilli", "pepper",
+]
+
+QUALIFIERS = ["fresh", "organic", "country", "premium", "farm", "green", "red", "baby"]
+
+INTENT_QUERIES = {
+    "greeting": ["hi", "hello", "good morning", "good evening", "hey there"],
+    "cart": ["my cart", "show cart", "what in my cart", "items in cart"],
+    "diet": [
+        "diet for gym", "breakfast ideas", "weight loss food", "kids night food",
+        "protein for muscle", "healthy dinner",
+    ],
+}
+
+INTENTS = ["greeting", "cart", "offer", "product", "category", "diet", "order"]
+
+
+class StubTranslator:
+    """Stands in for deep_translator.GoogleTranslator: tags text, no network."""
+
+    def __init__(self, source="auto", target="en"):
+        self.target = target
+
+    def translate(self, text):
+        return text if self.target == "en" else f"[{self.target}] {text}"
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    rank = max(0, min(len(values) - 1, round(pct / 100 * len(values) + 0.5) - 1))
+    return values[rank]
+
+
+def typo(word, rng):
+    if len(word) < 4:
+        return word
+    i = rng.randrange(1, len(word) - 1)
+    return word[:i] + word[i + 1:]
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a synthetic catalog, replays chat queries for every intent "
+        "through handle_chat with Hugging Face and Google Translate stubbed "
+        "out, and reports latency, DB queries and allocations per intent. "
+        "Everything it writes is rolled back unless --keep is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=2000)
+        parser.add_argument("--rounds", type=int, default=20,
+                            help="Times each query of the corpus is replayed.")
+        parser.add_argument("--lang", default="en",
+                            help="Translate queries and replies as chat_api does for this language.")
+        parser.add_argument("--hf-latency", type=float, default=0.0,
+                            help="Milliseconds the hf_generate stand-in sleeps per call.")
+        parser.add_argument("--corpus",
+                            help="JSON lines of {\"intent\": ..., \"query\": ...} to replay instead.")
+        parser.add_argument("--output", help="Also write the report as JSON to this path.")
+        parser.add_argument("--seed", type=int, default=7)
+        parser.add_argument("--keep", action="store_true",
+                            help="Commit the synthetic catalog instead of rolling it back.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+
+        with transaction.atomic():
+            user, order_ids = self.seed(options["products"], rng)
+            project_data = CatalogSnapshot().build()
+            corpus = self.load_corpus(options["corpus"]) or self.make_corpus(project_data, order_ids, rng)
+
+            with self.stubs(options["hf_latency"] / 1000):
+                report = self.replay(corpus, user, project_data, options)
+
+            if not options["keep"]:
+                transaction.set_rollback(True)
+
+        self.print_report(report, options)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+
+    # ---------------- Setup ----------------
+
+    def seed(self, count, rng):
+        User = get_user_model()
+        user = User.objects.create_user(email=f"bench-{rng.random()}@example.com", password=None)
+
+        categories = [
+            Category.objects.get_or_create(name=name, defaults={"image": "categories/bench.jpg"})[0]
+            for name in CATEGORY_NAMES
+        ]
+
+        products = []
+        for i in range(count):
+            word = rng.choice(PRODUCT_WORDS)
+            title = word if i < len(PRODUCT_WORDS) else f"{rng.choice(QUALIFIERS)} {word} {i}"
+            products.append(Product(
+                category=rng.choice(categories),
+                title=title.title(),
+                base_price=Decimal(rng.randrange(10, 500)),
+                image="products/bench.jpg",
+                stock=rng.choice([0, 3, 10, 50]),
+                status="approved",
+                is_offer=rng.random() < 0.2,
+                discount_percent=rng.choice([5, 10, 20, 30]),
+            ))
+        products = Product.objects.bulk_create(products)
+
+        Review.objects.bulk_create(
+            Review(product=p, customer=user, rating=rng.randint(1, 5), comment="ok")
+            for p in rng.sample(products, min(len(products), 200))
+        )
+        ratings.recount(Product.objects.filter(pk__in=[p.pk for p in products]))
+        CartItem.objects.bulk_create(
+            CartItem(user=user, product=p, quantity=rng.randint(1, 3))
+            for p in rng.sample(products, min(len(products), 5))
+        )
+
+        order_ids = []
+        for _ in range(3):
+            order = Order.objects.create(
+                user=user, full_name="Bench User", phone="9000000000",
+                street_address="1 Main Road", city="Ooty",
+                delivery_slot="morning", payment_method="cod",
+            )
+            OrderItem.objects.create(order=order, product=rng.choice(products), price=Decimal("10"))
+            order_ids.append(order.id)
+
+        return user, order_ids
+
+    def load_corpus(self, path):
+        if not path:
+            return None
+        with open(path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def make_corpus(self, project_data, order_ids, rng):
+        products = project_data["products"]
+        categories = [c["name"] for c in project_data["categories"]]
+        titles = [p["title"] for p in rng.sample(products, min(len(products), 8))]
+
+        corpus = [
+            {"intent": intent, "query": q}
+            for intent, queries in INTENT_QUERIES.items()
+            for q in queries
+        ]
+        corpus += [{"intent": "product", "query": t.lower()} for t in titles[:4]]
+        corpus += [{"intent": "product", "query": typo(t.lower(), rng)} for t in titles[4:]]
+        corpus += [{"intent": "category", "query": c.lower()} for c in categories[:6]]
+        corpus += [{"intent": "offer", "query": q} for q in [
+            "offers", "any discount today", f"offers on {categories[0].lower()}",
+            f"sale on {titles[0].lower()}",
+        ]]
+        corpus += [{"intent": "order", "query": q} for q in [
+            f"order {order_ids[0]}", f"track order {order_ids[-1]}", "where is my order",
+        ]]
+        return corpus
+
+    @contextmanager
+    def stubs(self, hf_latency):
+        def hf_generate(prompt, max_tokens=60):
+            if hf_latency:
+                time.sleep(hf_latency)
+            return "Rich in fibre and vitamins."
+
+        saved = api.hf_generate, translation.GoogleTranslator
+        api.hf_generate, translation.GoogleTranslator = hf_generate, StubTranslator
+        try:
+            yield
+        finally:
+            api.hf_generate, translation.GoogleTranslator = saved
+
+    # ---------------- Replay ----------------
+
+    def turn(self, user, conversation, project_data, query, lang):
+        query = translation.translate(query, "en", source=lang)
+        result = api.handle_chat(user, query, conversation, project_data)
+        return replies.localize(result, lang)
+
+    def replay(self, corpus, user, project_data, options):
+        conversation = Conversation.objects.create(user=user, title="bench")
+        lang = options["lang"]
+
+        timings = {}
+        queries = {}
+        for _ in range(options["rounds"]):
+            for item in corpus:
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    self.turn(user, conversation, project_data, item["query"], lang)
+                    elapsed = time.perf_counter() - start
+                timings.setdefault(item["intent"], []).append(elapsed * 1000)
+                queries.setdefault(item["intent"], []).append(len(captured))
+
+        # Allocations are traced in a separate pass; tracemalloc slows
+        # everything down and would skew the timings above.
+        allocations = {}
+        tracemalloc.start()
+        try:
+            for item in corpus:
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                self.turn(user, conversation, project_data, item["query"], lang)
+                peak = tracemalloc.get_traced_memory()[1] - before
+                allocations.setdefault(item["intent"], []).append(peak / 1024)
+        finally:
+            tracemalloc.stop()
+
+        order = [i for i in INTENTS if i in timings] + sorted(set(timings) - set(INTENTS))
+        return {
+            intent: {
+                "turns": len(timings[intent]),
+                "p50_ms": round(percentile(timings[intent], 50), 3),
+                "p95_ms": round(percentile(timings[intent], 95), 3),
+                "p99_ms": round(percentile(timings[intent], 99), 3),
+                "queries": round(sum(queries[intent]) / len(queries[intent]), 1),
+                "peak_kib": round(percentile(allocations[intent], 50), 1),
+            }
+            for intent in order
+        }
+
+    def print_report(self, report, options):
+        self.stdout.write(
+            f"{options['products']} products, {options['rounds']} rounds, lang={options['lang']}"
+        )
+        self.stdout.write(
+            f"{'intent':<10} {'turns':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+            f"{'queries':>8} {'peak KiB':>9}"
+        )
+        for intent, row in report.items():
+            self.stdout.write(
+                f"{intent:<10} {row['turns']:>6} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} "
+                f"{row['p99_ms']:>9.2f} {row['queries']:>8} {row['peak_kib']:>9.1f}"
+            )
@@ -0,0 +1,85 @@
+import random
+import string
+import time
+
+from django.core.management.base import BaseCommand
+
+from chatbot.fuzzy import FuzzyIndex, levenshtein
+
+CONSONANTS = "bcdghklmnprstvy"
+VOWELS = "aeiou"
+
+
+def make_vocabulary(rng, size=3000):
+    return [
+        "".join(rng.choice(CONSONANTS) + rng.choice(VOWELS) for _ in range(rng.randint(2, 4)))
+        for _ in range(size)
+    ]
+
+
+def make_title(rng, vocabulary):
+    """A catalog-like title: a brand-ish word, a product word, maybe a size."""
+    words = rng.sample(vocabulary, rng.randint(1, 3))
+    if rng.random() < 0.3:
+        words.append(f"{rng.choice([100, 250, 500, 1])}{rng.choice(['g', 'kg', 'ml'])}")
+    return " ".join(words)
+
+
+def typo(word, rng):
+    i = rng.randrange(len(word))
+    op = rng.choice("sdi")
+    if op == "s":
+        return word[:i] + rng.choice(string.ascii_lowercase) + word[i + 1:]
+    if op == "d":
+        return word[:i] + word[i + 1:]
+    return word[:i] + rng.choice(string.ascii_lowercase) + word[i:]
+
+
+class Command(BaseCommand):
+    help = "Benchmarks typo-tolerant title lookup: full Levenshtein scan vs FuzzyIndex."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=20000)
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--scan-queries", type=int, default=20,
+                            help="Queries also answered by the full scan, to check results.")
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        vocabulary = make_vocabulary(rng)
+        products = [
+            {"id": i, "title": title, "title_lower": title, "search_terms": []}
+            for i, title in enumerate(make_title(rng, vocabulary) for _ in range(options["products"]))
+        ]
+
+        start = time.perf_counter()
+        index = FuzzyIndex(products)
+        self.stdout.write(
+            f"built index over {len(index.keys)} keys in {time.perf_counter() - start:.2f}s"
+        )
+
+        queries = [
+            typo(rng.choice(products)["title"].replace(" ", ""), rng)
+            for _ in range(options["queries"])
+        ]
+        distance = index.max_distance
+
+        start = time.perf_counter()
+        results = [index.lookup(q) for q in queries]
+        indexed = (time.perf_counter() - start) / len(queries)
+
+        checked = queries[:options["scan_queries"]]
+        mismatches = 0
+        start = time.perf_counter()
+        for q, found in zip(checked, results):
+            scan = sorted(
+                (d, key) for key in index.keys
+                if (d := levenshtein(q, key, distance)) <= distance
+            )
+            mismatches += scan != found
+        scanned = (time.perf_counter() - start) / max(len(checked), 1)
+
+        self.stdout.write(f"full scan:   {scanned * 1e3:8.3f} ms/query")
+        self.stdout.write(f"FuzzyIndex:  {indexed * 1e3:8.3f} ms/query")
+        self.stdout.write(f"mismatches:  {mismatches}/{len(checked)}")
@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from chatbot import api
+from chatbot.intents import ROUTER
+
+SAMPLE_QUERIES = [
+    "hi", "good morning", "show my cart", "what in my wishlist",
+    "any offers on apples", "track order 42", "payment status of my order",
+    "is milk available", "health benefits of carrot", "diet for gym",
+    "healthy food for kids at night", "apple", "fresh organic spinach 500g",
+    "where is my order", "weight loss breakfast ideas",
+]
+
+
+def keyword_chain(raw):
+    """The per-intent checks handle_chat ran before the router."""
+    return (
+        api.detect_greeting(raw),
+        api.is_cart_query(raw),
+        api.is_wishlist_query(raw),
+        api.is_offer_query(raw),
+        api.is_product_health_benefit_query(raw),
+        api.is_availability_query(raw),
+        api.detect_diet_type(raw),
+        api.is_general_health_query(raw),
+        api.is_tracking_query(raw),
+        api.is_payment_query(raw),
+        "order" in raw,
+    )
+
+
+class Command(BaseCommand):
+    help = "Measures the per-query cost of intent detection: keyword chain vs compiled router."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rounds", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        queries = [api.normalize(q) for q in SAMPLE_QUERIES]
+        runs = options["rounds"] * len(queries)
+
+        for label, fn in (("keyword chain", keyword_chain), ("router", ROUTER.route)):
+            start = time.perf_counter()
+            for _ in range(options["rounds"]):
+                for q in queries:
+                    fn(q)
+            per_query = (time.perf_counter() - start) / runs * 1e6
+            self.stdout.write(f"{label:>14}: {per_query:.2f} µs/query")
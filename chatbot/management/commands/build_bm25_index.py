@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from chatbot.lexical import build_bm25_index, index_path
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the chatbot BM25 index over FAQ entries, Documents and product descriptions."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--path",
+            help="Where to write the index (defaults to CHATBOT_BM25_INDEX_PATH).",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"] or index_path()
+        index = build_bm25_index()
+        index.save(path)
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {len(index.doc_meta)} passages from {len(index.sources)} sources "
+            f"into {path}."
+        ))
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from chatbot.ingestion import ingest
+from chatbot.models import Document
+from chatbot.retrieval import build_index
+
+
+class Command(BaseCommand):
+    help = "Embeds knowledge-base Documents and product descriptions into the chatbot vector index."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--path",
+            default=settings.FAISS_INDEX_PATH,
+            help="Where to write the index (defaults to FAISS_INDEX_PATH).",
+        )
+
+    def handle(self, *args, **options):
+        # Chunks of documents that were never ingested (or changed behind
+        # the signals' back) are brought up to date first.
+        ingest(Document.objects.only("id", "title", "content", "indexed_hash").iterator(chunk_size=2000))
+        count = build_index(options["path"])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} chunks into {options['path']}."))
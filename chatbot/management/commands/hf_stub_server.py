@@ -0,0 +1,81 @@
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers /v1/chat/completions like the HF router, with canned text."""
+
+    delay = 0.0
+    fail_rate = 0.0
+    reply = "Rich in fibre and vitamins."
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            payload = {}
+
+        if self.delay:
+            time.sleep(self.delay)
+
+        if random.random() < self.fail_rate:
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        if payload.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            for word in self.reply.split(" "):
+                chunk = {"choices": [{"delta": {"content": word + " "}}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.write(b"data: [DONE]\n\n")
+            return
+
+        body = json.dumps({
+            "model": payload.get("model"),
+            "choices": [{"message": {"role": "assistant", "content": self.reply}}],
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs a local stand-in for the Hugging Face chat completions API. "
+        "Point HF_API_URL at http://<addr>:<port>/v1/chat/completions to use it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--addr", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--delay", type=float, default=0.0, help="Seconds to wait before answering.")
+        parser.add_argument("--fail-rate", type=float, default=0.0, help="Share of calls answered with 503.")
+
+    def handle(self, *args, **options):
+        handler = type("Handler", (StubHandler,), {
+            "delay": options["delay"],
+            "fail_rate": options["fail_rate"],
+        })
+        server = ThreadingHTTPServer((options["addr"], options["port"]), handler)
+        self.stdout.write(
+            f"HF stub listening on http://{options['addr']}:{options['port']}/v1/chat/completions"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
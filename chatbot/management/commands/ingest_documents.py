@@ -0,0 +1,90 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from chatbot.ingestion import INGEST_WORKERS, ingest
+from chatbot.models import Document
+from chatbot.retrieval import build_index
+
+TEXT_EXTENSIONS = (".txt", ".md")
+
+
+class Command(BaseCommand):
+    help = (
+        "Chunks knowledge-base Documents and embeds the chunks that changed "
+        "since the last run, then updates the BM25 and vector indexes. Text "
+        "files given as arguments are uploaded as Documents first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="*",
+                            help="Text or Markdown files, or directories of them, to upload.")
+        parser.add_argument("--workers", type=int, default=INGEST_WORKERS,
+                            help="Processes to chunk and embed with (1 runs in-process).")
+        parser.add_argument("--force", action="store_true",
+                            help="Re-chunk every document, even unchanged ones.")
+        parser.add_argument("--skip-vector-index", action="store_true",
+                            help="Do not rewrite the vector index afterwards.")
+
+    def handle(self, *args, **options):
+        if options["paths"]:
+            self.upload(self.text_files(options["paths"]))
+
+        stats = ingest(
+            Document.objects.only("id", "title", "content", "indexed_hash").iterator(chunk_size=2000),
+            workers=options["workers"],
+            force=options["force"],
+        )
+        self.stdout.write(
+            f"{stats['documents']} documents, {stats['documents_changed']} changed: "
+            f"{stats['chunks_created']} chunks created, {stats['chunks_updated']} updated, "
+            f"{stats['chunks_deleted']} deleted, {stats['chunks_unchanged']} unchanged; "
+            f"{stats['embeddings_computed']} embeddings computed, "
+            f"{stats['embeddings_reused']} reused."
+        )
+
+        if stats["documents_changed"] and not options["skip_vector_index"]:
+            count = build_index()
+            self.stdout.write(f"Vector index: {count} chunks in {settings.FAISS_INDEX_PATH}.")
+        self.stdout.write(self.style.SUCCESS("Ingestion finished."))
+
+    def text_files(self, paths):
+        files = []
+        for path in paths:
+            if os.path.isdir(path):
+                for root, _, names in os.walk(path):
+                    files += sorted(
+                        os.path.join(root, n) for n in names if n.lower().endswith(TEXT_EXTENSIONS)
+                    )
+            elif os.path.isfile(path):
+                files.append(path)
+            else:
+                raise CommandError(f"{path} does not exist")
+        return files
+
+    def upload(self, files):
+        """
+        Creates or updates one Document per file, keyed by its path in
+        Document.source. Saved in bulk, so the per-document signal does not
+        fire; the ingest pass that follows picks the changes up.
+        """
+        existing = {
+            d.source: d
+            for d in Document.objects.filter(source__in=files).only("id", "source", "title", "content")
+        }
+        created, updated = [], []
+        for path in files:
+            with open(path, encoding="utf-8") as f:
+                content = f.read()
+            title = os.path.splitext(os.path.basename(path))[0].replace("_", " ").strip()[:255]
+            document = existing.get(path)
+            if document is None:
+                created.append(Document(title=title, content=content, source=path))
+            elif document.content != content or document.title != title:
+                document.title, document.content = title, content
+                updated.append(document)
+
+        Document.objects.bulk_create(created, batch_size=500)
+        Document.objects.bulk_update(updated, ["title", "content"], batch_size=500)
+        self.stdout.write(f"Uploaded {len(created)} new and {len(updated)} changed documents.")
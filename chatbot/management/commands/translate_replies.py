@@ -0,0 +1,72 @@
+import json
+import re
+
+from django.core.management.base import BaseCommand
+
+from chatbot.replies import REPLIES, REPLY_CATALOG_PATH, REPLY_LANGUAGES, load_catalog, placeholders
+from chatbot.translation import translate_many
+
+PLACEHOLDER_RE = re.compile(r"\{(\w+)\}")
+
+
+class Command(BaseCommand):
+    help = (
+        "Machine-translates the canned chatbot replies that are missing from "
+        "the reply catalog, for every language in CHATBOT_REPLY_LANGUAGES. "
+        "Existing (possibly hand-edited) entries are kept unless --force."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", default=REPLY_CATALOG_PATH)
+        parser.add_argument("--lang", action="append",
+                            help="Only this language (repeatable).")
+        parser.add_argument("--force", action="store_true",
+                            help="Retranslate entries that are already in the catalog.")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        try:
+            with open(path, encoding="utf-8") as f:
+                catalog = json.load(f)
+        except FileNotFoundError:
+            catalog = {}
+
+        for lang in options["lang"] or REPLY_LANGUAGES:
+            entries = catalog.setdefault(lang, {})
+            keys = [k for k in REPLIES if options["force"] or k not in entries]
+            if not keys:
+                continue
+
+            # Placeholders are swapped for numbered tokens the translator
+            # leaves alone, and swapped back afterwards.
+            names = {k: PLACEHOLDER_RE.findall(REPLIES[k]) for k in keys}
+            protected = [self.protect(REPLIES[k], names[k]) for k in keys]
+            translated = translate_many(protected, lang, source="en")
+
+            done = 0
+            for key, source, text in zip(keys, protected, translated):
+                text = self.restore(text, names[key])
+                if text == REPLIES[key] or source == text or placeholders(text) != placeholders(REPLIES[key]):
+                    self.stderr.write(f"{lang}: could not translate {key}")
+                    continue
+                entries[key] = text
+                done += 1
+            self.stdout.write(f"{lang}: {done} of {len(keys)} replies translated.")
+
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(catalog, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        load_catalog(path)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {path}."))
+
+    @staticmethod
+    def protect(template, names):
+        for i, name in enumerate(names):
+            template = template.replace(f"{{{name}}}", f"[{i}]", 1)
+        return template
+
+    @staticmethod
+    def restore(text, names):
+        for i, name in enumerate(names):
+            text = re.sub(rf"\[\s*{i}\s*\]", f"{{{name}}}", text, count=1)
+        return text
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from core.models import Product
+from chatbot.api import product_benefit
+
+
+class Command(BaseCommand):
+    help = "Pre-generates the chatbot's product benefit answers into the LLM response cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--refresh",
+            action="store_true",
+            help="Call the model again even for products that are already cached.",
+        )
+
+    def handle(self, *args, **options):
+        titles = Product.objects.values_list("title", flat=True).distinct()
+        warmed = failed = 0
+
+        for title in titles:
+            if product_benefit(title, refresh=options["refresh"]):
+                warmed += 1
+            else:
+                failed += 1
+                self.stderr.write(f"No answer for {title}")
+
+        self.stdout.write(self.style.SUCCESS(f"Warmed {warmed} products ({failed} failed)."))
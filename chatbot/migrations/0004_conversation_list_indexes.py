@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-17 07:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0003_llmresponse'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['user', '-pinned', '-created_at', '-id'], name='chatbot_conv_user_list_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'created_at'], name='chatbot_msg_conv_created_idx'),
+        ),
+    ]
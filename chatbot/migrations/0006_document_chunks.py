@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-17 07:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0005_message_cursor_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='indexed_hash',
+            field=models.CharField(blank=True, default='', max_length=40),
+        ),
+        migrations.CreateModel(
+            name='DocumentChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField()),
+                ('text', models.TextField()),
+                ('content_hash', models.CharField(db_index=True, max_length=40)),
+                ('embedder', models.CharField(blank=True, default='', max_length=255)),
+                ('embedding', models.BinaryField(blank=True, null=True)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='chatbot.document')),
+            ],
+            options={
+                'ordering': ['document', 'position'],
+                'unique_together': {('document', 'position')},
+            },
+        ),
+    ]
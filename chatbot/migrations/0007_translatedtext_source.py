@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-17 08:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0006_document_chunks'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='translatedtext',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='translatedtext',
+            name='source',
+            field=models.CharField(default='auto', max_length=10),
+        ),
+        migrations.AlterUniqueTogether(
+            name='translatedtext',
+            unique_together={('text_hash', 'source', 'target')},
+        ),
+    ]
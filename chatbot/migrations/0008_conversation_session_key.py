@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-17 09:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0007_translatedtext_source'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='session_key',
+            field=models.CharField(blank=True, default='', max_length=40),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['session_key', '-pinned', '-created_at', '-id'], name='chatbot_conv_session_list_idx'),
+        ),
+    ]
@@ -8,17 +8,43 @@ class Document(models.Model):
     content = models.TextField()
     source = models.CharField(max_length=255, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Hash of title and content as of the last ingestion (chatbot.ingestion).
+    indexed_hash = models.CharField(max_length=40, blank=True, default="")
 
     def __str__(self):
         return self.title
 
 
+class DocumentChunk(models.Model):
+    """An overlapping slice of a Document, with its embedding once computed."""
+    document = models.ForeignKey(Document, related_name="chunks", on_delete=models.CASCADE)
+    position = models.PositiveIntegerField()
+    text = models.TextField()
+    content_hash = models.CharField(max_length=40, db_index=True)
+    embedder = models.CharField(max_length=255, blank=True, default="")
+    embedding = models.BinaryField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["document", "position"]
+        unique_together = ("document", "position")
+
+
 class Conversation(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+    # Session of the visitor who started it, for conversations without a user.
+    session_key = models.CharField(max_length=40, blank=True, default="")
     title = models.CharField(max_length=255, default="New Chat")
     pinned = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "-pinned", "-created_at", "-id"], name="chatbot_conv_user_list_idx"),
+            models.Index(
+                fields=["session_key", "-pinned", "-created_at", "-id"], name="chatbot_conv_session_list_idx"
+            ),
+        ]
+
     def __str__(self):
         return self.title
 
@@ -31,3 +57,32 @@ class Message(models.Model):
 
     class Meta:
         ordering = ["created_at"]
+        indexes = [
+            models.Index(fields=["conversation", "created_at"], name="chatbot_msg_conv_created_idx"),
+            models.Index(fields=["conversation", "id"], name="chatbot_msg_conv_id_idx"),
+        ]
+
+
+class TranslatedText(models.Model):
+    """Cached GoogleTranslator output, keyed by text hash and source and target language."""
+    text_hash = models.CharField(max_length=40)
+    source = models.CharField(max_length=10, default="auto")
+    target = models.CharField(max_length=10)
+    translated = models.TextField()
+    last_used_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        unique_together = ("text_hash", "source", "target")
+
+
+class LLMResponse(models.Model):
+    """Cached hf_generate completion, keyed by model and normalized prompt."""
+    key = models.CharField(max_length=40, unique=True)
+    model = models.CharField(max_length=255)
+    prompt = models.TextField()
+    completion = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return self.prompt[:50]
@@ -0,0 +1,93 @@
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+DEFAULT_PAGE_SIZE = 30
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """The list encode_cursor() was given, or None for a missing or bad cursor."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+def page_size(request, default=DEFAULT_PAGE_SIZE):
+    try:
+        size = int(request.GET.get("limit", default))
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def id_param(request, name):
+    """The positive integer in GET[name], None when absent; ValueError otherwise."""
+    value = request.GET.get(name)
+    if value in (None, ""):
+        return None
+    value = int(value)
+    if value < 0:
+        raise ValueError(f"{name} must be positive")
+    return value
+
+
+# ---------------- Conversations ----------------
+# Listed by (pinned, created_at, id), all descending.
+
+def conversation_cursor(conversation):
+    return encode_cursor([
+        conversation.pinned,
+        conversation.created_at.isoformat(),
+        conversation.id,
+    ])
+
+
+def conversations_after(queryset, cursor):
+    """Narrows queryset to the conversations listed after cursor."""
+    values = decode_cursor(cursor)
+    if not values or len(values) != 3:
+        return queryset
+
+    pinned, created_at, cid = values
+    created_at = parse_datetime(created_at or "")
+    if created_at is None or not isinstance(cid, int):
+        return queryset
+
+    pinned = bool(pinned)
+    return queryset.filter(
+        Q(pinned__lt=pinned)
+        | Q(pinned=pinned, created_at__lt=created_at)
+        | Q(pinned=pinned, created_at=created_at, id__lt=cid)
+    )
+
+
+# ---------------- Messages ----------------
+# Ids grow with created_at, so they double as the cursor.
+
+def message_page(queryset, since_id=None, before_id=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Returns (messages, has_more), oldest first: the first limit messages
+    after since_id, or the limit messages just before before_id (the
+    latest ones when neither is given).
+    """
+    if since_id is not None:
+        rows = list(queryset.filter(id__gt=since_id).order_by("id")[:limit + 1])
+        return rows[:limit], len(rows) > limit
+
+    if before_id is not None:
+        queryset = queryset.filter(id__lt=before_id)
+    rows = list(queryset.order_by("-id")[:limit + 1])
+    return rows[:limit][::-1], len(rows) > limit
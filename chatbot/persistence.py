@@ -0,0 +1,135 @@
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import Message
+
+logger = logging.getLogger(__name__)
+
+# Anonymous chat turns can be handed to a background writer that commits
+# the turns of many concurrent requests in one transaction (group
+# commit). Each request still waits for its own commit, so nothing is
+# acknowledged before it is durable, and the message ids are real.
+WRITE_BEHIND = getattr(settings, "CHATBOT_MESSAGE_WRITE_BEHIND", False)
+WRITE_BEHIND_INTERVAL = getattr(settings, "CHATBOT_MESSAGE_WRITE_BEHIND_INTERVAL", 0.02)
+WRITE_BEHIND_BATCH = getattr(settings, "CHATBOT_MESSAGE_WRITE_BEHIND_BATCH", 200)
+WRITE_BEHIND_TIMEOUT = 5
+
+
+def _insert(conversations, messages):
+    for conversation in conversations:
+        if conversation.pk is None:
+            conversation.save()
+
+    pending = [m for m in messages if m.pk is None]
+    if connection.features.can_return_rows_from_bulk_insert:
+        Message.objects.bulk_create(pending)
+    else:
+        for m in pending:
+            m.save()
+
+
+def save_turn(conversation, *messages):
+    """
+    Saves a chat turn in one transaction: the conversation if it is new,
+    then every message that has no id yet in a single INSERT. The
+    messages have their ids set when this returns.
+    """
+    with transaction.atomic():
+        _insert([conversation], messages)
+    return messages
+
+
+class WriteBehindBuffer:
+    """
+    Collects turns from many threads and writes them in batches from one
+    background thread, waking up every `interval` seconds or once
+    `batch_size` turns are waiting. submit() blocks until its batch is
+    committed and re-raises the error if the batch failed.
+    """
+
+    def __init__(self, interval=WRITE_BEHIND_INTERVAL, batch_size=WRITE_BEHIND_BATCH):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="chatbot-message-writer", daemon=True
+                )
+                self._thread.start()
+
+    def submit(self, conversation, *messages):
+        self._ensure_worker()
+        done = threading.Event()
+        entry = {"conversation": conversation, "messages": messages, "done": done, "error": None}
+        self.queue.put(entry)
+
+        if not done.wait(WRITE_BEHIND_TIMEOUT):
+            # Withdraw the turn so it is not written after the caller
+            # has been told it failed. If the writer already took it, it
+            # is in a batch about to commit, so wait for that instead.
+            with self.queue.mutex:
+                try:
+                    self.queue.queue.remove(entry)
+                except ValueError:
+                    pass
+                else:
+                    raise TimeoutError("Chat message writer did not commit in time")
+            done.wait()
+        if entry["error"] is not None:
+            raise entry["error"]
+        return messages
+
+    def _take_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            try:
+                with transaction.atomic():
+                    conversations = {id(e["conversation"]): e["conversation"] for e in batch}
+                    _insert(
+                        conversations.values(),
+                        [m for e in batch for m in e["messages"]],
+                    )
+            except Exception as exc:
+                logger.exception("Writing %s chat turns failed", len(batch))
+                for e in batch:
+                    e["error"] = exc
+                connection.close()
+            finally:
+                for e in batch:
+                    e["done"].set()
+
+
+buffer = WriteBehindBuffer()
+
+
+def persist_turn(conversation, *messages):
+    """
+    save_turn, or the write-behind buffer for anonymous conversations
+    when CHATBOT_MESSAGE_WRITE_BEHIND is on.
+    """
+    if WRITE_BEHIND and conversation.user_id is None:
+        return buffer.submit(conversation, *messages)
+    return save_turn(conversation, *messages)
@@ -0,0 +1,126 @@
+import heapq
+import threading
+from collections import Counter, defaultdict
+
+from .api import normalize
+
+
+def trigrams(text):
+    """
+    Character trigrams of text, padded so that short words and word
+    starts still produce a few grams: "apple" -> "  a", " ap", "app", ...
+    """
+    text = f"  {text} "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def product_keys(p):
+    """
+    Every spelling of a product the chatbot matchers compare against:
+    the normalized title, title_lower and the search_terms, with and
+    without spaces.
+    """
+    title_lower = p.get("title_lower") or (p.get("title") or "").lower()
+    keys = {normalize(p.get("title", "")), title_lower}
+
+    for term in p.get("search_terms", []) + [title_lower]:
+        if term:
+            keys.add(term.lower().strip().replace(" ", ""))
+
+    keys.discard("")
+    return keys
+
+
+class ProductIndex:
+    """
+    Trigram inverted index over product titles and search_terms.
+
+    It only narrows the candidate list; callers still run their own
+    SequenceMatcher scoring (and thresholds) on what it returns.
+    Postings hold (product id, key) pairs so update() can apply just the
+    products that were added, changed or removed.
+    """
+
+    def __init__(self, products=None):
+        self.postings = defaultdict(set)
+        self.keys = {}
+        self.products = []
+        self.order = {}
+        self.by_id = {}
+        self._lock = threading.Lock()
+
+        if products:
+            self.update(products)
+
+    def _remove(self, pid):
+        for key, grams in self.keys.pop(pid, {}).items():
+            for g in grams:
+                self.postings[g].discard((pid, key))
+
+    def update(self, products):
+        with self._lock:
+            seen = set()
+
+            for p in products:
+                pid = p["id"]
+                seen.add(pid)
+
+                keys = {key: frozenset(trigrams(key)) for key in product_keys(p)}
+                if self.keys.get(pid) == keys:
+                    continue
+
+                self._remove(pid)
+                for key, grams in keys.items():
+                    for g in grams:
+                        self.postings[g].add((pid, key))
+                self.keys[pid] = keys
+
+            for pid in set(self.keys) - seen:
+                self._remove(pid)
+
+            self.products = products
+            self.order = {p["id"]: i for i, p in enumerate(products)}
+            self.by_id = {p["id"]: p for p in products}
+
+    def _in_order(self, ids):
+        order = self.order
+        ids = sorted((pid for pid in ids if pid in order), key=order.get)
+        return [self.by_id[pid] for pid in ids]
+
+    def containing(self, text):
+        """
+        Products with a key that may contain text as a substring (the key
+        has every inner trigram of text). Returns None when text is too
+        short to filter on.
+        """
+        if len(text) < 3:
+            return None
+
+        grams = {text[i:i + 3] for i in range(len(text) - 2)}
+        with self._lock:
+            lists = sorted((self.postings.get(g, set()) for g in grams), key=len)
+            hits = set(lists[0]).intersection(*lists[1:])
+            return self._in_order({pid for pid, _ in hits})
+
+    def candidates(self, text, limit=50):
+        """
+        The limit products whose best key is most similar to text by
+        trigram Dice coefficient, in catalog order.
+        """
+        grams = trigrams(text)
+        counts = Counter()
+        with self._lock:
+            for g in grams:
+                counts.update(self.postings.get(g, ()))
+
+            scores = {}
+            for (pid, key), shared in counts.items():
+                score = 2 * shared / (len(grams) + len(self.keys[pid][key]))
+                if score > scores.get(pid, 0):
+                    scores[pid] = score
+
+            order = self.order
+            top = heapq.nsmallest(
+                limit, scores, key=lambda pid: (-scores[pid], order.get(pid, 0))
+            )
+            return self._in_order(top)
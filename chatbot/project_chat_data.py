@@ -1,5 +1,14 @@
+from django.db.models import Count
+
 from core.models import Product, Category, Order, DeliveryZone, Review
 
+# Also indexed for the chatbot's BM25 answers (chatbot.lexical).
+FAQ = {
+    "return_policy": "Returns allowed within 7 days.",
+    "refund_time": "Refund takes 3–5 business days.",
+    "delivery_info": "Delivery takes 1–5 hours based on your zone.",
+}
+
 
 def get_project_data(user=None):
     """
@@ -10,18 +19,16 @@ def get_project_data(user=None):
     categories = [
         {
             "name": c.name,
-            "count": c.product_count(),
+            "count": c.num_products,
             "url": c.get_absolute_url()
         }
-        for c in Category.objects.all()
+        for c in Category.objects.annotate(num_products=Count("products"))
     ]
 
     products = []
-    for p in Product.objects.all():
+    for p in Product.objects.select_related("category"):
         title = p.title.lower()
         category = p.category.name.lower()
-        
-        print("🔥 DEBUG: get_project_data() LOADED")
 
         products.append({
             "id": p.id,
@@ -32,7 +39,7 @@ def get_project_data(user=None):
             "offer_price": float(p.discounted_price),
             "is_offer": p.is_offer_active,
             "discount_percent": p.discount_percent,
-            "rating": float(p.avg_rating),
+            "rating": p.rating_avg,
             "stock": p.stock,
             "url": p.get_absolute_url(),
 
@@ -53,7 +60,7 @@ def get_project_data(user=None):
             "price": float(p.discounted_price),
             "url": p.get_absolute_url()
         }
-        for p in Product.objects.filter(is_offer=True)
+        for p in Product.objects.filter(is_offer=True).select_related("category")
     ]
 
 
@@ -72,7 +79,7 @@ def get_project_data(user=None):
             "rating": r.rating,
             "comment": r.comment
         }
-        for r in Review.objects.all()
+        for r in Review.objects.select_related("product")
     ]
 
 
@@ -98,9 +105,5 @@ def get_project_data(user=None):
         "orders": orders,
         "reviews": reviews,
 
-        "faq": {
-            "return_policy": "Returns allowed within 7 days.",
-            "refund_time": "Refund takes 3–5 business days.",
-            "delivery_info": "Delivery takes 1–5 hours based on your zone.",
-        }
+        "faq": FAQ,
     }
@@ -0,0 +1,144 @@
+import json
+import logging
+import os
+import string
+
+from django.conf import settings
+
+from . import translation
+
+logger = logging.getLogger(__name__)
+
+# Languages the chat widget offers (besides English, which the replies
+# are written in) and the file their pre-translated replies live in.
+REPLY_LANGUAGES = getattr(settings, "CHATBOT_REPLY_LANGUAGES", ["hi", "ta", "ml"])
+REPLY_CATALOG_PATH = getattr(
+    settings, "CHATBOT_REPLY_CATALOG_PATH",
+    os.path.join(os.path.dirname(__file__), "data", "replies.json"),
+)
+
+# Canned bot replies. Placeholders are filled in after the template has
+# been looked up in the reader's language, so product titles, prices and
+# order ids are never sent to the translator.
+REPLIES = {
+    "greeting_morning": "🌅 Good morning! Hope you have a fresh and healthy day 😊",
+    "greeting_afternoon": "☀️ Good afternoon! How can I help you today?",
+    "greeting_evening": "🌆 Good evening! Looking for something fresh today?",
+    "greeting_night": "🌙 Good night! Take care and eat healthy 🌿",
+    "greeting": "👋 Hello! How can I help you today?",
+    "meaningless": "🙂 Please type a product or category name, for example: apple, milk, vegetables.",
+    "cart_empty": "Your cart is empty 🛒",
+    "cart_login": "Please log in to view your cart 😊",
+    "wishlist_empty": "Your wishlist is empty ⭐",
+    "wishlist_login": "Please log in to view wishlist 😊",
+    "no_offers": "Currently there are no active offers 😔",
+    "in_stock": "✅ <b>{title}</b> is available in stock.<br>Price: ₹{price}",
+    "out_of_stock": "❌ <b>{title}</b> is currently out of stock.",
+    "order_login": "Please log in to view order details 🔐",
+    "order_not_found": "No order found with ID {order_id} ❌",
+    "no_orders": "You don’t have any orders yet 📦",
+    "fallback": (
+        "👋 I’m your shopping assistant! "
+        "Try asking: product price, today’s offers, my cart, or order status."
+    ),
+}
+
+
+def placeholders(template):
+    return {name for _, name, _, _ in string.Formatter().parse(template) if name}
+
+
+class Reply(str):
+    """A rendered canned reply that remembers its key and parameters."""
+
+    def __new__(cls, key, **params):
+        reply = super().__new__(cls, REPLIES[key].format(**params))
+        reply.key = key
+        reply.params = params
+        return reply
+
+
+# ---------------- Catalog ----------------
+
+_catalog = {}
+# English text of every reply without placeholders -> key, to recognize
+# them in stored conversation history.
+_static = {template: key for key, template in REPLIES.items() if not placeholders(template)}
+
+
+def load_catalog(path=None):
+    """
+    Loads the pre-translated replies, {lang: {key: template}}. Templates
+    that lost or gained a placeholder in translation are dropped, so
+    those replies fall back to the translator.
+    """
+    global _catalog
+    path = path or REPLY_CATALOG_PATH
+    try:
+        with open(path, encoding="utf-8") as f:
+            raw = json.load(f)
+    except (OSError, ValueError):
+        logger.warning("No canned reply catalog at %s, replies will be machine-translated", path)
+        raw = {}
+
+    catalog = {}
+    for lang, entries in raw.items():
+        catalog[lang] = {
+            key: template
+            for key, template in entries.items()
+            if key in REPLIES and placeholders(template) == placeholders(REPLIES[key])
+        }
+    _catalog = catalog
+    return catalog
+
+
+def render(key, lang, params=None):
+    """The reply in lang from the catalog, or None when it has no translation."""
+    if lang == "en":
+        return REPLIES[key].format(**(params or {}))
+    template = _catalog.get(lang, {}).get(key)
+    if template is None:
+        return None
+    return template.format(**(params or {}))
+
+
+def localize(result, lang):
+    """
+    handle_chat's response in lang: canned replies from the catalog,
+    anything else through translation.translate.
+    """
+    key = result.get("reply_key")
+    if key and lang != "en":
+        text = render(key, lang, result.get("reply_params"))
+        if text is not None:
+            return text
+    return translation.translate(result["response"], lang, source="en")
+
+
+async def alocalize(result, lang):
+    """localize for async views; see translation.atranslate."""
+    key = result.get("reply_key")
+    if key and lang != "en":
+        text = render(key, lang, result.get("reply_params"))
+        if text is not None:
+            return text
+    return await translation.atranslate(result["response"], lang, source="en")
+
+
+def localize_many(texts, lang):
+    """
+    translation.translate_many for stored bot messages, answering the
+    canned replies among them from the catalog.
+    """
+    texts = list(texts)
+    found = {}
+    for i, text in enumerate(texts):
+        key = _static.get(text)
+        localized = render(key, lang) if key else None
+        if localized is not None:
+            found[i] = localized
+
+    rest = [i for i in range(len(texts)) if i not in found]
+    for i, value in zip(rest, translation.translate_many([texts[i] for i in rest], lang, source="en")):
+        found[i] = value
+    return [found[i] for i in range(len(texts))]
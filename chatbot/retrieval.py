@@ -0,0 +1,379 @@
+import hashlib
+import heapq
+import json
+import logging
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+import uuid
+from array import array
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is optional
+    np = None
+
+HASHED_DIM = 384
+HASHED_EMBEDDER = f"hashed-{HASHED_DIM}"
+
+MAGIC = b"VMVEC002"
+# magic, dimensions, vector count, write id (also in the JSON sidecar)
+HEADER = struct.Struct("<8sII32s")
+
+CHUNK_WORDS = 120
+CHUNK_OVERLAP = 30
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+# Cosine similarity a chunk needs to be used as an answer.
+VECTOR_MIN_SCORE = getattr(settings, "CHATBOT_VECTOR_MIN_SCORE", 0.5)
+
+
+# ---------------- Embeddings ----------------
+
+def hashed_embedding(text, dim=HASHED_DIM):
+    """
+    Deterministic bag-of-words embedding: every word and word pair is
+    hashed to a signed bucket, then the vector is L2-normalized. Needs no
+    model download, so it is used offline and in tests.
+    """
+    words = TOKEN_RE.findall((text or "").lower())
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    vec = [0.0] * dim
+    for f in features:
+        h = int.from_bytes(hashlib.blake2b(f.encode("utf-8"), digest_size=8).digest(), "little")
+        vec[h % dim] += 1.0 if (h >> 63) & 1 else -1.0
+
+    norm = math.sqrt(sum(v * v for v in vec))
+    return [v / norm for v in vec] if norm else vec
+
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def _sentence_model():
+    """
+    The CPU sentence-transformers model named by settings.EMBEDDING_MODEL,
+    or None when the package or the model files are not available.
+    """
+    global _model
+    if getattr(settings, "CHATBOT_EMBEDDINGS", "auto") == "hashed":
+        return None
+
+    with _model_lock:
+        if _model is None:
+            try:
+                from sentence_transformers import SentenceTransformer
+                _model = SentenceTransformer(settings.EMBEDDING_MODEL, device="cpu")
+            except Exception:
+                logger.warning("Embedding model unavailable, using hashed embeddings")
+                _model = False
+        return _model or None
+
+
+def default_embedder():
+    return settings.EMBEDDING_MODEL if _sentence_model() else HASHED_EMBEDDER
+
+
+def embed(texts, embedder):
+    if embedder == HASHED_EMBEDDER:
+        return [hashed_embedding(t) for t in texts]
+
+    model = _sentence_model()
+    if model is None or embedder != settings.EMBEDDING_MODEL:
+        raise ValueError(f"Embedder {embedder} is not available")
+    return [list(map(float, v)) for v in model.encode(texts, normalize_embeddings=True)]
+
+
+# ---------------- Chunks ----------------
+
+def chunk_text(text, size=CHUNK_WORDS, overlap=CHUNK_OVERLAP):
+    words = (text or "").split()
+    if not words:
+        return []
+
+    step = max(1, size - overlap)
+    chunks = []
+    for start in range(0, len(words), step):
+        chunks.append(" ".join(words[start:start + size]))
+        if start + size >= len(words):
+            break
+    return chunks
+
+
+def collect_chunks():
+    """
+    Chunks of every knowledge-base Document, as stored by
+    chatbot.ingestion together with their embeddings, and of every
+    product description.
+    """
+    from core.models import Product
+    from .models import DocumentChunk
+
+    chunks = []
+    rows = DocumentChunk.objects.select_related("document").only(
+        "position", "text", "embedder", "embedding",
+        "document__id", "document__title", "document__source",
+    )
+    for c in rows.iterator(chunk_size=2000):
+        d = c.document
+        chunks.append({
+            "text": c.text,
+            "title": d.title,
+            "source": d.source or f"document:{d.id}",
+            "ref": f"document:{d.id}:{c.position}",
+            "embedder": c.embedder,
+            "vector": bytes(c.embedding) if c.embedding is not None else None,
+        })
+
+    for p in Product.objects.exclude(description__isnull=True).exclude(description=""):
+        for i, text in enumerate(chunk_text(p.description)):
+            chunks.append({
+                "text": f"{p.title}: {text}",
+                "title": p.title,
+                "source": f"product:{p.id}",
+                "ref": f"product:{p.id}:{i}",
+            })
+
+    return chunks
+
+
+# ---------------- On-disk index ----------------
+
+def meta_path(path):
+    return f"{path}.meta.json"
+
+
+def write_index(chunks, path=None, embedder=None):
+    """
+    Embeds chunks and writes them to path: a small header followed by
+    float32 vectors, plus a JSON sidecar with the chunk texts. A chunk
+    that carries a "vector" (float32 bytes) made by the same embedder is
+    written as is. Files are written next to the target and renamed into
+    place, so readers that have the old file mapped keep working. Both
+    files carry the same write id and count, so a reader that opens them
+    between the two renames can tell they do not belong together.
+    """
+    path = path or settings.FAISS_INDEX_PATH
+    embedder = embedder or default_embedder()
+
+    vectors = []
+    missing = []
+    for i, c in enumerate(chunks):
+        stored = c.pop("vector", None)
+        if stored is not None and c.pop("embedder", None) == embedder:
+            vectors.append(stored)
+        else:
+            c.pop("embedder", None)
+            vectors.append(None)
+            missing.append(i)
+
+    if missing:
+        for i, v in zip(missing, embed([chunks[i]["text"] for i in missing], embedder)):
+            vectors[i] = array("f", v).tobytes()
+    dim = len(vectors[0]) // 4 if vectors else HASHED_DIM
+    version = uuid.uuid4().hex
+
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, dim, len(vectors), version.encode("ascii")))
+        for v in vectors:
+            f.write(v)
+
+    with open(meta_path(tmp), "w", encoding="utf-8") as f:
+        json.dump({"embedder": embedder, "version": version, "chunks": chunks}, f)
+
+    os.replace(meta_path(tmp), meta_path(path))
+    os.replace(tmp, path)
+    return len(vectors)
+
+
+def matches(meta, magic, count, version):
+    """Whether a vector file header and a sidecar come from one write_index."""
+    return (
+        magic == MAGIC
+        and count == len(meta.get("chunks", ()))
+        and version.decode("ascii", "replace") == meta.get("version")
+    )
+
+
+def stored_vectors(path):
+    """
+    (embedder, {chunk text: float32 bytes}) from the index at path, or
+    (None, {}) when there is no readable index there.
+    """
+    try:
+        with open(meta_path(path), encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(path, "rb") as f:
+            raw = f.read()
+        magic, dim, count, version = HEADER.unpack_from(raw, 0)
+    except (OSError, ValueError, struct.error):
+        return None, {}
+
+    chunks = meta["chunks"]
+    size = 4 * dim
+    if not matches(meta, magic, count, version) or len(raw) < HEADER.size + size * count:
+        return None, {}
+
+    return meta["embedder"], {
+        c["text"]: raw[HEADER.size + i * size:HEADER.size + (i + 1) * size]
+        for i, c in enumerate(chunks)
+    }
+
+
+class VectorIndex:
+    """
+    Read side of the index. The vector file is memory-mapped and
+    reopened when it changes on disk; search is an exact dot-product
+    scan (numpy when installed, otherwise array/memoryview).
+    """
+
+    def __init__(self, path=None):
+        self.path = path or settings.FAISS_INDEX_PATH
+        self.mtime = None
+        self.embedder = None
+        self.chunks = []
+        self.dim = 0
+        self.count = 0
+        self.vectors = None
+        self._mm = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        """
+        Maps the index if it changed on disk. While the new files cannot
+        be read or do not belong together (a rebuild is between its two
+        renames), keeps serving the copy it has and tries again on the
+        next search. False when there is nothing to serve.
+        """
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return False
+
+        # Every write renames a new file into place, so the inode changes
+        # even when two rebuilds land within one mtime tick.
+        mtime = (st.st_ino, st.st_mtime_ns)
+        if mtime == self.mtime:
+            return True
+
+        try:
+            with open(meta_path(self.path), encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(self.path, "rb") as f:
+                magic, dim, count, version = HEADER.unpack(f.read(HEADER.size))
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if count else None
+        except (OSError, ValueError, struct.error):
+            logger.warning("Could not read vector index %s", self.path, exc_info=True)
+            return self.mtime is not None
+
+        if not matches(meta, magic, count, version):
+            if mm is not None:
+                mm.close()
+            if magic != MAGIC:
+                logger.warning("%s is not a chatbot vector index; run manage.py build_vector_index", self.path)
+            return self.mtime is not None
+
+        if mm is None:
+            vectors = None
+        elif np is not None:
+            vectors = np.frombuffer(mm, dtype=np.float32, count=dim * count, offset=HEADER.size)
+            vectors = vectors.reshape(count, dim)
+        else:
+            vectors = memoryview(mm)[HEADER.size:HEADER.size + 4 * dim * count].cast("f")
+
+        self._mm, self.vectors = mm, vectors
+        self.dim, self.count = dim, count
+        self.embedder = meta["embedder"]
+        self.chunks = meta["chunks"]
+        self.mtime = mtime
+        return True
+
+    def search(self, query, k=None):
+        k = k or settings.TOP_K
+        with self._lock:
+            if not self._load() or not self.count:
+                return []
+
+            try:
+                q = embed([query], self.embedder)[0]
+            except ValueError:
+                logger.warning("Cannot embed queries for index built with %s", self.embedder)
+                return []
+
+            if np is not None:
+                scores = self.vectors @ np.asarray(q, dtype=np.float32)
+                top = heapq.nlargest(k, range(self.count), key=scores.__getitem__)
+                scored = [(float(scores[i]), i) for i in top]
+            else:
+                dim, vectors = self.dim, self.vectors
+                scored = heapq.nlargest(k, (
+                    (sum(a * b for a, b in zip(vectors[i * dim:(i + 1) * dim], q)), i)
+                    for i in range(self.count)
+                ))
+
+            return [
+                dict(self.chunks[i], score=score)
+                for score, i in scored
+                if score > 0
+            ]
+
+
+_index = None
+
+
+def get_index():
+    global _index
+    if _index is None:
+        _index = VectorIndex()
+    return _index
+
+
+def retrieve(query, k=None):
+    return get_index().search(query, k)
+
+
+def answer(query):
+    """
+    The chunk closest to query, shaped like chatbot.lexical.answer()'s
+    passages, when it is similar enough; else None. Finds paraphrases
+    that share too few words with any passage for BM25.
+    """
+    hits = retrieve(query, 1)
+    if not hits or hits[0]["score"] < VECTOR_MIN_SCORE:
+        return None
+
+    hit = hits[0]
+    kind, ref, _ = hit["ref"].split(":")
+    text = hit["text"]
+    if kind == "product":
+        text = text.removeprefix(f"{hit['title']}: ")
+    return {"kind": kind, "ref": int(ref), "title": hit["title"], "text": text, "score": hit["score"]}
+
+
+def build_index(path=None):
+    """
+    Rewrites the index from collect_chunks(). Product descriptions have
+    no stored embeddings, so a chunk whose text is already in the current
+    index keeps its vector from there; only new or edited text is embedded.
+    """
+    path = path or settings.FAISS_INDEX_PATH
+    chunks = collect_chunks()
+
+    embedder, vectors = stored_vectors(path)
+    for c in chunks:
+        if c.get("vector") is None and c["text"] in vectors:
+            c["vector"], c["embedder"] = vectors[c["text"]], embedder
+
+    return write_index(chunks, path)
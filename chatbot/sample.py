@@ -1,21 +1,16 @@
-import requests
 import difflib
 import re
 from django.conf import settings
 from .models import Conversation, Message
 from .utils import format_prompt
+from .hf_client import chat_completion, HFUnavailable
+from .fuzzy import levenshtein
 from core.models import Order
 from difflib import SequenceMatcher
 import logging
 
 logger = logging.getLogger(__name__)
 
-HF_HEADERS = {
-    "Authorization": f"Bearer {settings.HF_API_KEY}",
-    "Accept": "application/json",
-    "Content-Type": "application/json",
-}
-
 def is_grocery_context(query):
     q = query.lower()
 
@@ -36,44 +31,35 @@ def hf_generate(prompt, max_tokens=200, system_prompt=None, timeout=20):
     """
     sys_msg = system_prompt or "Answer using the project data. If unsure, say you don’t know."
     try:
-        resp = requests.post(
-            "https://router.huggingface.co/v1/chat/completions",
-            headers=HF_HEADERS,
-            json={
-                "model": settings.HF_MODEL,
-                "messages": [
-                    {"role": "system", "content": sys_msg},
-                    {"role": "user", "content": prompt}
-                ],
-                "max_tokens": max_tokens,
-            },
+        return chat_completion(
+            [
+                {"role": "system", "content": sys_msg},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=max_tokens,
             timeout=timeout
         )
-        data = resp.json()
-        return data["choices"][0]["message"]["content"]
+    except HFUnavailable as e:
+        logger.warning("HF generate skipped: %s", e)
+        return "I'm having trouble fetching info right now."
     except Exception as e:
         logger.exception("HF generate error")
         return "I'm having trouble fetching info right now."
 
-def levenshtein_distance(a, b):
+def levenshtein_distance(a, b, max_distance=None):
     if a is None or b is None:
         return max(len(a or ""), len(b or ""))
-    a = a.lower()
-    b = b.lower()
-    if len(a) < len(b):
-        a, b = b, a
-    if len(b) == 0:
-        return len(a)
-    previous = list(range(len(b) + 1))
-    for i, ca in enumerate(a):
-        current = [i + 1]
-        for j, cb in enumerate(b):
-            insertions = previous[j + 1] + 1
-            deletions = current[j] + 1
-            substitutions = previous[j] + (0 if ca == cb else 1)
-            current.append(min(insertions, deletions, substitutions))
-        previous = current
-    return previous[-1]
+    return levenshtein(a.lower(), b.lower(), max_distance)
+
+def bounded_ratio(a, b, threshold):
+    """
+    SequenceMatcher ratio of a and b, or 0.0 when the cheap upper bounds
+    (length, then character counts) already show it is below threshold.
+    """
+    sm = SequenceMatcher(None, a, b)
+    if sm.real_quick_ratio() < threshold or sm.quick_ratio() < threshold:
+        return 0.0
+    return sm.ratio()
 
 def smart_match_products(query, project_data, threshold=0.58):
     """
@@ -95,8 +81,7 @@ def smart_match_products(query, project_data, threshold=0.58):
                 best = max(best, 1.0)
                 break
 
-            ratio = SequenceMatcher(None, q, t).ratio()
-            best = max(best, ratio)
+            best = max(best, bounded_ratio(q, t, threshold))
         if best >= threshold:
             scores.append((p, best))
     scores.sort(key=lambda x: x[1], reverse=True)
@@ -107,7 +92,10 @@ def advanced_product_match(query, products, top=5):
     scores = []
     for p in products:
         title = p.get("title_lower", "")
-        ratio = difflib.SequenceMatcher(None, q, title).ratio()
+        if q in title or title in q:
+            ratio = difflib.SequenceMatcher(None, q, title).ratio()
+        else:
+            ratio = bounded_ratio(q, title, 0.5)
         if q in title or title in q or ratio >= 0.5:
             scores.append((p, max(ratio, 0.5 if q in title else ratio)))
     scores.sort(key=lambda x: x[1], reverse=True)
@@ -201,7 +189,8 @@ def detect_category_from_query(query, project_data):
     DB-first category detection:
     1) match product titles/search_terms -> product.category
     2) match category names in project_data
-    3) fuzzy match product titles (levenshtein / sequence)
+    3) fuzzy match product titles (levenshtein / sequence), over the
+       snapshot's fuzzy_index candidates when project_data has one
     4) AI fallback
     """
     q = (query or "").lower().strip()
@@ -221,14 +210,27 @@ def detect_category_from_query(query, project_data):
         if cname and cname in q:
             return cname
 
+    # A product only wins with a score of at least 0.5, so the edit
+    # distance never has to be computed past the point where
+    # seq_ratio - lev * 0.02 drops below that (or the best so far).
+    compact = q.replace(" ", "")
+    fuzzy_index = project_data.get("fuzzy_index")
+    if fuzzy_index is not None:
+        products = fuzzy_index.lookup_products(compact)
+    else:
+        products = project_data.get("products", [])
+
     best = None
     best_score = 0.0
-    for p in project_data.get("products", []):
+    for p in products:
         t = (p.get("title_lower") or p.get("title", "")).lower().replace(" ", "")
         if not t:
             continue
-        seq_ratio = SequenceMatcher(None, q.replace(" ", ""), t).ratio()
-        lev = levenshtein_distance(q.replace(" ", ""), t)
+        seq_ratio = SequenceMatcher(None, compact, t).ratio()
+        floor = max(best_score, 0.5)
+        if seq_ratio < floor:
+            continue
+        lev = levenshtein_distance(compact, t, int((seq_ratio - floor) / 0.02) + 1)
 
         score = seq_ratio - (lev * 0.02)
         if score > best_score:
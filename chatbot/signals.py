@@ -0,0 +1,42 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+
+from core.models import Product, Category, Review, DeliveryZone
+from . import ingestion, lexical
+from .catalog import invalidate_catalog
+from .models import Document
+
+CATALOG_MODELS = (Product, Category, Review, DeliveryZone)
+
+for model in CATALOG_MODELS:
+    post_save.connect(invalidate_catalog, sender=model, dispatch_uid=f"chatbot_catalog_save_{model.__name__}")
+    post_delete.connect(invalidate_catalog, sender=model, dispatch_uid=f"chatbot_catalog_delete_{model.__name__}")
+
+
+# ---------------- Knowledge indexes ----------------
+# Document changes go through chatbot.ingestion, which keeps the stored
+# chunks, the BM25 index and (a few seconds later) the vector index in
+# step; product descriptions only feed the BM25 index here.
+
+def ingest_document_on_save(sender, instance, **kwargs):
+    transaction.on_commit(lambda: ingestion.ingest_document(instance))
+
+
+def index_product_on_save(sender, instance, **kwargs):
+    transaction.on_commit(lambda: lexical.store.update(lambda index: lexical.index_product(index, instance)))
+
+
+def unindex_on_delete(sender, instance, **kwargs):
+    source = f"{sender.__name__.lower()}:{instance.pk}"
+    transaction.on_commit(lambda: lexical.store.update(lambda index: index.remove(source)))
+
+
+def unindex_document_on_delete(sender, instance, **kwargs):
+    unindex_on_delete(sender, instance, **kwargs)
+    transaction.on_commit(ingestion.schedule_vector_rebuild)
+
+
+post_save.connect(ingest_document_on_save, sender=Document, dispatch_uid="chatbot_bm25_document_save")
+post_save.connect(index_product_on_save, sender=Product, dispatch_uid="chatbot_bm25_product_save")
+post_delete.connect(unindex_document_on_delete, sender=Document, dispatch_uid="chatbot_bm25_document_delete")
+post_delete.connect(unindex_on_delete, sender=Product, dispatch_uid="chatbot_bm25_product_delete")
@@ -34,47 +34,83 @@ if (overlay) {
     });
 }
 
-async function loadConversationList() {
+let convCursor = null;
+let convLoading = false;
+
+function renderConversation(c) {
+    const item = document.createElement("div");
+    item.className = "conv-item";
+    item.setAttribute("data-convo", c.id);
+
+    item.innerHTML = `
+        <div class="conv-top">
+            <span class="conv-title">${c.title}</span>
+            <div class="conv-actions">
+                <span onclick="event.stopPropagation(); renameConv(${c.id})">✏️</span>
+                <span onclick="event.stopPropagation(); pinConv(${c.id})">${c.pinned ? "📍" : "📌"}</span>
+                <span onclick="event.stopPropagation(); deleteConversation(${c.id})">🗑️</span>
+            </div>
+        </div>
+        <div class="conv-preview">${c.preview || "No messages yet"}</div>
+    `;
+
+    item.onclick = () => loadConversation(c.id);
+
+    if (c.pinned) document.getElementById("pinnedList").appendChild(item);
+    else document.getElementById("convList").appendChild(item);
+}
+
+async function loadConversationList(more = false) {
 
     const langSelect = document.getElementById("langSelect");
     const lang = langSelect ? langSelect.value : (localStorage.getItem("chat_lang") || "en");
 
     localStorage.setItem("chat_lang", lang);
 
-    const resp = await fetch(`/api/conversations/?lang=${lang}`);
-    const convos = await resp.json();
+    if (more && (!convCursor || convLoading)) return;
+    convLoading = true;
 
-    const pinnedList = document.getElementById("pinnedList");
-    const convList = document.getElementById("convList");
+    let url = `/api/conversations/?lang=${lang}`;
+    if (more) url += `&cursor=${encodeURIComponent(convCursor)}`;
 
-    pinnedList.innerHTML = "";
-    convList.innerHTML = "";
+    try {
+        const resp = await fetch(url);
+        const page = await resp.json();
 
-    convos.forEach(c => {
-        const item = document.createElement("div");
-        item.className = "conv-item";
-        item.setAttribute("data-convo", c.id);
+        if (!more) {
+            document.getElementById("pinnedList").innerHTML = "";
+            document.getElementById("convList").innerHTML = "";
+        }
 
-        item.innerHTML = `
-            <div class="conv-top">
-                <span class="conv-title">${c.title}</span>
-                <div class="conv-actions">
-                    <span onclick="event.stopPropagation(); renameConv(${c.id})">✏️</span>
-                    <span onclick="event.stopPropagation(); pinConv(${c.id})">${c.pinned ? "📍" : "📌"}</span>
-                    <span onclick="event.stopPropagation(); deleteConversation(${c.id})">🗑️</span>
-                </div>
-            </div>
-            <div class="conv-preview">${c.preview || "No messages yet"}</div>
-        `;
+        page.results.forEach(renderConversation);
+        convCursor = page.next_cursor;
+    } finally {
+        convLoading = false;
+    }
 
-        item.onclick = () => loadConversation(c.id);
+    const pinnedTitle = document.getElementById("pinnedTitle");
+    pinnedTitle.style.display = document.getElementById("pinnedList").children.length ? "block" : "none";
+}
 
-        if (c.pinned) pinnedList.appendChild(item);
-        else convList.appendChild(item);
-    });
+const convSentinel = document.getElementById("convSentinel");
 
-    const pinnedTitle = document.getElementById("pinnedTitle");
-    pinnedTitle.style.display = pinnedList.children.length ? "block" : "none";
+if (convSentinel && "IntersectionObserver" in window) {
+    new IntersectionObserver(entries => {
+        if (entries.some(e => e.isIntersecting)) loadConversationList(true);
+    }).observe(convSentinel);
+}
+
+let oldestMessageId = null;
+let newestMessageId = null;
+let hasOlderMessages = false;
+let loadingOlder = false;
+let sending = false;
+
+function trackMessageIds(msgs) {
+    msgs.forEach(m => {
+        if (oldestMessageId === null || m.id < oldestMessageId) oldestMessageId = m.id;
+        if (newestMessageId === null || m.id > newestMessageId) newestMessageId = m.id;
+    });
 }
 
 async function loadConversation(cid) {
@@ -89,12 +125,16 @@ async function loadConversation(cid) {
     const lang = getLang();
 
     const resp = await fetch(`/api/messages/${cid}/?lang=${lang}`);
-    const msgs = await resp.json();
+    const page = await resp.json();
 
     const box = document.getElementById("chatBox");
     box.innerHTML = "";
 
-    msgs.forEach(m =>
+    oldestMessageId = newestMessageId = null;
+    hasOlderMessages = page.has_more;
+    trackMessageIds(page.results);
+
+    page.results.forEach(m =>
         addMessage(
             m.content,
             m.sender,
@@ -104,6 +144,58 @@ async function loadConversation(cid) {
     );
 }
 
+async function loadOlderMessages() {
+    if (!conversationId || !hasOlderMessages || loadingOlder || oldestMessageId === null) return;
+    loadingOlder = true;
+
+    const cid = conversationId;
+    const box = document.getElementById("chatBox");
+
+    try {
+        const resp = await fetch(`/api/messages/${cid}/?lang=${getLang()}&before_id=${oldestMessageId}`);
+        const page = await resp.json();
+        if (cid !== conversationId) return;
+
+        const height = box.scrollHeight;
+        const first = box.firstChild;
+
+        page.results.forEach(m => addMessage(m.content, m.sender, m.id, false, first));
+        trackMessageIds(page.results);
+        hasOlderMessages = page.has_more;
+
+        box.scrollTop += box.scrollHeight - height;
+    } finally {
+        loadingOlder = false;
+    }
+}
+
+async function pollNewMessages() {
+    if (!conversationId || newestMessageId === null || sending || document.hidden) return;
+
+    const cid = conversationId;
+    const resp = await fetch(`/api/messages/${cid}/?lang=${getLang()}&since_id=${newestMessageId}`);
+    const page = await resp.json();
+    if (cid !== conversationId || sending) return;
+
+    const box = document.getElementById("chatBox");
+    page.results.forEach(m => {
+        if (!box.querySelector(`[data-id="${m.id}"]`)) {
+            addMessage(m.content, m.sender, m.id, false);
+        }
+    });
+    trackMessageIds(page.results);
+}
+
+const chatBoxEl = document.getElementById("chatBox");
+
+if (chatBoxEl) {
+    chatBoxEl.addEventListener("scroll", () => {
+        if (chatBoxEl.scrollTop < 50) loadOlderMessages();
+    });
+}
+
+setInterval(pollNewMessages, 15000);
+
 
 function showPinned() {
     document.getElementById("pinnedList").style.display = "block";
@@ -124,6 +216,65 @@ function showAll() {
 function closeChat() {
     window.history.back();  
 }
+function parseEvent(block) {
+    let name = "message";
+    let data = "";
+    block.split("\n").forEach(line => {
+        if (line.startsWith("event:")) name = line.slice(6).trim();
+        else if (line.startsWith("data:")) data += line.slice(5).trim();
+    });
+    return { name, data: data ? JSON.parse(data) : null };
+}
+
+// Streamed partial reply, replaced by the final one on "done".
+function showPartialReply(text) {
+    hideTyping();
+    let bubble = document.querySelector("#partialReply .bubble");
+    if (!bubble) {
+        addMessage("", "bot");
+        const box = document.getElementById("chatBox");
+        box.lastElementChild.id = "partialReply";
+        bubble = box.lastElementChild.querySelector(".bubble");
+    }
+    bubble.textContent += text;
+}
+
+// Posts the turn to /api/chat/stream/ and shows "token" events as they
+// arrive. Resolves to the "done" event's data, or null when the stream
+// could not be used (the caller then posts to /api/chat/ instead).
+async function streamChat(body) {
+    const resp = await fetch("/api/chat/stream/", {
+        method: "POST",
+        headers: {
+            "Content-Type": "application/json",
+            "X-CSRFToken": getCookie("csrftoken")
+        },
+        body: body
+    });
+    const type = resp.headers.get("Content-Type") || "";
+    if (!resp.ok || !resp.body || !type.startsWith("text/event-stream")) return null;
+
+    const reader = resp.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let result = null;
+
+    while (!result) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let end;
+        while ((end = buffer.indexOf("\n\n")) !== -1) {
+            const event = parseEvent(buffer.slice(0, end));
+            buffer = buffer.slice(end + 2);
+            if (event.name === "token") showPartialReply(event.data.text);
+            else if (event.name === "done") result = event.data;
+        }
+    }
+    return result;
+}
+
 async function sendMessage() {
     const input = document.getElementById("messageInput");
     const msg = input.value.trim();
@@ -132,26 +283,39 @@ async function sendMessage() {
     addMessage(msg, "user");
     input.value = "";
     showTyping();
+    sending = true;
 
     const lang = getLang();
-
-    const resp = await fetch("/api/chat/", {
-        method: "POST",
-        headers: {
-            "Content-Type": "application/json",
-            "X-CSRFToken": getCookie("csrftoken")
-        },
-        body: JSON.stringify({
-            query: msg,
-            conversation_id: conversationId,
-            lang: lang
-        })
+    const body = JSON.stringify({
+        query: msg,
+        conversation_id: conversationId,
+        lang: lang
     });
 
-    const data = await resp.json();
+    let data = null;
+    try {
+        if (window.ReadableStream && window.TextDecoder) {
+            data = await streamChat(body).catch(() => null);
+        }
+        if (!data) {
+            const resp = await fetch("/api/chat/", {
+                method: "POST",
+                headers: {
+                    "Content-Type": "application/json",
+                    "X-CSRFToken": getCookie("csrftoken")
+                },
+                body: body
+            });
+            data = await resp.json();
+        }
+    } finally {
+        sending = false;
+        document.getElementById("partialReply")?.remove();
+    }
     hideTyping();
 
-    addMessage(data.response, "bot", data.message_id, true);
+    addMessage(data.response, "bot", data.bot_message_id, true);
+    if (data.bot_message_id) newestMessageId = data.bot_message_id;
 
     conversationId = data.conversation_id;
     localStorage.setItem("chat_conversation_id", conversationId);
@@ -255,7 +419,7 @@ async function pinConv(id) {
     loadConversationList();
 }
 
-function addMessage(text, role, messageId = null, speak = false) {
+function addMessage(text, role, messageId = null, speak = false, before = null) {
     const box = document.getElementById("chatBox");
 
     const msg = document.createElement("div");
@@ -298,6 +462,11 @@ function addMessage(text, role, messageId = null, speak = false) {
         msg.appendChild(avatar);
     }
 
+    if (before) {
+        box.insertBefore(msg, before);
+        return;
+    }
+
     box.appendChild(msg);
     box.scrollTop = box.scrollHeight;
 }
@@ -544,6 +713,12 @@ window.addEventListener("DOMContentLoaded", () => {
 
         const data = await resp.json();
 
+        if (!resp.ok) {
+            addMessage(data.error || "Upload failed.", "bot");
+            this.value = "";
+            return;
+        }
+
         if (data.image_html) {
             addMessage(data.image_html, "user", data.message_id);
         }
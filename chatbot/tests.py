@@ -1,3 +1,432 @@
-from django.test import TestCase
+import asyncio
+import itertools
+import random
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+
+from core.models import Category
+from core.tests import make_product
+
+from . import api, catalog, hf_client, lexical, llm_cache, persistence, retrieval, translation, views
+from .category_index import CategoryIndex
+from .catalog import CatalogSnapshot, get_catalog
+from .fuzzy import FuzzyIndex, levenshtein
+from .models import LLMResponse, Message, TranslatedText
+from .management.commands.bench_fuzzy_match import make_title, make_vocabulary, typo
+from .product_index import ProductIndex
+
+
+class KnowledgeReplyTests(TestCase):
+    """Knowledge-base answers are inserted into the HTML reply escaped."""
+
+    def answer(self, hit):
+        with mock.patch.object(api, "knowledge_answer", return_value=hit):
+            return api.handle_chat(None, "tell me about xylophones", None, get_catalog())["response"]
+
+    def test_product_passage_is_escaped(self):
+        reply = self.answer({
+            "kind": "product", "ref": 0, "title": "<b>Tea</b>",
+            "text": "<script>alert(1)</script>",
+        })
+        self.assertNotIn("<script>", reply)
+        self.assertIn("&lt;script&gt;alert(1)&lt;/script&gt;", reply)
+        self.assertIn("&lt;b&gt;Tea&lt;/b&gt;</a>", reply)
+
+    def test_faq_passage_is_escaped(self):
+        reply = self.answer({"kind": "faq", "ref": "x", "title": "x", "text": "<img src=x onerror=alert(1)>"})
+        self.assertEqual(reply, "&lt;img src=x onerror=alert(1)&gt;")
+
+
+class MatchProductTests(SimpleTestCase):
+    """The trigram index gives the same answers as the plain linear scan."""
+
+    QUERIES = [
+        "ured", "banana organic", "crud", "curd rice", "organic du", "orgnic pe",
+        "organc", "rice", "ka rice", "mi rice", "basmati", "xyz", "ba",
+    ]
+
+    def setUp(self):
+        # More than 50 "Organic Nan .." titles outrank Banana Rice on
+        # trigram overlap for "banana organic", pushing it off the shortlist.
+        titles = [f"Organic Nan {a}{b}" for a, b in itertools.product("BDGKLMPSTV", "auoiey")]
+        titles += [f"{a}{b} Rice" for a, b in itertools.product("KLMNPS", "aeiou")]
+        titles += ["Curd", "Banana Rice"]
+        self.products = [{"id": i, "title": t, "search_terms": []} for i, t in enumerate(titles)]
+        self.index = ProductIndex(self.products)
+
+    def test_same_as_linear_scan(self):
+        for query in self.QUERIES:
+            with self.subTest(query=query):
+                self.assertIs(
+                    api.match_product(query, self.products, index=self.index),
+                    api.match_product(query, self.products),
+                )
+
+    def test_typos_off_the_shortlist(self):
+        self.assertEqual(api.match_product("ured", self.products, index=self.index)["title"], "Curd")
+        self.assertEqual(
+            api.match_product("banana organic", self.products, index=self.index)["title"], "Banana Rice"
+        )
+
+
+class FuzzyIndexTests(SimpleTestCase):
+    def test_same_as_brute_force_edit_distance(self):
+        rng = random.Random(3)
+        vocabulary = make_vocabulary(rng, 300)
+        products = [
+            {"id": i, "title": make_title(rng, vocabulary), "search_terms": []}
+            for i in range(500)
+        ]
+        index = FuzzyIndex(products)
+
+        for _ in range(100):
+            word = typo(rng.choice(products)["title"].replace(" ", ""), rng)
+            if rng.random() < 0.5:
+                word = typo(word, rng)
+            brute = sorted(
+                (d, key) for key in index.keys
+                if (d := levenshtein(word, key)) <= index.max_distance
+            )
+            with self.subTest(word=word):
+                self.assertEqual(index.lookup(word), brute)
+
+    def test_misspelt_item_finds_its_category(self):
+        products = [
+            {"id": 1, "title": "Basmati Rice", "category": "Grains"},
+            {"id": 2, "title": "Tomato", "category": "Vegetables"},
+        ]
+        category = api.infer_category_for_missing_product(
+            "tomoto", products, index=CategoryIndex(products), fuzzy_index=FuzzyIndex(products),
+        )
+        self.assertEqual(category, "Vegetables")
+        self.assertIsNone(api.infer_category_for_missing_product(
+            "tomoto", products, index=CategoryIndex(products),
+        ))
+
+
+class CatalogSnapshotTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name="Grains", image="categories/test.jpg")
+        make_product(self.category, "Basmati Rice")
+        self.snapshot = CatalogSnapshot()
+        self.first = self.snapshot.build()
+
+        # Rebuilds are run by hand with build() instead.
+        patcher = mock.patch.object(catalog.threading, "Thread")
+        self.thread = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def titles(self, data):
+        return [p["title"] for p in data["product_index"].products]
+
+    def test_fresh_snapshot_is_reused(self):
+        self.assertIs(self.snapshot.get(), self.first)
+        self.thread.assert_not_called()
+
+    def test_version_bump_serves_old_copy_and_rebuilds(self):
+        make_product(self.category, "Ragi Flour")
+        self.snapshot.invalidate()
+
+        self.assertIs(self.snapshot.get(), self.first)
+        self.thread.assert_called_once()
+
+        self.snapshot.build()
+        data = self.snapshot.get()
+        self.assertCountEqual(self.titles(data), ["Basmati Rice", "Ragi Flour"])
+        # The copy requests may still hold is left as it was.
+        self.assertIsNot(data["product_index"], self.first["product_index"])
+        self.assertEqual(self.titles(self.first), ["Basmati Rice"])
+
+    def test_rebuilt_after_max_age(self):
+        later = time.monotonic() + catalog.CATALOG_MAX_AGE + 1
+        with mock.patch.object(catalog.time, "monotonic", return_value=later):
+            self.assertIs(self.snapshot.get(), self.first)
+        self.thread.assert_called_once()
+
+
+class LexicalStoreTests(TestCase):
+    """The BM25 store leaves writing to the command and merges concurrent saves."""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, "bm25.index")
+        settings = override_settings(CHATBOT_BM25_INDEX_PATH=self.path)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    @staticmethod
+    def add(source, text):
+        return lambda index: index.replace(source, [(text, {"text": text})], lexical.content_hash(text))
+
+    def test_update_without_index_file_builds_nothing(self):
+        store = lexical.LexicalStore()
+        with mock.patch.object(lexical, "build_bm25_index") as build:
+            store.update(self.add("product:1", "green tea"))
+        build.assert_not_called()
+        self.assertIsNone(store.index)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_search_without_index_file_writes_nothing(self):
+        store = lexical.LexicalStore()
+        store.get()
+        store.update(self.add("product:1", "green tea"))
+        self.assertEqual(store.get().search("tea", 1)[0]["text"], "green tea")
+        self.assertIsNone(store._timer)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_saves_from_two_processes_are_merged(self):
+        lexical.BM25Index().save()
+        first, second = lexical.LexicalStore(), lexical.LexicalStore()
+
+        first.update(self.add("product:1", "green tea"))
+        second.update(self.add("product:2", "basmati rice"))
+        for store in (first, second):
+            store._timer.cancel()
+        first._save_now()
+        second._save_now()
+
+        index = lexical.BM25Index.load()
+        self.assertIn("product:1", index.sources)
+        self.assertIn("product:2", index.sources)
+        self.assertEqual(index.search("tea", 1)[0]["text"], "green tea")
+
+
+@override_settings(CHATBOT_EMBEDDINGS="hashed")
+class VectorIndexTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, "vectors.index")
+
+        category = Category.objects.create(name="Grains", image="categories/test.jpg")
+        self.rice = make_product(category, "Basmati Rice", description="Long grain rice aged for a year.")
+        make_product(category, "Ragi Flour", description="Stone ground finger millet.")
+
+        self.embedded = []
+        embed = retrieval.embed
+        patcher = mock.patch.object(
+            retrieval, "embed", side_effect=lambda texts, embedder: self.embedded.extend(texts) or embed(texts, embedder)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_rebuild_embeds_only_changed_descriptions(self):
+        self.assertEqual(retrieval.build_index(self.path), 2)
+        self.assertEqual(len(self.embedded), 2)
+
+        self.embedded.clear()
+        self.rice.description = "Long grain rice from the foothills."
+        self.rice.save()
+        retrieval.build_index(self.path)
+        self.assertEqual(self.embedded, ["Basmati Rice: Long grain rice from the foothills."])
+
+    def test_search_after_rebuild(self):
+        retrieval.build_index(self.path)
+        index = retrieval.VectorIndex(self.path)
+        self.assertEqual(index.search("aged long grain rice", 1)[0]["source"], f"product:{self.rice.id}")
+
+        self.rice.description = "Fragrant rice from the foothills."
+        self.rice.save()
+        retrieval.build_index(self.path)
+        self.assertEqual(
+            index.search("fragrant rice", 1)[0]["text"], "Basmati Rice: Fragrant rice from the foothills."
+        )
+
+    def test_files_from_different_rebuilds_are_not_mixed(self):
+        retrieval.build_index(self.path)
+        index = retrieval.VectorIndex(self.path)
+        index.search("rice")
+        with open(retrieval.meta_path(self.path)) as f:
+            old_meta = f.read()
+
+        # A rebuild caught between renaming its sidecar and its vectors.
+        self.rice.delete()
+        retrieval.build_index(self.path)
+        with open(retrieval.meta_path(self.path), "w") as f:
+            f.write(old_meta)
+
+        self.assertEqual(retrieval.VectorIndex(self.path).search("rice"), [])
+        self.assertEqual(index.search("aged long grain rice", 1)[0]["title"], "Basmati Rice")
+
+    def test_answer_is_shaped_like_a_knowledge_passage(self):
+        retrieval.build_index(self.path)
+        with mock.patch.object(retrieval, "_index", retrieval.VectorIndex(self.path)):
+            hit = retrieval.answer("long grain rice aged for a year")
+        self.assertEqual(
+            (hit["kind"], hit["ref"], hit["text"]), ("product", self.rice.id, "Long grain rice aged for a year.")
+        )
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.breaker = hf_client.CircuitBreaker(threshold=1, reset_timeout=0)
+        self.breaker.record_failure()
+        patcher = mock.patch.object(hf_client, "breaker", self.breaker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cancelled_async_call_gives_back_the_trial(self):
+        class HangingClient:
+            async def post(self, *args, **kwargs):
+                await asyncio.sleep(60)
+
+        async def cancel_midway():
+            call = asyncio.ensure_future(hf_client.hf_generate_async("hello"))
+            await asyncio.sleep(0.01)
+            self.assertTrue(self.breaker.trial_running)
+            call.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await call
+
+        with mock.patch.object(hf_client, "get_async_client", return_value=HangingClient()):
+            asyncio.run(cancel_midway())
+        self.assertFalse(self.breaker.trial_running)
+        self.assertTrue(self.breaker.allow())
+
+
+class WriteBehindBufferTests(SimpleTestCase):
+    def test_timed_out_turn_is_withdrawn(self):
+        buffer = persistence.WriteBehindBuffer()
+        # No writer thread, so nothing ever commits.
+        with mock.patch.object(buffer, "_ensure_worker"), \
+                mock.patch.object(persistence, "WRITE_BEHIND_TIMEOUT", 0.01):
+            with self.assertRaises(TimeoutError):
+                buffer.submit(object(), "message")
+        self.assertTrue(buffer.queue.empty())
+
+
+class TranslationCacheTests(TestCase):
+    def setUp(self):
+        translation._memory.clear()
+        self.calls = []
+        patcher = mock.patch.object(translation, "_call_translator", side_effect=self.translator)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def translator(self, texts, target, source):
+        self.calls.append((tuple(texts), source))
+        return [f"{source}:{text}" for text in texts]
+
+    def test_cached_per_source_language(self):
+        self.assertEqual(translation.translate("gift", "en", source="de"), "de:gift")
+        self.assertEqual(translation.translate("gift", "en", source="sv"), "sv:gift")
+        translation._memory.clear()
+        self.assertEqual(translation.translate("gift", "en", source="de"), "de:gift")
+        self.assertEqual(self.calls, [(("gift",), "de"), (("gift",), "sv")])
+
+    def test_eviction_runs_in_batches(self):
+        with mock.patch.object(translation, "TRANSLATION_CACHE_SIZE", 3), \
+                mock.patch.object(translation, "EVICT_EVERY", 5), \
+                mock.patch.object(translation, "_inserted", 0):
+            translation.translate_many(["a", "b", "c"], "ta", source="en")
+            # Over the cap, but fewer than EVICT_EVERY rows inserted.
+            with self.assertNumQueries(2):
+                translation.translate("d", "ta", source="en")
+            self.assertEqual(TranslatedText.objects.count(), 4)
+
+            translation.translate("e", "ta", source="en")
+            self.assertLessEqual(TranslatedText.objects.count(), 3)
+
+
+class LLMCacheTests(TestCase):
+    def test_store_replaces_in_place(self):
+        llm_cache.store("k", "prompt", "first")
+        row = LLMResponse.objects.get()
+        llm_cache.store("k", "prompt", "second")
+        self.assertEqual(LLMResponse.objects.get().pk, row.pk)
+        self.assertEqual(llm_cache.lookup("k"), "second")
+
+    def test_eviction_runs_in_batches(self):
+        with mock.patch.object(llm_cache, "LLM_CACHE_SIZE", 3), \
+                mock.patch.object(llm_cache, "EVICT_EVERY", 5), \
+                mock.patch.object(llm_cache, "_inserted", 0):
+            for key in "abcd":
+                llm_cache.store(key, key, key)
+            # Over the cap, but fewer than EVICT_EVERY rows inserted.
+            self.assertEqual(LLMResponse.objects.count(), 4)
+
+            llm_cache.store("e", "e", "e")
+            self.assertLessEqual(LLMResponse.objects.count(), 3)
+            self.assertEqual(llm_cache.lookup("e"), "e")
+
+
+class ConversationListTests(TestCase):
+    """Visitors only see the conversations started in their own session."""
+
+    def chat(self, client):
+        response = client.post("/api/chat/", json.dumps({"query": "hello"}), content_type="application/json")
+        return response.json()["conversation_id"]
+
+    def listed(self, client):
+        return [c["id"] for c in client.get("/api/conversations/").json()["results"]]
+
+    def test_anonymous_visitors_are_kept_apart(self):
+        first, second = Client(), Client()
+        mine, theirs = self.chat(first), self.chat(second)
+
+        self.assertEqual(self.listed(first), [mine])
+        self.assertEqual(self.listed(second), [theirs])
+        self.assertEqual(self.listed(Client()), [])
+
+
+class ChatStreamTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name="Grains", image="categories/test.jpg")
+        make_product(category, "Basmati Rice")
+        patcher = mock.patch.object(views, "load_project_data", return_value=CatalogSnapshot().build())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def events(self, response):
+        body = b"".join(response.streaming_content).decode()
+        events = []
+        for block in body.strip().split("\n\n"):
+            name, data = block.split("\n")
+            events.append((name.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+        return events
+
+    def test_streams_the_benefit_then_the_saved_turn(self):
+        with mock.patch.object(api, "hf_stream", return_value=iter(["Rich in ", "energy."])):
+            response = self.client.post(
+                "/api/chat/stream/", json.dumps({"query": "basmati rice"}),
+                content_type="application/json",
+            )
+            # The body runs as it is read.
+            events = self.events(response)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+
+        self.assertEqual([name for name, _ in events], ["start", "token", "token", "done"])
+        self.assertEqual("".join(data["text"] for name, data in events if name == "token"), "Rich in energy.")
+
+        done = events[-1][1]
+        self.assertIn("Rich in energy.", done["response"])
+        self.assertTrue(Message.objects.filter(id=done["bot_message_id"], conversation_id=done["conversation_id"]).exists())
+
+
+class AsyncChatTests(TestCase):
+    async def test_only_the_translator_leaves_the_sync_thread(self):
+        threads = {}
+
+        def record(name, function):
+            def wrapper(*args, **kwargs):
+                threads.setdefault(name, set()).add(threading.get_ident())
+                return function(*args, **kwargs)
+            return wrapper
+
+        with mock.patch.object(translation, "_lookup", record("lookup", translation._lookup)), \
+                mock.patch.object(translation, "_call_translator", record("call", lambda texts, *a: list(texts))):
+            response = await self.async_client.post(
+                "/api/chat/async/", json.dumps({"query": "vanakkam", "lang": "ta"}),
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(threads["lookup"])
+        self.assertFalse(threads["lookup"] & threads["call"])
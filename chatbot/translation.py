@@ -0,0 +1,225 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from deep_translator import GoogleTranslator
+from django.conf import settings
+from django.utils import timezone
+
+from . import admission
+from .models import TranslatedText
+
+logger = logging.getLogger(__name__)
+
+# Rows kept in the TranslatedText table before the least recently used
+# ones are evicted, and entries kept in this process in front of it.
+TRANSLATION_CACHE_SIZE = getattr(settings, "CHATBOT_TRANSLATION_CACHE_SIZE", 50000)
+TRANSLATION_MEMORY_SIZE = getattr(settings, "CHATBOT_TRANSLATION_MEMORY_SIZE", 2000)
+# Rows a process inserts between evictions, so the table can run over
+# TRANSLATION_CACHE_SIZE by about this much per process.
+EVICT_EVERY = getattr(settings, "CHATBOT_TRANSLATION_EVICT_EVERY", 500)
+
+# GoogleTranslator rejects payloads over 5000 characters.
+BATCH_CHARS = 4500
+
+# Translator calls in flight per process and callers allowed to wait for
+# one (see chatbot.admission); refused texts stay untranslated.
+TRANSLATE_MAX_CONCURRENCY = getattr(settings, "CHATBOT_TRANSLATE_MAX_CONCURRENCY", 4)
+TRANSLATE_QUEUE_SIZE = getattr(settings, "CHATBOT_TRANSLATE_QUEUE_SIZE", 32)
+TRANSLATE_QUEUE_TIMEOUT = getattr(settings, "CHATBOT_TRANSLATE_QUEUE_TIMEOUT", 2)
+
+limiter = admission.Limiter(
+    "translator", TRANSLATE_MAX_CONCURRENCY, TRANSLATE_QUEUE_SIZE, TRANSLATE_QUEUE_TIMEOUT
+)
+
+_memory = OrderedDict()
+_memory_lock = threading.Lock()
+_inserted = 0
+
+
+def text_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _remember(key, value):
+    with _memory_lock:
+        _memory[key] = value
+        _memory.move_to_end(key)
+        while len(_memory) > TRANSLATION_MEMORY_SIZE:
+            _memory.popitem(last=False)
+
+
+def _recall(key):
+    with _memory_lock:
+        value = _memory.get(key)
+        if value is not None:
+            _memory.move_to_end(key)
+        return value
+
+
+def _call_translator(texts, target, source):
+    """
+    Translates texts in as few GoogleTranslator calls as possible by
+    joining them with newlines. Returns a list aligned with texts, with
+    None for anything that could not be translated, which is everything
+    when admission control refuses the call.
+    """
+    results = [None] * len(texts)
+    try:
+        with admission.admit(limiter):
+            _translate_batches(texts, target, source, results)
+    except admission.Overloaded as e:
+        logger.info("Translation to %s skipped: %s", target, e)
+    return results
+
+
+def _translate_batches(texts, target, source, results):
+    translator = GoogleTranslator(source=source, target=target)
+
+    batches, batch, size = [], [], 0
+    for i, text in enumerate(texts):
+        if "\n" in text or len(text) > BATCH_CHARS:
+            batches.append([i])
+            continue
+        if batch and size + len(text) + 1 > BATCH_CHARS:
+            batches.append(batch)
+            batch, size = [], 0
+        batch.append(i)
+        size += len(text) + 1
+    if batch:
+        batches.append(batch)
+
+    for batch in batches:
+        try:
+            if len(batch) == 1:
+                results[batch[0]] = translator.translate(texts[batch[0]])
+                continue
+
+            joined = translator.translate("\n".join(texts[i] for i in batch))
+            parts = (joined or "").split("\n")
+            if len(parts) == len(batch):
+                for i, part in zip(batch, parts):
+                    results[i] = part
+                continue
+
+            for i in batch:
+                results[i] = translator.translate(texts[i])
+        except Exception:
+            logger.exception("Translation to %s failed", target)
+
+
+def _evict():
+    """Deletes the least recently used rows beyond TRANSLATION_CACHE_SIZE."""
+    cutoff = list(
+        TranslatedText.objects.order_by("-last_used_at")
+        .values_list("last_used_at", flat=True)[TRANSLATION_CACHE_SIZE:TRANSLATION_CACHE_SIZE + 1]
+    )
+    if cutoff:
+        TranslatedText.objects.filter(last_used_at__lte=cutoff[0]).delete()
+
+
+def _count_inserts(count):
+    """Runs _evict() once every EVICT_EVERY inserted rows."""
+    global _inserted
+    with _memory_lock:
+        _inserted += count
+        due = _inserted >= EVICT_EVERY
+        if due:
+            _inserted = 0
+    if due:
+        _evict()
+
+
+def _lookup(texts, target, source):
+    """
+    Cached translations of texts from source to target,
+    {text: translation}, and the texts still to translate,
+    {text hash: text}.
+    """
+    found = {}
+    pending = {}
+    for text in texts:
+        if not text or not text.strip() or text in found:
+            continue
+        key = (text_hash(text), source, target)
+        cached = _recall(key)
+        if cached is not None:
+            found[text] = cached
+        else:
+            pending[key[0]] = text
+
+    if pending:
+        rows = list(TranslatedText.objects.filter(
+            source=source, target=target, text_hash__in=list(pending)
+        ))
+        for row in rows:
+            found[pending.pop(row.text_hash)] = row.translated
+            _remember((row.text_hash, source, target), row.translated)
+
+        if rows:
+            TranslatedText.objects.filter(id__in=[r.id for r in rows]).update(
+                last_used_at=timezone.now()
+            )
+    return found, pending
+
+
+def _store(pending, translated, target, source, found):
+    """Caches translated, a list aligned with pending, and adds it to found."""
+    new_rows = []
+    for (h, text), value in zip(pending.items(), translated):
+        if value is None:
+            continue
+        found[text] = value
+        _remember((h, source, target), value)
+        new_rows.append(TranslatedText(text_hash=h, source=source, target=target, translated=value))
+
+    if new_rows:
+        TranslatedText.objects.bulk_create(new_rows, ignore_conflicts=True)
+        _count_inserts(len(new_rows))
+
+
+def translate_many(texts, target, source="auto"):
+    """
+    Translates a list of strings to target, returning a list in the same
+    order. Nothing is translated when source and target are the same;
+    otherwise cached translations are used and all the misses are sent
+    to GoogleTranslator together. Untranslatable text is returned as is.
+    """
+    texts = list(texts)
+    if not texts or source == target:
+        return texts
+
+    found, pending = _lookup(texts, target, source)
+    if pending:
+        translated = _call_translator(list(pending.values()), target, source)
+        _store(pending, translated, target, source, found)
+    return [found.get(text, text) for text in texts]
+
+
+def translate(text, target, source="auto"):
+    return translate_many([text], target, source)[0]
+
+
+async def atranslate_many(texts, target, source="auto"):
+    """
+    translate_many for async views. The cache reads and writes run on
+    the thread Django keeps for sync code, like any other ORM call; only
+    the translator's HTTP calls get a thread of their own.
+    """
+    texts = list(texts)
+    if not texts or source == target:
+        return texts
+
+    found, pending = await sync_to_async(_lookup)(texts, target, source)
+    if pending:
+        translated = await sync_to_async(_call_translator, thread_sensitive=False)(
+            list(pending.values()), target, source
+        )
+        await sync_to_async(_store)(pending, translated, target, source, found)
+    return [found.get(text, text) for text in texts]
+
+
+async def atranslate(text, target, source="auto"):
+    return (await atranslate_many([text], target, source))[0]
@@ -0,0 +1,166 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadhandler import StopUpload, TemporaryFileUploadHandler
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_MAX_BYTES = getattr(settings, "CHATBOT_UPLOAD_MAX_BYTES", 10 * 1024 * 1024)
+# Room for the multipart boundaries and the other form fields when the
+# request's Content-Length is checked against UPLOAD_MAX_BYTES.
+MULTIPART_OVERHEAD = 16 * 1024
+
+# Chat bubbles show images 200px wide; thumbnails cover 2x displays.
+THUMBNAIL_SIZE = getattr(settings, "CHATBOT_THUMBNAIL_SIZE", 400)
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_WORKERS = 2
+
+EXTENSION_RE = re.compile(r"^\.[a-z0-9]{1,10}$")
+
+
+def storage():
+    return FileSystemStorage(
+        location=os.path.join(settings.MEDIA_ROOT, "uploads"),
+        base_url=settings.MEDIA_URL + "uploads/",
+    )
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+def check_content_length(request):
+    """Rejects a request that announces a body larger than any allowed upload."""
+    try:
+        length = int(request.META.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        length = 0
+    if length > UPLOAD_MAX_BYTES + MULTIPART_OVERHEAD:
+        raise UploadTooLarge
+
+
+class HashingUploadHandler(TemporaryFileUploadHandler):
+    """
+    Streams each uploaded file to a temporary file while computing its
+    SHA-256, and stops reading the upload as soon as it passes max_bytes
+    (the view then finds exceeded set and no file). The digest is left on
+    the file as .sha256.
+    """
+
+    def __init__(self, request=None, max_bytes=UPLOAD_MAX_BYTES):
+        super().__init__(request)
+        self.max_bytes = max_bytes
+        self.exceeded = False
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hasher = hashlib.sha256()
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.max_bytes:
+            self.exceeded = True
+            raise StopUpload(connection_reset=False)
+        self.hasher.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.sha256 = self.hasher.hexdigest()
+        return file
+
+
+def stored_name(digest, filename):
+    ext = os.path.splitext(filename or "")[1].lower()
+    if not EXTENSION_RE.match(ext):
+        ext = ""
+    return f"{digest[:2]}/{digest}{ext}"
+
+
+def thumbnail_name(digest):
+    return f"thumbs/{digest[:2]}/{digest}.webp"
+
+
+def store(file):
+    """
+    Saves an upload under its content hash and returns the stored name.
+    A file whose content is already stored is not written again.
+    """
+    fs = storage()
+    name = stored_name(file.sha256, file.name)
+    if not fs.exists(name):
+        name = fs.save(name, file)
+    return name
+
+
+# ---------------- Thumbnails ----------------
+
+_executor = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS, thread_name_prefix="chatbot-thumbnail")
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def make_thumbnail(name, digest):
+    fs = storage()
+    target = fs.path(thumbnail_name(digest))
+    if os.path.exists(target):
+        return target
+
+    try:
+        with Image.open(fs.path(name)) as img:
+            # Lets JPEG decode at a reduced scale instead of full size.
+            img.draft("RGB", (THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            tmp = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+            img.save(tmp, "WEBP", quality=THUMBNAIL_QUALITY, method=4)
+            os.replace(tmp, target)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        logger.exception("Could not make a thumbnail for upload %s", name)
+        return None
+    return target
+
+
+def _run_thumbnail(name, digest):
+    try:
+        return make_thumbnail(name, digest)
+    finally:
+        with _pending_lock:
+            _pending.discard(digest)
+
+
+def schedule_thumbnail(name, digest):
+    """Makes the thumbnail in the background, once for concurrent uploads of the same file."""
+    with _pending_lock:
+        if digest in _pending:
+            return None
+        _pending.add(digest)
+    return _executor.submit(_run_thumbnail, name, digest)
+
+
+def image_html(name, digest):
+    """
+    Chat markup for an uploaded image: the thumbnail, which falls back to
+    the original until the thumbnail has been written, linked to the
+    original.
+    """
+    fs = storage()
+    full = fs.url(name)
+    thumb = fs.url(thumbnail_name(digest))
+    return (
+        f'<a href="{full}" target="_blank" rel="noopener">'
+        f'<img src="{thumb}" class="uploaded-img" loading="lazy" '
+        f'onerror="this.onerror=null;this.src=\'{full}\'"></a>'
+    )
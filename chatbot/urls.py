@@ -19,6 +19,8 @@ from . import views
 
 urlpatterns = [
     path("chat/", views.chat_api, name="chat_api"),
+    path("chat/async/", views.chat_api_async, name="chat_api_async"),
+    path("chat/stream/", views.chat_stream, name="chat_stream"),
     path("conversations/", views.all_conversations, name="all_conversations"),
     path("messages/<int:cid>/", views.conversation_messages, name="conversation_messages"),
     path("delete/<int:cid>/", views.delete_conversation, name="delete_conversation"),
@@ -27,6 +29,7 @@ urlpatterns = [
     path("pin/<int:cid>/", views.pin_conversation, name="pin_conversation"),
     path("upload-file/", views.upload_file, name="upload_file"),
     path("delete-message/<int:mid>/", views.delete_message, name="delete_message"),
+    path("admission/metrics/", views.admission_metrics, name="admission_metrics"),
     
     # path("image/generate/", views.generate_image_view, name="generate_image")
 ]
@@ -1,12 +1,19 @@
-import json
+from .retrieval import retrieve
 
-def format_prompt(user_message, project_data):
+
+def format_prompt(user_message, project_data, chunks=None):
     """
-    Combines user message + project-specific data into one prompt
-    that will be sent to Hugging Face.
+    Combines user message + the few project data chunks relevant to it
+    (from the vector index) into one prompt that will be sent to
+    Hugging Face.
     """
     project_name = project_data.get("project", "This Project")
-    data_str = json.dumps(project_data, indent=2)
+
+    if chunks is None:
+        chunks = retrieve(user_message)
+    data_str = "\n\n".join(
+        f"[{c.get('title', '')}] {c['text']}" for c in chunks
+    ) or "(no matching data)"
 
     prompt = f"""
 You are an intelligent assistant for the project: {project_name}.
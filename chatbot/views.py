@@ -1,40 +1,56 @@
+import asyncio
 import json
-from django.http import JsonResponse, HttpResponseBadRequest
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, HttpResponseBadRequest, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.shortcuts import render
 from django.contrib.auth import get_user_model
 from .models import Conversation, Message
-from .api import handle_chat
+from .api import (
+    handle_chat, benefit_product_for,
+    product_benefit_async, product_benefit_stream
+)
 from django.views.decorators.http import require_POST
+from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import get_object_or_404
 from django.core.cache import cache
-from django.core.files.storage import FileSystemStorage
+from django.utils.html import escape
 from django.conf import settings
-import os
+from django.db.models import OuterRef, Subquery
 
 from django.conf import settings
 from importlib import import_module
 from .utils import format_prompt
+from .catalog import get_catalog
+from .persistence import persist_turn
+from . import admission, uploads
+from .admission import charge_caller
 
-from deep_translator import GoogleTranslator
+from .translation import atranslate, translate
+from .replies import alocalize, localize, localize_many
+from .pagination import (
+    page_size, id_param, conversation_cursor, conversations_after, message_page
+)
 
 
 
 User = get_user_model()  
 
+MESSAGE_PAGE_SIZE = 50
+
 def chat_page(request):
     return render(request, "chatbot/chat.html")
 
 def load_project_data():
     """
-    Loads the project-specific data file (project_chat_data.py)
-    that exists in each Django project.
+    Returns the project-specific data (project_chat_data.py) from the
+    process-level catalog snapshot instead of rebuilding it per message.
     """
-    module = import_module(settings.PROJECT_CHAT_DATA)
-    return module.get_project_data()
+    return get_catalog()
 
 
 @csrf_exempt
+@charge_caller
 def chat_api(request):
     if request.method != "POST":
         return JsonResponse({"error": "POST only"}, status=405)
@@ -51,17 +67,72 @@ def chat_api(request):
     if not query:
         return JsonResponse({"error": "Missing query"}, status=400)
 
-    translated_query = GoogleTranslator(source="auto", target="en").translate(query)
+    translated_query = translate(query, "en", source=lang)
 
-    conversation = Conversation.objects.filter(id=cid).first()
     user = request.user if request.user.is_authenticated else None
+    conversation = Conversation.objects.filter(id=cid).first() or new_conversation(request, user)
 
     project_data = load_project_data()
 
     result = handle_chat(user, translated_query, conversation, project_data)
 
-    translated_response = GoogleTranslator(source="auto", target=lang).translate(result["response"])
-    result["response"] = translated_response
+    result["response"] = localize(result, lang)
+
+    return JsonResponse({
+        "conversation_id": result["conversation_id"],
+        "user_message_id": result["user_message_id"],
+        "bot_message_id": result["bot_message_id"],
+        "response": result["response"],
+        "title": result["title"],
+    })
+
+
+@csrf_exempt
+@charge_caller
+async def chat_api_async(request):
+    """
+    Async variant of chat_api for ASGI deployments. The translator and
+    product benefit HTTP calls run outside the request thread. The query
+    is translated while the conversation and catalog load; the benefit
+    needs the English query, so it is generated after that and before
+    handle_chat, which then finds it in the LLM cache.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "POST only"}, status=405)
+
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid JSON")
+
+    query = payload.get("query")
+    cid = payload.get("conversation_id")
+    lang = payload.get("lang", "en")
+
+    if not query:
+        return JsonResponse({"error": "Missing query"}, status=400)
+
+    user = await request.auser()
+    user = user if user.is_authenticated else None
+
+    translated_query, conversation, project_data = await asyncio.gather(
+        atranslate(query, "en", source=lang),
+        Conversation.objects.filter(id=cid).afirst(),
+        sync_to_async(load_project_data)(),
+    )
+    if conversation is None:
+        conversation = await sync_to_async(new_conversation)(request, user)
+
+    # Warms the LLM cache without holding a worker thread, so the sync
+    # handle_chat below finds the benefit text ready.
+    product = benefit_product_for(translated_query, project_data)
+    if product:
+        await product_benefit_async(product["title"])
+
+    result = await sync_to_async(handle_chat)(
+        user, translated_query, conversation, project_data
+    )
+    result["response"] = await alocalize(result, lang)
 
     return JsonResponse({
         "conversation_id": result["conversation_id"],
@@ -72,49 +143,170 @@ def chat_api(request):
     })
 
 
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@csrf_exempt
+def chat_stream(request):
+    """
+    Server-sent-event variant of chat_api. Sends a "start" event right
+    away, "token" events while the product benefit is generated (English
+    only, since partial text cannot be translated), and a "done" event
+    with the same fields chat_api returns once the bot Message is saved.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "POST only"}, status=405)
+
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid JSON")
+
+    query = payload.get("query")
+    cid = payload.get("conversation_id")
+    lang = payload.get("lang", "en")
+
+    if not query:
+        return JsonResponse({"error": "Missing query"}, status=400)
+
+    user = request.user if request.user.is_authenticated else None
+    identity = admission.identity_for(request)
+    # Made here: the session cookie is set before the body streams.
+    fresh = new_conversation(request, user)
+
+    def events():
+        yield sse("start", {"conversation_id": cid})
+
+        # The body runs after the view has returned, so the caller is
+        # set here rather than by charge_caller.
+        with admission.acting_as(identity):
+            translated_query = translate(query, "en", source=lang)
+            conversation = Conversation.objects.filter(id=cid).first() or fresh
+            project_data = load_project_data()
+
+            product = benefit_product_for(translated_query, project_data)
+            if product:
+                for piece in product_benefit_stream(product["title"]):
+                    if lang == "en":
+                        yield sse("token", {"text": piece})
+
+            result = handle_chat(user, translated_query, conversation, project_data)
+            result["response"] = localize(result, lang)
+
+        yield sse("done", {
+            "conversation_id": result["conversation_id"],
+            "user_message_id": result["user_message_id"],
+            "bot_message_id": result["bot_message_id"],
+            "response": result["response"],
+            "title": result["title"],
+        })
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def new_conversation(request, user):
+    """
+    An unsaved Conversation for this caller. A visitor's is tied to their
+    session, which is started here if they have none yet.
+    """
+    if user is not None:
+        return Conversation(user=user)
+    if request.session.session_key is None:
+        request.session.create()
+    return Conversation(session_key=request.session.session_key)
+
+
+def user_conversations(request):
+    """Conversations of the logged-in user, or of this visitor's session."""
+    if request.user.is_authenticated:
+        return Conversation.objects.filter(user=request.user)
+    session_key = request.session.session_key
+    if not session_key:
+        return Conversation.objects.none()
+    return Conversation.objects.filter(user__isnull=True, session_key=session_key)
+
+
+@charge_caller
 def all_conversations(request):
+    """
+    One page of the current user's conversations, pinned first and then
+    newest first. The last message of each is fetched by a subquery in
+    the same statement; pass the returned next_cursor back as ?cursor=
+    for the following page.
+    """
     lang = request.GET.get("lang", "en")  
+    limit = page_size(request)
 
-    convos = Conversation.objects.order_by("-pinned", "-created_at")
-    data = []
+    last_message = (
+        Message.objects.filter(conversation=OuterRef("pk"))
+        .order_by("-created_at", "-id")
+        .values("content")[:1]
+    )
+    convos = conversations_after(user_conversations(request), request.GET.get("cursor"))
+    convos = list(
+        convos.annotate(last_message=Subquery(last_message))
+        .order_by("-pinned", "-created_at", "-id")[:limit + 1]
+    )
 
-    for c in convos:
-        last_msg = c.messages.order_by("-created_at").first()
+    has_more = len(convos) > limit
+    convos = convos[:limit]
 
-        if last_msg:
-            preview_translated = GoogleTranslator(source="auto", target=lang).translate(last_msg.content)
-            preview = preview_translated[:30] + "..."
-        else:
-            preview = ""
+    last_messages = [c.last_message or "" for c in convos]
+    previews = localize_many(last_messages, lang)
 
+    data = []
+    for c, last_msg, preview in zip(convos, last_messages, previews):
         data.append({
             "id": c.id,
             "title": c.title,
             "pinned": c.pinned,
-            "preview": preview,
+            "preview": preview[:30] + "..." if last_msg else "",
             "time": c.created_at.strftime("%Y-%m-%d %H:%M")
         })
 
-    return JsonResponse(data, safe=False)
+    return JsonResponse({
+        "results": data,
+        "next_cursor": conversation_cursor(convos[-1]) if has_more else None,
+    })
 
 
+@charge_caller
 def conversation_messages(request, cid):
+    """
+    One page of a conversation, oldest first. Without parameters it is
+    the latest page; ?since_id= returns only messages newer than that id
+    (for polling) and ?before_id= the page of older ones before it.
+    """
     lang = request.GET.get("lang", "en")  
 
-    messages = Message.objects.filter(conversation_id=cid).order_by("created_at")
+    try:
+        since_id = id_param(request, "since_id")
+        before_id = id_param(request, "before_id")
+    except ValueError:
+        return HttpResponseBadRequest("since_id and before_id must be message ids")
+
+    messages, has_more = message_page(
+        Message.objects.filter(conversation_id=cid),
+        since_id=since_id,
+        before_id=before_id,
+        limit=page_size(request, default=MESSAGE_PAGE_SIZE),
+    )
+    translated = localize_many([m.content for m in messages], lang)
 
     data = []
 
-    for m in messages:
-        translated_text = GoogleTranslator(source="auto", target=lang).translate(m.content)
-
+    for m, translated_text in zip(messages, translated):
         data.append({
             "id": m.id,
             "sender": m.sender,
             "content": translated_text
         })
 
-    return JsonResponse(data, safe=False)
+    return JsonResponse({"results": data, "has_more": has_more})
 
 @csrf_exempt
 @require_POST
@@ -124,6 +316,7 @@ def delete_conversation(request, cid):
     cache.set(f"deleted_convo_{cid}", {
         "title": convo.title,
         "user_id": convo.user_id,
+        "session_key": convo.session_key,
         "created_at": convo.created_at,
     }, timeout=15)
 
@@ -143,6 +336,7 @@ def restore_conversation(request, cid):
         id=cid,             
         title=data["title"],
         user_id=data["user_id"],
+        session_key=data.get("session_key", ""),
         created_at=data["created_at"],
     )
 
@@ -176,66 +370,63 @@ def pin_conversation(request, cid):
 
 @csrf_exempt
 def upload_file(request):
+    too_large = JsonResponse(
+        {"error": f"File is larger than {uploads.UPLOAD_MAX_BYTES // (1024 * 1024)} MB"}, status=413
+    )
+    try:
+        uploads.check_content_length(request)
+    except uploads.UploadTooLarge:
+        return too_large
+
+    # Installed before request.FILES is touched, so the body is streamed
+    # through it instead of the default handlers.
+    handler = uploads.HashingUploadHandler(request)
+    request.upload_handlers = [handler]
+
     file = request.FILES.get("file")
     conv_id = request.POST.get("conversation_id")
 
+    if handler.exceeded:
+        return too_large
     if not file:
         return JsonResponse({"error": "Missing file"}, status=400)
 
-    if conv_id:
-        try:
-            conversation = Conversation.objects.get(id=conv_id)
-        except Conversation.DoesNotExist:
-            conversation = Conversation.objects.create(
-                user=request.user if request.user.is_authenticated else None
-            )
-            conv_id = conversation.id
-    else:
-        conversation = Conversation.objects.create(
-            user=request.user if request.user.is_authenticated else None
+    conversation = Conversation.objects.filter(id=conv_id).first() if conv_id else None
+    if conversation is None:
+        conversation = new_conversation(
+            request, request.user if request.user.is_authenticated else None
         )
-        conv_id = conversation.id
-
-    upload_path = os.path.join(settings.MEDIA_ROOT, "uploads")
-    os.makedirs(upload_path, exist_ok=True)
 
-    fs = FileSystemStorage(
-        location=upload_path,
-        base_url=settings.MEDIA_URL + "uploads/"
-    )
-
-    filename = fs.save(file.name, file)
-    file_url = fs.url(filename)
+    name = uploads.store(file)
 
     if file.content_type.startswith("image/"):
-        img_html = f'<img src="{file_url}" class="uploaded-img">'
+        uploads.schedule_thumbnail(name, file.sha256)
+        img_html = uploads.image_html(name, file.sha256)
         content = img_html
         bot_reply = "I received your image!"
     else:
         img_html = None
-        content = f"📎 {file.name}"
+        content = f"📎 {escape(file.name)}"
         bot_reply = "I received your file!"
 
-    # Create user message
-    user_msg = Message.objects.create(
+    user_msg = Message(
         conversation=conversation,
         sender="user",
         content=content
     )
-
-    # Bot reply
-    bot_msg = Message.objects.create(
+    bot_msg = Message(
         conversation=conversation,
         sender="bot",
         content=bot_reply
     )
+    persist_turn(conversation, user_msg, bot_msg)
 
     return JsonResponse({
         "response": bot_msg.content,
         "image_html": img_html,
         "message_id": user_msg.id,
         "bot_message_id": bot_msg.id,
-        "conversation_id": conv_id
+        "conversation_id": conversation.id
     })
 
 @csrf_exempt
@@ -248,6 +439,12 @@ def delete_message(request, mid):
     except Message.DoesNotExist:
         return JsonResponse({"error": "Message not found"}, status=404)
 
+
+@staff_member_required
+def admission_metrics(request):
+    """In-flight calls, queue depth, wait times and refusals of the chatbot's remote calls."""
+    return JsonResponse(admission.metrics())
+
 # import time
 # import requests
 
@@ -0,0 +1,91 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core import search
+from core.models import Category, Product
+
+WORDS = [
+    "apple", "banana", "mango", "orange", "grapes", "carrot", "beans",
+    "spinach", "onion", "tomato", "milk", "paneer", "curd", "butter",
+    "chicken", "mutton", "fish", "chips", "biscuit", "bread", "cake",
+    "juice", "tea", "coffee", "rice", "wheat", "ragi", "oil", "ghee",
+    "turmeric", "chilli", "pepper",
+]
+QUALIFIERS = ["fresh", "organic", "country", "premium", "farm", "green", "red", "baby"]
+ORIGINS = ["Ooty", "Kodaikanal", "Munnar", "Coorg", "Nilgiris", "Wayanad"]
+QUERIES = ["apple", "org", "fresh milk", "chil", "premium rice", "butter", "xyz"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds synthetic catalogs of growing size and compares the latency of "
+        "the old icontains product search with the full-text index, fetching "
+        "every match as search_products does. "
+        "Everything it writes is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="1000,10000,100000",
+                            help="Comma-separated catalog sizes.")
+        parser.add_argument("--rounds", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=7)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        sizes = sorted(int(s) for s in options["sizes"].split(","))
+        substring = search.SubstringBackend()
+
+        self.stdout.write(f"{'products':>9} {'icontains ms':>13} {'index ms':>9}")
+        with transaction.atomic():
+            categories = [
+                Category.objects.create(name=name, image="categories/bench.jpg")
+                for name in ["Fruits", "Vegetables", "Dairy", "Grains", "Spices"]
+            ]
+            seeded = 0
+            for size in sizes:
+                self.seed(size - seeded, categories, rng)
+                seeded = size
+                search.rebuild()
+
+                old = self.time(lambda q: list(
+                    substring.filter(Product.objects.all(), q).order_by("id").values_list("id", flat=True)
+                ), options["rounds"])
+                new = self.time(lambda q: list(
+                    search.search(q).values_list("id", flat=True)
+                ), options["rounds"])
+                self.stdout.write(f"{size:>9} {old:>13.2f} {new:>9.2f}")
+            transaction.set_rollback(True)
+
+    def seed(self, count, categories, rng):
+        Product.objects.bulk_create(
+            (
+                Product(
+                    category=rng.choice(categories),
+                    title=f"{rng.choice(QUALIFIERS)} {rng.choice(WORDS)}".title(),
+                    description=(
+                        f"{rng.choice(WORDS)} from {rng.choice(ORIGINS)}, "
+                        f"packed {rng.randrange(1, 28)} days ago"
+                    ),
+                    base_price=Decimal(rng.randrange(10, 500)),
+                    image="products/bench.jpg",
+                    status="approved",
+                )
+                for _ in range(count)
+            ),
+            batch_size=2000,
+        )
+
+    def time(self, run, rounds):
+        """Median milliseconds of one query, over every query in QUERIES."""
+        samples = []
+        for _ in range(rounds):
+            for q in QUERIES:
+                start = time.perf_counter()
+                run(q)
+                samples.append((time.perf_counter() - start) * 1000)
+        return statistics.median(samples)
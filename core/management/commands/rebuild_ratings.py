@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from core import ratings
+from core.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Recounts the stored review aggregates of products (rating_avg, "
+        "rating_count and the per-star counts) from their reviews. Needed "
+        "after review changes that skip model signals, such as bulk_create "
+        "or queryset.delete()."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("product_ids", nargs="*", type=int,
+                            help="Only these products (default: all).")
+
+    def handle(self, *args, **options):
+        products = Product.objects.all()
+        if options["product_ids"]:
+            products = products.filter(pk__in=options["product_ids"])
+        fixed = ratings.recount(products)
+        self.stdout.write(self.style.SUCCESS(f"Corrected the ratings of {fixed} products."))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core import search
+from core.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the full-text product search index. Needed after changes "
+        "that skip model signals, such as bulk_create or queryset.update()."
+    )
+
+    def handle(self, *args, **options):
+        backend = search.get_backend()
+        start = time.perf_counter()
+        with transaction.atomic():
+            search.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {Product.objects.count()} products with {type(backend).__name__} "
+            f"in {time.perf_counter() - start:.2f}s."
+        ))
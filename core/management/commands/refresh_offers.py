@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from core import offers
+
+
+class Command(BaseCommand):
+    help = (
+        "Updates the stored offer_active and effective_price of products whose "
+        "offer has started or ended. Run it from cron when requests do not "
+        "(CORE_OFFER_SCHEDULER = False)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true",
+                            help="Recompute every product, e.g. after queryset.update() on prices.")
+
+    def handle(self, *args, **options):
+        updated = offers.refresh_offers(everything=options["all"])
+        self.stdout.write(self.style.SUCCESS(f"Refreshed the offer state of {updated} products."))
@@ -0,0 +1,59 @@
+from django.db import migrations
+
+# The product search index as core.search created it when this migration
+# was written. The SQL is frozen here so later changes to core.search do
+# not change what the migration does.
+
+PRODUCT_ROWS = (
+    "SELECT p.id, p.title, COALESCE(c.name, ''), COALESCE(p.description, '') "
+    "FROM core_product p LEFT JOIN core_category c ON c.id = p.category_id"
+)
+
+INSTALL = {
+    "sqlite": [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS core_product_fts USING fts5("
+        "title, category, description, "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        "DELETE FROM core_product_fts",
+        f"INSERT INTO core_product_fts (rowid, title, category, description) {PRODUCT_ROWS}",
+    ],
+    "postgresql": [
+        "CREATE TABLE IF NOT EXISTS core_product_search ("
+        "product_id bigint PRIMARY KEY REFERENCES core_product (id) "
+        "ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+        "document tsvector NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS core_product_search_document_gin "
+        "ON core_product_search USING GIN (document)",
+        "INSERT INTO core_product_search (product_id, document) "
+        "SELECT p.id, "
+        "setweight(to_tsvector('simple', p.title), 'A') || "
+        "setweight(to_tsvector('simple', COALESCE(c.name, '')), 'B') || "
+        "setweight(to_tsvector('simple', COALESCE(p.description, '')), 'C') "
+        "FROM core_product p LEFT JOIN core_category c ON c.id = p.category_id "
+        "ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document",
+    ],
+}
+
+UNINSTALL = {
+    "sqlite": ["DROP TABLE IF EXISTS core_product_fts"],
+    "postgresql": ["DROP TABLE IF EXISTS core_product_search"],
+}
+
+
+def run(statements):
+    """A RunPython function executing the statements for the database in use."""
+    def operation(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, ()):
+            schema_editor.execute(sql)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0009_product_rejection_reason_alter_product_status"),
+    ]
+
+    operations = [
+        migrations.RunPython(run(INSTALL), run(UNINSTALL)),
+    ]
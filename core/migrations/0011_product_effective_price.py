@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-17 08:12
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def backfill(apps, schema_editor):
+    from core import offers
+
+    Product = apps.get_model("core", "Product")
+    products = list(Product.objects.all())
+    for product in products:
+        product.offer_active, product.effective_price = offers.offer_state(product)
+    Product.objects.bulk_update(products, offers.STATE_FIELDS, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='effective_price',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=8),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='offer_active',
+            field=models.BooleanField(db_index=True, default=False, editable=False),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-17 08:18
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill(apps, schema_editor):
+    Product = apps.get_model("core", "Product")
+    Through = Product.wishlist_users.through
+    counts = (
+        Through.objects.filter(product_id=OuterRef("pk"))
+        .values("product_id").annotate(n=Count("*")).values("n")
+    )
+    Product.objects.update(wishlist_count=Coalesce(Subquery(counts), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_product_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='wishlist_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-17 08:46
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_product_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_cat_title_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_title_idx',
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(models.F('category'), django.db.models.functions.text.Lower('title'), models.F('id'), name='product_cat_title_ci_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(django.db.models.functions.text.Lower('title'), models.F('id'), name='product_title_ci_idx'),
+        ),
+    ]
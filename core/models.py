@@ -1,16 +1,17 @@
 from django.db import models
+from django.db.models.functions import Lower
 from django.contrib.auth.models import AbstractUser,BaseUserManager
 from django.conf import settings
 from django.urls import reverse
 from django.utils import timezone
 from django.core.mail import send_mail
 from django.template.loader import render_to_string
-from django.db.models import Avg
 
 from datetime import datetime, timedelta
 from decimal import Decimal
 from math import radians, sin, cos, sqrt, atan2
 
+from . import offers
 from .utils import calculate_distance_km, get_delivery_delay
 
 class CustomUserManager(BaseUserManager):
@@ -139,11 +140,48 @@ class Product(models.Model):
     offer_start = models.DateTimeField(null=True, blank=True)
     offer_end = models.DateTimeField(null=True, blank=True)
 
+    # is_offer_active and discounted_price as of the last save or offer
+    # refresh, for filtering and sorting; see core.offers.
+    offer_active = models.BooleanField(default=False, editable=False, db_index=True)
+    effective_price = models.DecimalField(
+        max_digits=8, decimal_places=2, default=Decimal("0.00"), editable=False, db_index=True
+    )
+
+    # Users who wishlisted the product, maintained by core.wishlist.
+    wishlist_count = models.PositiveIntegerField(default=0, editable=False, db_index=True)
+
+    # Review aggregates, maintained by core.ratings.
+    rating_avg = models.FloatField(default=0, editable=False, db_index=True)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_1 = models.PositiveIntegerField(default=0, editable=False)
+    rating_2 = models.PositiveIntegerField(default=0, editable=False)
+    rating_3 = models.PositiveIntegerField(default=0, editable=False)
+    rating_4 = models.PositiveIntegerField(default=0, editable=False)
+    rating_5 = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        # One per listing sort (core.pagination.SORTS), so each page is an
+        # index range scan.
+        indexes = [
+            models.Index(fields=["category", "effective_price", "id"], name="product_cat_price_idx"),
+            models.Index("category", Lower("title"), "id", name="product_cat_title_ci_idx"),
+            models.Index(fields=["category", "rating_avg", "id"], name="product_cat_rating_idx"),
+            models.Index(fields=["category", "wishlist_count", "id"], name="product_cat_popular_idx"),
+            models.Index(Lower("title"), "id", name="product_title_ci_idx"),
+            models.Index(fields=["is_offer", "discount_percent", "id"], name="product_offer_discount_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.offer_active, self.effective_price = offers.offer_state(self)
+        if kwargs.get("update_fields") is not None:
+            kwargs["update_fields"] = {*kwargs["update_fields"], *offers.STATE_FIELDS}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.title
 
     def get_absolute_url(self):
-        return reverse("product_detail", args=[self.category.id, self.id])
+        return reverse("product_detail", args=[self.category_id, self.id])
 
     def get_weight_options_list(self):
         if not self.weight_options:
@@ -153,22 +191,11 @@ class Product(models.Model):
 
     @property
     def is_offer_active(self):
-        if not self.is_offer:
-            return False
-
-        now = timezone.now()
-        if self.offer_start and self.offer_end:
-            return self.offer_start <= now <= self.offer_end
-
-        return True
+        return offers.offer_state(self)[0]
 
     @property
     def discounted_price(self):
-        if self.is_offer_active and self.discount_percent > 0:
-            discount = (self.base_price * Decimal(self.discount_percent)) / Decimal("100")
-            return (self.base_price - discount).quantize(Decimal("0.01"))
-
-        return self.base_price
+        return offers.offer_state(self)[1]
 
     @property
     def savings_amount(self):
@@ -178,11 +205,16 @@ class Product(models.Model):
 
     @property
     def avg_rating(self):
-        return self.reviews.aggregate(avg=Avg("rating"))["avg"] or 0
-    
+        return self.rating_avg
+
     @property
     def rating_stars(self):
-        return int(round(self.avg_rating))
+        return int(round(self.rating_avg))
+
+    @property
+    def rating_histogram(self):
+        """{stars: number of reviews}, five stars first."""
+        return {star: getattr(self, f"rating_{star}") for star in range(5, 0, -1)}
 
     def convert_weight_value(self, weight_str):
         """
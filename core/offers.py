@@ -0,0 +1,161 @@
+"""
+Stored offer state of products.
+
+Product.offer_active and Product.effective_price hold what
+is_offer_active and discounted_price would answer, so listings can
+filter and sort by price with an index instead of recomputing every
+product's offer. They are written on every Product.save(); what changes
+without a save is time, so each web process keeps the time of the next
+offer start or end and, on the first request after it, flips the
+products whose window it crossed. `manage.py refresh_offers` does the
+same from cron where requests do not run it (CORE_OFFER_SCHEDULER).
+"""
+import logging
+import threading
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import DecimalField, F, Min, Q
+from django.db.models.functions import Round
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_ENABLED = getattr(settings, "CORE_OFFER_SCHEDULER", True)
+# Longest a process goes between refreshes, so offers changed by other
+# processes or by queryset.update() are picked up even when no boundary
+# is near.
+REFRESH_INTERVAL = getattr(settings, "CORE_OFFER_REFRESH_INTERVAL", 3600)
+
+STATE_FIELDS = ["offer_active", "effective_price"]
+
+
+def offer_state(product, now=None):
+    """(offer_active, effective_price) of product at now."""
+    active = product.is_offer
+    if active and product.offer_start and product.offer_end:
+        now = now or timezone.now()
+        active = product.offer_start <= now <= product.offer_end
+
+    price = product.base_price
+    if active and product.discount_percent > 0:
+        discount = (price * Decimal(product.discount_percent)) / Decimal("100")
+        price = (price - discount).quantize(Decimal("0.01"))
+    return active, price
+
+
+def stale_offers(now):
+    """
+    Products whose stored offer_active no longer matches their window at
+    now, or whose stored effective_price no longer matches their price
+    and discount. The price is compared with SQL rounding, so it may
+    select a few products that are not stale; refresh_offers() skips them.
+    """
+    from .models import Product
+
+    in_window = (
+        Q(offer_start__isnull=True) | Q(offer_end__isnull=True) |
+        Q(offer_start__lte=now, offer_end__gte=now)
+    )
+    discounted = Round(
+        F("base_price") * (100 - F("discount_percent")) / 100, 2,
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+    return Product.objects.filter(
+        Q(offer_active=False, is_offer=True) & in_window |
+        Q(offer_active=True) & (Q(is_offer=False) | ~in_window) |
+        Q(offer_active=False) & ~Q(effective_price=F("base_price")) |
+        Q(offer_active=True) & ~Q(effective_price=discounted)
+    )
+
+
+def refresh_offers(now=None, everything=False):
+    """
+    Rewrites the stored offer state of the products that need it (all of
+    them with everything=True) and returns how many were updated.
+    """
+    from .models import Product
+
+    now = now or timezone.now()
+    products = Product.objects.all() if everything else stale_offers(now)
+    changed = []
+    for product in products.only(
+        "is_offer", "discount_percent", "offer_start", "offer_end", "base_price", *STATE_FIELDS
+    ).iterator(chunk_size=1000):
+        state = offer_state(product, now)
+        if state != (product.offer_active, product.effective_price):
+            product.offer_active, product.effective_price = state
+            changed.append(product)
+
+    Product.objects.bulk_update(changed, STATE_FIELDS, batch_size=500)
+    return len(changed)
+
+
+def next_boundary(now):
+    """The next time some product's offer starts or ends, or None."""
+    from .models import Product
+
+    times = Product.objects.filter(
+        is_offer=True, offer_start__isnull=False, offer_end__isnull=False
+    ).aggregate(
+        start=Min("offer_start", filter=Q(offer_start__gt=now)),
+        end=Min("offer_end", filter=Q(offer_end__gte=now)),
+    )
+    upcoming = [t for t in times.values() if t is not None]
+    return min(upcoming) if upcoming else None
+
+
+# ---------------- Scheduler ----------------
+
+# When this process next has to refresh; None until its first request.
+_next_run = None
+_lock = threading.Lock()
+
+
+def next_run(now):
+    """Just after the next offer boundary, and at most REFRESH_INTERVAL away."""
+    run = now + timedelta(seconds=REFRESH_INTERVAL)
+    boundary = next_boundary(now)
+    if boundary is not None:
+        # An offer is still active at its offer_end.
+        run = min(run, boundary + timedelta(microseconds=1))
+    return run
+
+
+def run_due(**kwargs):
+    """
+    request_started receiver: refreshes the stored offer state when an
+    offer boundary has passed since this process last did, before the
+    request reads any product. Between boundaries it costs one clock read.
+    """
+    global _next_run
+    now = timezone.now()
+    if _next_run is not None and now < _next_run:
+        return
+    with _lock:
+        if _next_run is not None and now < _next_run:
+            return
+        try:
+            updated = refresh_offers(now)
+            _next_run = next_run(now)
+        except DatabaseError:
+            # Not worth failing the request over; try again in a minute.
+            logger.exception("Could not refresh the offer state of products")
+            _next_run = now + timedelta(minutes=1)
+            return
+        if updated:
+            logger.info("Offer state of %d products refreshed", updated)
+
+
+def reschedule(product):
+    """Brings the next run forward when product's offer starts or ends sooner."""
+    global _next_run
+    now = timezone.now()
+    with _lock:
+        if _next_run is None:
+            return
+        for boundary in (product.offer_start, product.offer_end):
+            if boundary is not None and boundary >= now:
+                _next_run = min(_next_run, boundary + timedelta(microseconds=1))
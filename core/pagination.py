@@ -0,0 +1,165 @@
+"""
+Keyset (cursor) pagination for the catalog listings.
+
+A page is fetched as "the next PAGE_SIZE rows after the last row shown",
+a WHERE on the sort columns that an index can seek to, so page 200 costs
+what page 1 does, unlike OFFSET. Every sort ends in the primary key, so
+the order is total and no product repeats or goes missing between
+pages. The cursor carries the last row's sort values, signed so it
+cannot be hand-edited, in the `cursor` query parameter.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.http import JsonResponse
+
+PAGE_SIZE = getattr(settings, "CORE_PAGE_SIZE", 24)
+CURSOR_SALT = "core.pagination"
+
+# Sort name -> order_by() fields. The last field must be unique.
+SORTS = {
+    "price_asc": ("effective_price", "id"),
+    "price_desc": ("-effective_price", "-id"),
+    "name_asc": ("title_key", "id"),
+    "name_desc": ("-title_key", "-id"),
+    "rating": ("-rating_avg", "-id"),
+    "newest": ("-id",),
+    "popular": ("-wishlist_count", "-id"),
+    "discount_asc": ("discount_percent", "id"),
+    "discount_desc": ("-discount_percent", "-id"),
+    # Needs a search_rank annotation; see core.search.annotate_relevance.
+    "relevance": ("search_rank", "id"),
+}
+# Sort keys that are expressions, annotated before sorting. Names sort
+# case-insensitively, as the listings always did on the offers page.
+EXPRESSIONS = {"title_key": Lower("title")}
+# Sort names the listings used before.
+ALIASES = {"price_low": "price_asc", "price_high": "price_desc"}
+
+
+# Sorts every listing supports; "relevance" only makes sense for the
+# views that annotate search_rank.
+LISTING_SORTS = frozenset(SORTS) - {"relevance"}
+
+
+def sort_order(sort, default="newest", allowed=LISTING_SORTS):
+    """The SORTS key for a requested sort name if allowed, or default."""
+    sort = ALIASES.get(sort, sort)
+    return sort if sort in allowed else default
+
+
+def _after(order, values):
+    """Rows after values in order: (a > x) OR (a = x AND b > y) OR ..."""
+    condition = Q()
+    for i, field in enumerate(order):
+        name = field.lstrip("-")
+        lookup = "lt" if field.startswith("-") else "gt"
+        equal = {f.lstrip("-"): v for f, v in zip(order[:i], values)}
+        condition |= Q(**equal, **{f"{name}__{lookup}": values[i]})
+    return condition
+
+
+def _values(row, order):
+    values = []
+    for field in order:
+        value = getattr(row, field.lstrip("-"))
+        values.append(str(value) if isinstance(value, Decimal) else value)
+    return values
+
+
+def encode_cursor(sort, row):
+    return signing.dumps([sort, _values(row, SORTS[sort])], salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(sort, cursor):
+    """The sort values in cursor, or None when it is missing, forged or for another sort."""
+    if not cursor:
+        return None
+    try:
+        cursor_sort, values = signing.loads(cursor, salt=CURSOR_SALT)
+    except (signing.BadSignature, ValueError, TypeError):
+        return None
+    if cursor_sort != sort or len(values) != len(SORTS[sort]):
+        return None
+    return values
+
+
+class Page:
+    def __init__(self, request, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.is_first = not request.GET.get("cursor")
+        self._request = request
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def _url(self, cursor):
+        params = self._request.GET.copy()
+        params.pop("format", None)
+        params.pop("cursor", None)
+        if cursor:
+            params["cursor"] = cursor
+        return f"?{params.urlencode()}"
+
+    @property
+    def next_url(self):
+        return self._url(self.next_cursor) if self.next_cursor else None
+
+    @property
+    def first_url(self):
+        return self._url(None)
+
+
+def paginate(request, queryset, sort, size=PAGE_SIZE):
+    """
+    The page of queryset, in SORTS[sort] order, after the request's
+    cursor. Fetches one row more than it shows to know whether a next
+    page exists.
+    """
+    order = SORTS[sort]
+    keys = [field.lstrip("-") for field in order]
+    queryset = queryset.annotate(**{k: EXPRESSIONS[k] for k in keys if k in EXPRESSIONS})
+    values = decode_cursor(sort, request.GET.get("cursor"))
+    if values is not None:
+        queryset = queryset.filter(_after(order, values))
+
+    rows = list(queryset.order_by(*order)[:size + 1])
+    next_cursor = encode_cursor(sort, rows[size - 1]) if len(rows) > size else None
+    return Page(request, rows[:size], next_cursor)
+
+
+def wants_json(request):
+    return request.GET.get("format") == "json"
+
+
+def product_json(product, wishlist_ids=()):
+    return {
+        "id": product.id,
+        "title": product.title,
+        "url": product.get_absolute_url(),
+        "image": product.image.url if product.image else None,
+        "unit": product.unit,
+        "base_price": str(product.base_price),
+        "price": str(product.effective_price),
+        "offer_active": product.offer_active,
+        "discount_percent": product.discount_percent,
+        "rating": round(product.rating_avg, 1),
+        "rating_count": product.rating_count,
+        "in_stock": product.stock > 0,
+        "in_wishlist": product.id in wishlist_ids,
+    }
+
+
+def json_page(page, wishlist_ids=()):
+    """The infinite-scroll response: one page of products and the next page's URL."""
+    return JsonResponse({
+        "products": [product_json(p, wishlist_ids) for p in page],
+        "next": f"{page.next_url}&format=json" if page.next_url else None,
+    })
@@ -0,0 +1,81 @@
+"""
+Review aggregates stored on Product.
+
+rating_count, the per-star counts rating_1 .. rating_5 and rating_avg
+are kept up to date by the Review signals in core.signals, each change
+applied as an UPDATE of F() expressions so concurrent reviews cannot
+lose one another's counts; reviews deleted along with a product,
+category or user are recounted once the cascade is done. Writes that
+skip the signals (bulk_create, queryset.update() on reviews) leave them
+stale until `manage.py rebuild_ratings` recounts them.
+"""
+from django.db.models import Case, Count, F, FloatField, Q, Value, When
+from django.db.models.functions import Cast
+
+STARS = range(1, 6)
+STAR_FIELDS = [f"rating_{star}" for star in STARS]
+FIELDS = ["rating_count", "rating_avg", *STAR_FIELDS]
+
+
+def star(rating):
+    """The histogram bucket of a rating; out-of-range values count as 1 or 5."""
+    return min(5, max(1, int(rating)))
+
+
+# rating_avg from the histogram, evaluated by the database.
+AVERAGE = Case(
+    When(rating_count=0, then=Value(0.0)),
+    default=Cast(
+        sum((F(field) * s for s, field in zip(STARS, STAR_FIELDS)), Value(0)), FloatField()
+    ) / Cast(F("rating_count"), FloatField()),
+    output_field=FloatField(),
+)
+
+
+def _apply(product_id, rating, delta):
+    from .models import Product
+
+    products = Product.objects.filter(pk=product_id)
+    products.update(**{
+        "rating_count": F("rating_count") + delta,
+        f"rating_{star(rating)}": F(f"rating_{star(rating)}") + delta,
+    })
+    products.update(rating_avg=AVERAGE)
+
+
+def review_added(product_id, rating):
+    _apply(product_id, rating, 1)
+
+
+def review_removed(product_id, rating):
+    _apply(product_id, rating, -1)
+
+
+def recount(products):
+    """Recomputes the aggregates of products (a queryset) from their reviews."""
+    Product = products.model
+    Review = Product._meta.get_field("reviews").related_model
+
+    counts = {
+        row.pop("product"): row
+        for row in Review.objects.filter(product__in=products).values("product").annotate(
+            rating_count=Count("id"),
+            rating_1=Count("id", filter=Q(rating__lte=1)),
+            **{f"rating_{s}": Count("id", filter=Q(rating=s)) for s in range(2, 5)},
+            rating_5=Count("id", filter=Q(rating__gte=5)),
+        )
+    }
+
+    changed = []
+    empty = dict.fromkeys(["rating_count", *STAR_FIELDS], 0)
+    for product in products.only(*FIELDS).iterator(chunk_size=1000):
+        row = counts.get(product.pk, empty)
+        total = sum(s * row[field] for s, field in zip(STARS, STAR_FIELDS))
+        row = {**row, "rating_avg": total / row["rating_count"] if row["rating_count"] else 0.0}
+        if any(getattr(product, field) != row[field] for field in FIELDS):
+            for field in FIELDS:
+                setattr(product, field, row[field])
+            changed.append(product)
+
+    Product.objects.bulk_update(changed, FIELDS, batch_size=500)
+    return len(changed)
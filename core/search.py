@@ -0,0 +1,279 @@
+"""
+Full-text product search.
+
+Products are indexed by title, category name and description in a
+database-specific full-text index: an FTS5 table on SQLite, a tsvector
+column with a GIN index on PostgreSQL. Other databases fall back to the
+old icontains filter. Every search term is matched as a prefix, so
+results update as the user types, and results are ranked by the index
+itself, with title matches weighted above category and description
+matches.
+
+The index is kept up to date by the signals in core.signals;
+`manage.py rebuild_search_index` rebuilds it after bulk changes that
+bypass them.
+"""
+import re
+
+from django.db import connection as default_connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+# Terms of a query that are searched for; the rest are ignored.
+MAX_TERMS = 8
+
+TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+PRODUCT_ROWS = """
+    SELECT p.id, p.title, COALESCE(c.name, ''), COALESCE(p.description, '')
+    FROM core_product p LEFT JOIN core_category c ON c.id = p.category_id
+"""
+
+
+def terms(query):
+    return TERM_RE.findall((query or "").lower())[:MAX_TERMS]
+
+
+def _id_column(queryset):
+    return f"{default_connection.ops.quote_name(queryset.model._meta.db_table)}.id"
+
+
+class SearchBackend:
+    """Interface of a product search index; see the subclasses."""
+
+    def install(self, connection):
+        """Creates the index structures if they do not exist."""
+
+    def uninstall(self, connection):
+        pass
+
+    def index(self, connection, where="", params=()):
+        """(Re)indexes the products selected by where, a condition on p / c."""
+
+    def remove(self, connection, ids):
+        pass
+
+    def filter(self, queryset, query):
+        raise NotImplementedError
+
+    def ranked(self, queryset, query):
+        """
+        The products of queryset matching query, annotated with their
+        search_rank, lower for better matches.
+        """
+        return self.filter(queryset, query).annotate(
+            search_rank=Value(0.0, output_field=FloatField())
+        )
+
+
+class SQLiteFTSBackend(SearchBackend):
+    TABLE = "core_product_fts"
+    # bm25() column weights: title, category, description.
+    WEIGHTS = (10.0, 4.0, 1.0)
+
+    def install(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.TABLE} USING fts5("
+                "title, category, description, "
+                "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            )
+
+    def uninstall(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {self.TABLE}")
+
+    def index(self, connection, where="", params=()):
+        with connection.cursor() as cursor:
+            if where:
+                cursor.execute(
+                    f"DELETE FROM {self.TABLE} WHERE rowid IN "
+                    f"(SELECT p.id FROM core_product p LEFT JOIN core_category c "
+                    f"ON c.id = p.category_id {where})",
+                    params,
+                )
+            else:
+                cursor.execute(f"DELETE FROM {self.TABLE}")
+            cursor.execute(
+                f"INSERT INTO {self.TABLE} (rowid, title, category, description) "
+                f"{PRODUCT_ROWS} {where}",
+                params,
+            )
+
+    def remove(self, connection, ids):
+        ids = list(ids)
+        if ids:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"DELETE FROM {self.TABLE} WHERE rowid IN ({', '.join(['%s'] * len(ids))})", ids
+                )
+
+    @staticmethod
+    def match(query):
+        return " ".join(f'"{t}"*' for t in terms(query))
+
+    def filter(self, queryset, query):
+        return queryset.filter(id__in=RawSQL(
+            f"SELECT rowid FROM {self.TABLE} WHERE {self.TABLE} MATCH %s", (self.match(query),)
+        ))
+
+    def ranked(self, queryset, query):
+        # A join, so the MATCH runs once for the query rather than once
+        # per product. bm25() is negative, more so for better matches.
+        weights = ", ".join(str(w) for w in self.WEIGHTS)
+        return queryset.extra(
+            tables=[self.TABLE],
+            where=[f"{self.TABLE}.rowid = {_id_column(queryset)}", f"{self.TABLE} MATCH %s"],
+            params=[self.match(query)],
+        ).annotate(search_rank=RawSQL(
+            f"bm25({self.TABLE}, {weights})", (), output_field=FloatField()
+        ))
+
+
+class PostgresBackend(SearchBackend):
+    TABLE = "core_product_search"
+    # The "simple" configuration does no stemming, so prefixes of product
+    # names match the way customers type them.
+    CONFIG = "simple"
+    # Title, category and description weighted A, B and C for ts_rank_cd.
+    DOCUMENT = (
+        "setweight(to_tsvector('simple', p.title), 'A') || "
+        "setweight(to_tsvector('simple', COALESCE(c.name, '')), 'B') || "
+        "setweight(to_tsvector('simple', COALESCE(p.description, '')), 'C')"
+    )
+
+    def install(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.TABLE} ("
+                "product_id bigint PRIMARY KEY REFERENCES core_product (id) "
+                "ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+                "document tsvector NOT NULL)"
+            )
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.TABLE}_document_gin "
+                f"ON {self.TABLE} USING GIN (document)"
+            )
+
+    def uninstall(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {self.TABLE}")
+
+    def index(self, connection, where="", params=()):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {self.TABLE} (product_id, document) "
+                f"SELECT p.id, {self.DOCUMENT} FROM core_product p "
+                f"LEFT JOIN core_category c ON c.id = p.category_id {where} "
+                "ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document",
+                params,
+            )
+
+    def remove(self, connection, ids):
+        ids = list(ids)
+        if ids:
+            with connection.cursor() as cursor:
+                cursor.execute(f"DELETE FROM {self.TABLE} WHERE product_id = ANY(%s)", (ids,))
+
+    @staticmethod
+    def tsquery(query):
+        return " & ".join(f"{t}:*" for t in terms(query))
+
+    def filter(self, queryset, query):
+        return queryset.filter(id__in=RawSQL(
+            f"SELECT product_id FROM {self.TABLE} "
+            f"WHERE document @@ to_tsquery('{self.CONFIG}', %s)",
+            (self.tsquery(query),),
+        ))
+
+    def ranked(self, queryset, query):
+        return queryset.extra(
+            tables=[self.TABLE],
+            where=[
+                f"{self.TABLE}.product_id = {_id_column(queryset)}",
+                f"{self.TABLE}.document @@ to_tsquery('{self.CONFIG}', %s)",
+            ],
+            params=[self.tsquery(query)],
+        ).annotate(search_rank=RawSQL(
+            f"-ts_rank_cd({self.TABLE}.document, to_tsquery('{self.CONFIG}', %s))",
+            (self.tsquery(query),), output_field=FloatField(),
+        ))
+
+
+class SubstringBackend(SearchBackend):
+    """No index: the substring filter search used before, unranked."""
+
+    def filter(self, queryset, query):
+        query = (query or "").strip()
+        return queryset.filter(
+            Q(title__icontains=query) |
+            Q(description__icontains=query) |
+            Q(category__name__icontains=query)
+        ).distinct()
+
+
+BACKENDS = {
+    "sqlite": SQLiteFTSBackend,
+    "postgresql": PostgresBackend,
+}
+
+
+def get_backend(connection=None):
+    connection = connection or default_connection
+    return BACKENDS.get(connection.vendor, SubstringBackend)()
+
+
+# ---------------- Index maintenance ----------------
+
+def index_products(ids):
+    ids = list(ids)
+    if ids:
+        get_backend().index(
+            default_connection, f"WHERE p.id IN ({', '.join(['%s'] * len(ids))})", ids
+        )
+
+
+def index_category(category_id):
+    get_backend().index(default_connection, "WHERE p.category_id = %s", [category_id])
+
+
+def remove_products(ids):
+    get_backend().remove(default_connection, ids)
+
+
+def rebuild(connection=None):
+    connection = connection or default_connection
+    backend = get_backend(connection)
+    backend.install(connection)
+    backend.index(connection)
+
+
+# ---------------- Queries ----------------
+
+def filter_products(queryset, query):
+    """Products of queryset matching every term of query (as a prefix)."""
+    if not terms(query):
+        return queryset
+    return get_backend().filter(queryset, query)
+
+
+def annotate_relevance(queryset, query):
+    """
+    The products of queryset matching query with a search_rank, lower
+    for better matches, read from the index in the same SQL query.
+    """
+    if not terms(query):
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+    return get_backend().ranked(queryset, query)
+
+
+def order_by_relevance(queryset, query):
+    """The products of queryset matching query, best match first."""
+    return annotate_relevance(queryset, query).order_by("search_rank", "id")
+
+
+def search(query, queryset=None):
+    from .models import Product
+
+    queryset = Product.objects.all() if queryset is None else queryset
+    return order_by_relevance(queryset, query)
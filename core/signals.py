@@ -0,0 +1,89 @@
+from django.core.signals import request_started
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+
+from . import offers, ratings, search, wishlist
+from .models import Category, Product, Review
+
+
+def index_product_on_save(sender, instance, **kwargs):
+    transaction.on_commit(lambda: search.index_products([instance.pk]))
+
+
+def reschedule_offers_on_save(sender, instance, **kwargs):
+    if instance.is_offer:
+        transaction.on_commit(lambda: offers.reschedule(instance))
+
+
+def unindex_product_on_delete(sender, instance, **kwargs):
+    transaction.on_commit(lambda: search.remove_products([instance.pk]))
+
+
+def index_category_on_save(sender, instance, created, **kwargs):
+    # A renamed category changes what its products match.
+    if not created:
+        transaction.on_commit(lambda: search.index_category(instance.pk))
+
+
+def remember_review_rating(sender, instance, raw=False, **kwargs):
+    # The stored product and rating, to move an edited review's count.
+    instance._stored_rating = None
+    if instance.pk and not raw:
+        instance._stored_rating = (
+            Review.objects.filter(pk=instance.pk).values_list("product_id", "rating").first()
+        )
+
+
+def count_review_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    stored = getattr(instance, "_stored_rating", None)
+    current = (instance.product_id, ratings.star(instance.rating))
+    if stored and (stored[0], ratings.star(stored[1])) == current:
+        return
+    if stored:
+        ratings.review_removed(*stored)
+    ratings.review_added(*current)
+
+
+def uncount_review_on_delete(sender, instance, origin=None, **kwargs):
+    if origin is None or isinstance(origin, Review) or getattr(origin, "model", None) is Review:
+        ratings.review_removed(instance.product_id, instance.rating)
+        return
+    # Deleted along with its product, category or author: recount the
+    # products once the whole cascade is done, rather than two UPDATEs
+    # per review on products that may be going too.
+    products = getattr(origin, "_reviewed_products", None)
+    if products is None:
+        products = origin._reviewed_products = set()
+        transaction.on_commit(
+            lambda: ratings.recount(Product.objects.filter(pk__in=products))
+        )
+    products.add(instance.product_id)
+
+
+def count_wishlist_change(sender, instance, action, reverse, pk_set, **kwargs):
+    # reverse: instance is a user and pk_set holds product ids.
+    if action == "pre_clear" and reverse:
+        instance._cleared_wishlist = list(instance.wishlist.values_list("pk", flat=True))
+    elif action in ("post_add", "post_remove", "post_clear"):
+        if not reverse:
+            wishlist.recount([instance.pk])
+        else:
+            wishlist.recount(pk_set if action != "post_clear" else instance._cleared_wishlist)
+            wishlist.forget(instance)
+
+
+post_save.connect(index_product_on_save, sender=Product, dispatch_uid="core_search_product_save")
+post_delete.connect(unindex_product_on_delete, sender=Product, dispatch_uid="core_search_product_delete")
+post_save.connect(index_category_on_save, sender=Category, dispatch_uid="core_search_category_save")
+post_save.connect(reschedule_offers_on_save, sender=Product, dispatch_uid="core_offer_product_save")
+pre_save.connect(remember_review_rating, sender=Review, dispatch_uid="core_ratings_review_pre_save")
+post_save.connect(count_review_on_save, sender=Review, dispatch_uid="core_ratings_review_save")
+post_delete.connect(uncount_review_on_delete, sender=Review, dispatch_uid="core_ratings_review_delete")
+m2m_changed.connect(
+    count_wishlist_change, sender=Product.wishlist_users.through, dispatch_uid="core_wishlist_count"
+)
+
+if offers.SCHEDULER_ENABLED:
+    request_started.connect(offers.run_due, dispatch_uid="core_offer_scheduler")
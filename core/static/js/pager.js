@@ -0,0 +1,50 @@
+// Infinite scroll for the product listings: when the "Load more" link
+// comes into view, fetch the next page and append its product cards to
+// the grid marked data-pager-items. The link keeps working without JS.
+(function () {
+  if (window.pagerLoaded) return;
+  window.pagerLoaded = true;
+
+  function loadNext(link, observer) {
+    observer.unobserve(link);
+    link.classList.add("disabled");
+
+    fetch(link.href, { headers: { "X-Requested-With": "XMLHttpRequest" } })
+      .then((resp) => {
+        if (!resp.ok) throw new Error(resp.status);
+        return resp.text();
+      })
+      .then((html) => {
+        const doc = new DOMParser().parseFromString(html, "text/html");
+        const items = doc.querySelector("[data-pager-items]");
+        const grid = document.querySelector("[data-pager-items]");
+        if (items && grid) grid.append(...items.children);
+
+        const pager = document.querySelector("[data-pager]");
+        const nextPager = doc.querySelector("[data-pager]");
+        const nextLink = nextPager && nextPager.querySelector("[data-pager-next]");
+        if (nextLink) {
+          pager.replaceChildren(nextLink);
+          observer.observe(nextLink);
+        } else {
+          pager.remove();
+        }
+      })
+      .catch(() => {
+        // Fall back to following the link.
+        link.classList.remove("disabled");
+      });
+  }
+
+  document.addEventListener("DOMContentLoaded", function () {
+    const link = document.querySelector("[data-pager-next]");
+    if (!link || !("IntersectionObserver" in window)) return;
+
+    const observer = new IntersectionObserver((entries) => {
+      entries.forEach((entry) => {
+        if (entry.isIntersecting) loadNext(entry.target, observer);
+      });
+    }, { rootMargin: "400px" });
+    observer.observe(link);
+  });
+})();
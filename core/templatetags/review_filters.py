@@ -10,10 +10,9 @@
 #     return round(total / len(reviews), 1)
 
 from django import template
-from django.db.models import Avg
 
 register = template.Library()
 
 @register.filter
 def avg_rating(product):
-    return product.reviews.aggregate(avg=Avg("rating"))["avg"] or 0
+    return product.rating_avg
@@ -1,9 +1,9 @@
 from django import template
 
+from core import wishlist
+
 register = template.Library()
 
 @register.filter
 def in_user_wishlist(product, user):
-    if not user.is_authenticated:
-        return False
-    return product.wishlist_users.filter(id=user.id).exists()
+    return product.id in wishlist.user_ids(user)
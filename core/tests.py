@@ -1,3 +1,345 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db.models.functions import Lower
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+
+from . import offers, pagination, ratings, search, wishlist
+from .models import Category, Product, Review
+
+
+def make_product(category, title, **fields):
+    fields.setdefault("base_price", Decimal("10"))
+    return Product.objects.create(
+        category=category, title=title, image="products/test.jpg", status="approved", **fields
+    )
+
+
+class KeysetPaginationTests(TestCase):
+    """Walking a listing page by page shows every product exactly once, in order."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fruits = Category.objects.create(name="Fruits", image="categories/test.jpg")
+        cls.dairy = Category.objects.create(name="Dairy", image="categories/test.jpg")
+        titles = ["Apple", "apple juice", "Mango", "Banana", "milk"]
+        # Few distinct values per sort column, so pages break inside ties.
+        for i in range(70):
+            make_product(
+                cls.fruits if i % 5 else cls.dairy,
+                titles[i % len(titles)],
+                base_price=Decimal(10 + 10 * (i % 3)),
+                is_offer=i % 2 == 0,
+                discount_percent=(0, 10, 25)[i % 3],
+            )
+        Product.objects.filter(id__in=Product.objects.order_by("id").values("id")[:20]).update(
+            rating_avg=4.5, wishlist_count=2
+        )
+
+    def setUp(self):
+        # The index is filled by on_commit hooks, which TestCase never runs.
+        search.rebuild()
+
+    def walk(self, url):
+        """Ids of the products on every page of url, following the "next" links."""
+        path = url.split("?")[0]
+        seen = []
+        next_url = url
+        while next_url:
+            response = self.client.get(next_url)
+            self.assertEqual(response.status_code, 200)
+            page = response.context["page"]
+            self.assertLessEqual(len(page), pagination.PAGE_SIZE)
+            seen += [p.id for p in page]
+            next_url = page.next_url and path + page.next_url
+        return seen
+
+    def expected(self, queryset, sort):
+        order = pagination.SORTS[sort]
+        queryset = queryset.annotate(title_key=Lower("title"))
+        return list(queryset.order_by(*order).values_list("id", flat=True))
+
+    def test_category_sorts(self):
+        products = Product.objects.filter(category=self.fruits, status="approved")
+        for sort in sorted(pagination.LISTING_SORTS):
+            with self.subTest(sort=sort):
+                seen = self.walk(f"/category/{self.fruits.id}/?sort={sort}")
+                self.assertEqual(seen, self.expected(products, sort))
+
+    def test_our_products_sorts_with_filters(self):
+        products = Product.objects.filter(effective_price__gte=15)
+        for sort in ["price_asc", "price_desc", "name_asc", "name_desc", "rating", "popular"]:
+            with self.subTest(sort=sort):
+                seen = self.walk(f"/our-products/?sort={sort}&min_price=15")
+                self.assertEqual(seen, self.expected(products, sort))
+
+    def test_offers_sorts(self):
+        products = Product.objects.filter(is_offer=True)
+        for requested, sort in [
+            ("price_low", "discount_asc"), ("price_high", "discount_desc"),
+            ("name_asc", "name_asc"), ("rating", "rating"), ("", "newest"),
+        ]:
+            with self.subTest(sort=requested):
+                seen = self.walk(f"/offers/?sort={requested}")
+                self.assertEqual(seen, self.expected(products, sort))
+
+    def test_name_sort_ignores_case(self):
+        response = self.client.get(f"/category/{self.fruits.id}/?sort=name_asc&format=json")
+        titles = [p["title"] for p in response.json()["products"]]
+        self.assertEqual(titles, sorted(titles, key=str.lower))
+        self.assertIn("apple juice", titles)
+
+    def test_forged_cursor_starts_over(self):
+        url = f"/category/{self.fruits.id}/?sort=price_asc"
+        first = [p.id for p in self.client.get(url).context["page"]]
+        cursor = self.client.get(url).context["page"].next_cursor
+
+        for bad in ["garbage", cursor[:-2] + "xx"]:
+            with self.subTest(cursor=bad):
+                page = self.client.get(f"{url}&cursor={bad}").context["page"]
+                self.assertEqual([p.id for p in page], first)
+
+        # A cursor is only valid for the sort it was made for.
+        page = self.client.get(f"/category/{self.fruits.id}/?sort=price_desc&cursor={cursor}").context["page"]
+        self.assertEqual(page.items[0].id, self.expected(Product.objects.filter(category=self.fruits), "price_desc")[0])
+
+    def test_json_pages_follow_on(self):
+        url = f"/category/{self.fruits.id}/?sort=price_asc&format=json"
+        first = self.client.get(url).json()
+        second = self.client.get(f"/category/{self.fruits.id}/{first['next']}").json()
+        ids = [p["id"] for p in first["products"] + second["products"]]
+        self.assertEqual(len(first["products"]), pagination.PAGE_SIZE)
+        self.assertEqual(ids, self.expected(Product.objects.filter(category=self.fruits), "price_asc")[:len(ids)])
+
+    def test_relevance_sort(self):
+        matches = set(search.filter_products(Product.objects.all(), "apple").values_list("id", flat=True))
+
+        for url in ["/search/?q=apple", "/our-products/?q=apple", "/our-products/?q=apple&sort=relevance"]:
+            with self.subTest(url=url):
+                seen = self.walk(url)
+                self.assertEqual(len(seen), len(set(seen)))
+                self.assertEqual(set(seen), matches)
+                # Title matches of the whole word rank above "apple juice".
+                ranked = Product.objects.in_bulk(seen)
+                self.assertEqual(ranked[seen[0]].title, "Apple")
+
+        # Listings without a search rank fall back to their default sort.
+        for url in [f"/category/{self.fruits.id}/?sort=relevance", "/offers/?sort=relevance"]:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.context["sort"], "newest")
+
+
+class OfferStateTests(TestCase):
+    """Stored offer_active / effective_price follow offer windows and price changes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="Fruits", image="categories/test.jpg")
+
+    def setUp(self):
+        self.now = timezone.now()
+
+    def test_save_stores_offer_state(self):
+        always = make_product(self.category, "Always", base_price=Decimal("100"), is_offer=True, discount_percent=10)
+        future = make_product(
+            self.category, "Future", base_price=Decimal("100"), is_offer=True, discount_percent=50,
+            offer_start=self.now + timedelta(days=1), offer_end=self.now + timedelta(days=2),
+        )
+        self.assertEqual((always.offer_active, always.effective_price), (True, Decimal("90.00")))
+        self.assertEqual((future.offer_active, future.effective_price), (False, Decimal("100")))
+
+    def test_refresh_at_boundaries(self):
+        ending = make_product(
+            self.category, "Ending", base_price=Decimal("100"), is_offer=True, discount_percent=25,
+            offer_start=self.now - timedelta(days=1), offer_end=self.now + timedelta(hours=1),
+        )
+        starting = make_product(
+            self.category, "Starting", base_price=Decimal("80"), is_offer=True, discount_percent=50,
+            offer_start=self.now + timedelta(minutes=30), offer_end=self.now + timedelta(days=1),
+        )
+        self.assertEqual(offers.next_boundary(self.now), starting.offer_start)
+        self.assertFalse(offers.stale_offers(self.now).exists())
+
+        later = self.now + timedelta(hours=2)
+        self.assertEqual(offers.refresh_offers(later), 2)
+        ending.refresh_from_db()
+        starting.refresh_from_db()
+        self.assertEqual((ending.offer_active, ending.effective_price), (False, Decimal("100")))
+        self.assertEqual((starting.offer_active, starting.effective_price), (True, Decimal("40.00")))
+        self.assertEqual(offers.refresh_offers(later), 0)
+
+    def test_refresh_picks_up_queryset_updates(self):
+        plain = make_product(self.category, "Plain", base_price=Decimal("50"))
+        offer = make_product(self.category, "Offer", base_price=Decimal("50"), is_offer=True, discount_percent=10)
+        Product.objects.filter(pk=plain.pk).update(base_price=Decimal("60"))
+        Product.objects.filter(pk=offer.pk).update(discount_percent=20)
+
+        self.assertEqual(set(offers.stale_offers(self.now)), {plain, offer})
+        self.assertEqual(offers.refresh_offers(self.now), 2)
+        plain.refresh_from_db()
+        offer.refresh_from_db()
+        self.assertEqual(plain.effective_price, Decimal("60"))
+        self.assertEqual(offer.effective_price, Decimal("40.00"))
+
+    def test_requests_refresh_once_a_boundary_passes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = make_product(
+                self.category, "Soon", base_price=Decimal("10"), is_offer=True, discount_percent=50,
+                offer_start=self.now - timedelta(days=1), offer_end=self.now + timedelta(minutes=5),
+            )
+        with mock.patch.object(offers, "_next_run", None):
+            self.client.get("/offers/")
+            self.assertLessEqual(offers._next_run, product.offer_end + timedelta(seconds=1))
+
+            # Before the boundary a request costs no queries.
+            with self.assertNumQueries(0):
+                offers.run_due()
+
+            after = self.now + timedelta(minutes=10)
+            with mock.patch.object(offers.timezone, "now", return_value=after):
+                self.client.get("/offers/")
+        product.refresh_from_db()
+        self.assertFalse(product.offer_active)
+        self.assertEqual(product.effective_price, Decimal("10"))
+
+
+class RatingCountTests(TestCase):
+    """Product's stored review aggregates follow review writes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.users = [User.objects.create_user(email=f"user{i}@example.com", password="pw") for i in range(4)]
+        cls.category = Category.objects.create(name="Fruits", image="categories/test.jpg")
+
+    def setUp(self):
+        self.product = make_product(self.category, "Apple")
+        self.other = make_product(self.category, "Mango")
+
+    def review(self, user, rating, product=None):
+        return Review.objects.create(product=product or self.product, customer=user, rating=rating, comment="ok")
+
+    def assertAggregates(self, product, count, average, histogram):
+        product.refresh_from_db()
+        self.assertEqual(product.rating_count, count)
+        self.assertAlmostEqual(product.rating_avg, average)
+        self.assertEqual([getattr(product, f) for f in ratings.STAR_FIELDS], histogram)
+
+    def test_add_edit_move_delete(self):
+        first = self.review(self.users[0], 5)
+        second = self.review(self.users[1], 2)
+        self.assertAggregates(self.product, 2, 3.5, [0, 1, 0, 0, 1])
+
+        second.rating = 4
+        second.save()
+        self.assertAggregates(self.product, 2, 4.5, [0, 0, 0, 1, 1])
+
+        second.product = self.other
+        second.save()
+        self.assertAggregates(self.product, 1, 5.0, [0, 0, 0, 0, 1])
+        self.assertAggregates(self.other, 1, 4.0, [0, 0, 0, 1, 0])
+
+        first.delete()
+        self.assertAggregates(self.product, 0, 0.0, [0, 0, 0, 0, 0])
+
+    def test_comment_edit_does_not_touch_product(self):
+        review = self.review(self.users[0], 3)
+        review.comment = "changed"
+        # The pre_save lookup and the review UPDATE, nothing on Product.
+        with self.assertNumQueries(2):
+            review.save()
+
+    def test_cascades_recount_once(self):
+        for user in self.users:
+            self.review(user, 5)
+            self.review(user, 1, product=self.other)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.users[0].delete()
+        self.assertAggregates(self.product, 3, 5.0, [0, 0, 0, 0, 3])
+        self.assertAggregates(self.other, 3, 1.0, [3, 0, 0, 0, 0])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(6):
+                self.product.delete()
+        self.assertAggregates(self.other, 3, 1.0, [3, 0, 0, 0, 0])
+
+    def test_recount_repairs_bulk_writes(self):
+        Review.objects.bulk_create([
+            Review(product=self.product, customer=user, rating=rating, comment="ok")
+            for user, rating in zip(self.users, [1, 2, 3, 4])
+        ])
+        self.assertAggregates(self.product, 0, 0.0, [0, 0, 0, 0, 0])
+
+        self.assertEqual(ratings.recount(Product.objects.all()), 1)
+        self.assertAggregates(self.product, 4, 2.5, [1, 1, 1, 1, 0])
+        self.assertEqual(ratings.recount(Product.objects.all()), 0)
+
+
+class WishlistCountTests(TestCase):
+    """Product.wishlist_count follows every way a wishlist changes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(email="user@example.com", password="pw")
+        cls.other_user = User.objects.create_user(email="other@example.com", password="pw")
+        cls.category = Category.objects.create(name="Fruits", image="categories/test.jpg")
+
+    def setUp(self):
+        self.apple = make_product(self.category, "Apple")
+        self.mango = make_product(self.category, "Mango")
+
+    def counts(self):
+        return list(
+            Product.objects.filter(pk__in=[self.apple.pk, self.mango.pk])
+            .order_by("pk").values_list("wishlist_count", flat=True)
+        )
+
+    def test_toggle(self):
+        self.client.force_login(self.user)
+        self.client.post(f"/toggle-wishlist/{self.apple.id}/")
+        self.client.post(f"/toggle-wishlist/{self.apple.id}/")
+        self.client.post(f"/toggle-wishlist/{self.mango.id}/")
+        self.assertEqual(self.counts(), [0, 1])
+        self.assertEqual(list(self.user.wishlist.all()), [self.mango])
+
+    def test_manager_writes(self):
+        self.apple.wishlist_users.add(self.user, self.other_user)
+        self.other_user.wishlist.add(self.mango)
+        self.assertEqual(self.counts(), [2, 1])
+
+        self.apple.wishlist_users.remove(self.user)
+        self.assertEqual(self.counts(), [1, 1])
+
+        self.other_user.wishlist.clear()
+        self.assertEqual(self.counts(), [0, 0])
+
+    def test_guest_wishlist_merges_on_login(self):
+        self.client.post(f"/toggle-wishlist/{self.apple.id}/")
+        self.client.post(f"/toggle-wishlist/{self.mango.id}/")
+        self.client.post(f"/toggle-wishlist/{self.mango.id}/")
+        session = self.client.session
+        self.assertEqual(session[wishlist.SESSION_KEY], [self.apple.id])
+        self.assertEqual(self.counts(), [0, 0])
+
+        wishlist.merge_guest(session, self.user)
+        self.assertEqual(list(self.user.wishlist.all()), [self.apple])
+        self.assertEqual(self.counts(), [1, 0])
+        self.assertNotIn(wishlist.SESSION_KEY, session)
+
+    def test_ids_are_reloaded_after_a_change_through_request_user(self):
+        request = RequestFactory().post("/")
+        request.user = SimpleLazyObject(lambda: self.user)
+        self.assertEqual(wishlist.ids(request), frozenset())
+
+        self.assertTrue(wishlist.toggle(request, self.apple.id))
+        self.assertEqual(wishlist.ids(request), {self.apple.id})
+        self.assertFalse(wishlist.toggle(request, self.apple.id))
+        self.assertEqual(wishlist.ids(request), frozenset())
@@ -34,6 +34,7 @@ from .models import (
 )
 
 from .serializers import DeliveryZoneSerializer, OrderSerializer
+from . import pagination, search, wishlist
 
 from .utils import (
     calculate_distance_km, send_order_email
@@ -68,39 +69,25 @@ def category_products(request, category_id):
     # show only approved vendor/admin products
     products = category.products.filter(status='approved')
 
-    now = timezone.now()
-
     show_offers = request.GET.get('offers') == 'true'
     if show_offers:
-        products = products.filter(
-            is_offer=True,
-            offer_start__lte=now,
-            offer_end__gte=now
-        )
+        products = products.filter(offer_active=True)
 
-    sort = request.GET.get('sort')
-    if sort == 'price_low':
-        products = products.order_by('base_price')
-    elif sort == 'price_high':
-        products = products.order_by('-base_price')
-    elif sort == 'name_asc':
-        products = products.order_by('title')
-    elif sort == 'name_desc':
-        products = products.order_by('-title')
+    sort = pagination.sort_order(request.GET.get('sort'))
+    page = pagination.paginate(request, products, sort)
 
-    if request.user.is_authenticated:
-        user_wishlist_ids = set(request.user.wishlist.values_list('id', flat=True))
-        for product in products:
-            product.in_wishlist = product.id in user_wishlist_ids
-        guest_wishlist_ids = []
-    else:
-        guest_wishlist_ids = request.session.get("wishlist", [])
-        for product in products:
-            product.in_wishlist = product.id in guest_wishlist_ids
+    wishlist_ids = wishlist.ids(request)
+    if pagination.wants_json(request):
+        return pagination.json_page(page, wishlist_ids)
+
+    for product in page:
+        product.in_wishlist = product.id in wishlist_ids
+    guest_wishlist_ids = [] if request.user.is_authenticated else request.session.get("wishlist", [])
 
     return render(request, 'core/category_products.html', {
         'category': category,
-        'products': products,
+        'products': page,
+        'page': page,
         'sort': sort,
         'show_offers': show_offers,
         'guest_wishlist_ids': guest_wishlist_ids,
@@ -221,10 +208,14 @@ def product_detail(request, category_id, product_id):
             messages.error(request, "Rating and comment are required.")
             return redirect(product.get_absolute_url())
 
+        if rating not in {"1", "2", "3", "4", "5"}:
+            messages.error(request, "Please choose a rating from 1 to 5 stars.")
+            return redirect(product.get_absolute_url())
+
         Review.objects.create(
             product=product,
             customer=request.user,
-            rating=rating,
+            rating=int(rating),
             comment=comment
         )
 
@@ -496,32 +487,11 @@ def remove_from_cart_guest(request, index):
 
 def toggle_wishlist(request, product_id):
     product = get_object_or_404(Product, id=product_id)
-
-
-    if request.user.is_authenticated:
-        if request.user in product.wishlist_users.all():
-            product.wishlist_users.remove(request.user)
-        else:
-            product.wishlist_users.add(request.user)
-
-        return redirect(request.META.get("HTTP_REFERER", "wishlist_page"))
-    
-    wishlist = request.session.get("wishlist", [])
-
-    if product.id in wishlist:
-        wishlist.remove(product.id)
-    else:
-        wishlist.append(product.id)
-
-    request.session["wishlist"] = wishlist
-    request.session.modified = True
-
+    wishlist.toggle(request, product.id)
     return redirect(request.META.get("HTTP_REFERER", "wishlist_page"))
 
 def wishlist_view(request):
 
-    guest_wishlist_ids = request.session.get("wishlist", [])
-
     if request.user.is_authenticated:
         wishlist_items = request.user.wishlist.all()
         return render(
@@ -530,18 +500,13 @@ def wishlist_view(request):
             {
                 "wishlist_items": wishlist_items,
                 "is_guest": False,
-                "guest_wishlist_ids": guest_wishlist_ids,
+                "guest_wishlist_ids": [],
             }
         )
 
-    wishlist = request.session.get("wishlist", [])
-    products = []
-
-    for pid in wishlist:
-        try:
-            products.append(Product.objects.get(id=pid))
-        except Product.DoesNotExist:
-            pass
+    guest_wishlist_ids = request.session.get("wishlist", [])
+    found = Product.objects.in_bulk(guest_wishlist_ids)
+    products = [found[pid] for pid in guest_wishlist_ids if pid in found]
 
     return render(
         request,
@@ -555,71 +520,35 @@ def wishlist_view(request):
 
 def add_to_wishlist(request, product_id):
     product = get_object_or_404(Product, id=product_id)
-
-    if request.user.is_authenticated:
-        product.wishlist_users.add(request.user)
-        return redirect("wishlist_page")
-
-    wishlist = request.session.get("wishlist", [])
-
-    if product.id not in wishlist:
-        wishlist.append(product.id)
-
-    request.session["wishlist"] = wishlist
-    request.session.modified = True
-
+    wishlist.add(request, product.id)
     return redirect("wishlist_page")
 
 def remove_from_wishlist(request, product_id):
-
-    if request.user.is_authenticated:
-        product = get_object_or_404(Product, id=product_id)
-        product.wishlist_users.remove(request.user)
-        return redirect("wishlist_page")
-
-    wishlist = request.session.get("wishlist", [])
-    if product_id in wishlist:
-        wishlist.remove(product_id)
-
-    request.session["wishlist"] = wishlist
-    request.session.modified = True
-
+    wishlist.remove(request, product_id)
     return redirect("wishlist_page")
 
 
 def search_products(request):
     query = request.GET.get('q', '').strip()
     products = []
+    page = None
 
     if query:
-        products = Product.objects.filter(
-            Q(title__icontains=query) |
-            Q(description__icontains=query) |
-            Q(category__name__icontains=query)
-        ).distinct()
-
-
-        if request.user.is_authenticated:
-
-            user_wishlist_ids = set(
-                request.user.wishlist.values_list('id', flat=True)
-            )
+        page = pagination.paginate(request, search.search(query), "relevance")
 
-            for product in products:
-                product.in_wishlist = product.id in user_wishlist_ids
+        wishlist_ids = wishlist.ids(request)
+        if pagination.wants_json(request):
+            return pagination.json_page(page, wishlist_ids)
 
-            guest_wishlist_ids = []  
-
-        else:
-            guest_wishlist_ids = request.session.get("wishlist", [])
-
-            for product in products:
-                product.in_wishlist = product.id in guest_wishlist_ids
+        for product in page:
+            product.in_wishlist = product.id in wishlist_ids
+        products = page
 
     return render(request, 'core/search.html', {
         'query': query,
         'products': products,
-        'guest_wishlist_ids': guest_wishlist_ids if not request.user.is_authenticated else []
+        'page': page,
+        'guest_wishlist_ids': request.session.get("wishlist", []) if not request.user.is_authenticated else []
     })
 
 from decimal import Decimal, InvalidOperation
@@ -638,7 +567,6 @@ def our_products(request):
     sort = request.GET.get("sort", "").strip()
 
     selected_category = None
-    now = timezone.now()
 
     if category_param and category_param.lower() != "none":
         selected_category = Category.objects.filter(
@@ -647,29 +575,14 @@ def our_products(request):
         if selected_category:
             products = products.filter(category=selected_category)
 
-    if keyword:
-        products = products.filter(
-            Q(title__icontains=keyword) |
-            Q(description__icontains=keyword) |
-            Q(category__name__icontains=keyword)
-        )
-
-    products = products.annotate(
-        final_price=Case(
-            When(
-                Q(is_offer=True) &
-                Q(offer_start__lte=now) &
-                Q(offer_end__gte=now) &
-                Q(discount_percent__gt=0),
-                then=ExpressionWrapper(
-                    F("base_price") - (F("base_price") * F("discount_percent") / 100),
-                    output_field=DecimalField(max_digits=10, decimal_places=2)
-                )
-            ),
-            default=F("base_price"), 
-            output_field=DecimalField(max_digits=10, decimal_places=2)
-        )
+    sort = pagination.sort_order(
+        sort, default="relevance" if keyword else "newest", allowed=pagination.SORTS
     )
+    if sort == "relevance":
+        # Keeps only the matches as well.
+        products = search.annotate_relevance(products, keyword)
+    elif keyword:
+        products = search.filter_products(products, keyword)
 
     try:
         min_price_dec = Decimal(min_price) if min_price else None
@@ -682,37 +595,27 @@ def our_products(request):
         max_price_dec = None
 
     if min_price_dec is not None:
-        products = products.filter(final_price__gte=min_price_dec)
+        products = products.filter(effective_price__gte=min_price_dec)
 
     if max_price_dec is not None:
-        products = products.filter(final_price__lte=max_price_dec)
+        products = products.filter(effective_price__lte=max_price_dec)
 
     if weight_filter:
         products = products.filter(weight_options__icontains=weight_filter)
 
-    if sort == "price_asc":
-        products = products.order_by("final_price")
-    elif sort == "price_desc":
-        products = products.order_by("-final_price")
-    elif sort == "name_asc":
-        products = products.order_by("title")
-    elif sort == "name_desc":
-        products = products.order_by("-title")
+    page = pagination.paginate(request, products, sort)
 
-    if request.user.is_authenticated:
-        user_wishlist_ids = request.user.wishlist.values_list("id", flat=True)
-        guest_wishlist_ids = []
-
-        for p in products:
-            p.in_wishlist = p.id in user_wishlist_ids
+    wishlist_ids = wishlist.ids(request)
+    if pagination.wants_json(request):
+        return pagination.json_page(page, wishlist_ids)
 
-    else:
-        guest_wishlist_ids = request.session.get("wishlist", [])
-        for p in products:
-            p.in_wishlist = p.id in guest_wishlist_ids
+    for p in page:
+        p.in_wishlist = p.id in wishlist_ids
+    guest_wishlist_ids = [] if request.user.is_authenticated else request.session.get("wishlist", [])
 
     return render(request, "core/our_products.html", {
-        "products": products,
+        "products": page,
+        "page": page,
         "categories": categories,
         "keyword": keyword,
         "min_price": min_price or "",
@@ -902,7 +805,6 @@ def delete_product(request, product_id):
     messages.warning(request, f"🗑️ '{product.title}' deleted successfully.")
     return redirect('vendor_dashboard')
 
-from django.db.models.functions import Lower
 
 def offers_page(request):
     sort = request.GET.get('sort', '')
@@ -913,25 +815,25 @@ def offers_page(request):
     if category_filter:
         products = products.filter(category__name__icontains=category_filter)
 
-    if sort == 'price_low':
-        products = products.order_by('discount_percent')
-
-    elif sort == 'price_high':
-        products = products.order_by('-discount_percent')
-
-    elif sort == 'name_asc':    
-        products = products.order_by(Lower('title'))
+    # The offers page sorts "price" by the size of the discount.
+    sort = pagination.sort_order(
+        {'price_low': 'discount_asc', 'price_high': 'discount_desc'}.get(sort, sort)
+    )
+    page = pagination.paginate(request, products, sort)
 
-    elif sort == 'name_desc':    
-        products = products.order_by(Lower('title').desc())
+    wishlist_ids = wishlist.ids(request)
+    if pagination.wants_json(request):
+        return pagination.json_page(page, wishlist_ids)
 
     categories = Category.objects.all()
 
     return render(request, "core/offers.html", {
-        "products": products,
+        "products": page,
+        "page": page,
         "sort": sort,
         "selected_category": category_filter,
         "categories": categories,
+        "guest_wishlist_ids": [] if request.user.is_authenticated else request.session.get("wishlist", []),
     })
 
 
@@ -1973,18 +1875,7 @@ def register(request):
                 del request.session["cart"]
             request.session.modified = True
 
-            guest_wishlist = request.session.get("wishlist", [])
-
-            for pid in guest_wishlist:
-                try:
-                    product = Product.objects.get(id=pid)
-                    product.wishlist_users.add(user)
-                except Product.DoesNotExist:
-                    pass
-
-            if "wishlist" in request.session:
-                del request.session["wishlist"]
-            request.session.modified = True
+            wishlist.merge_guest(request.session, user)
 
             user_name = user.email.split("@")[0] if user.email else "User"
             try:
@@ -2065,18 +1956,7 @@ def login_view(request):
                     del request.session["cart"]
                 request.session.modified = True
 
-                guest_wishlist = request.session.get("wishlist", [])
-
-                for product_id in guest_wishlist:
-                    try:
-                        product = Product.objects.get(id=product_id)
-                        product.wishlist_users.add(user)
-                    except Product.DoesNotExist:
-                        pass
-
-                if "wishlist" in request.session:
-                    del request.session["wishlist"]
-                request.session.modified = True
+                wishlist.merge_guest(request.session, user)
 
 
                 next_url = request.GET.get("next")
@@ -0,0 +1,126 @@
+"""
+Wishlist membership.
+
+Signed-in users' wishlists live in the Product.wishlist_users through
+table, guests' in the session as a list of product ids. ids() answers
+"is this product in the wishlist" from a set loaded once per request, and
+the writes here touch single through-table rows instead of loading a
+product's wishlist_users. Product.wishlist_count, the number of users
+who wishlisted a product, is kept in step by these functions and, for
+writes through the wishlist_users manager (the admin, for one), by the
+m2m_changed receiver in core.signals.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+SESSION_KEY = "wishlist"
+
+
+def _through():
+    from .models import Product
+
+    return Product.wishlist_users.through
+
+
+def user_ids(user):
+    """Ids of the products user wishlisted, loaded once per user object."""
+    if not user.is_authenticated:
+        return frozenset()
+    cached = getattr(user, "_wishlist_ids", None)
+    if cached is None:
+        cached = user._wishlist_ids = frozenset(
+            _through().objects.filter(customuser_id=user.pk).values_list("product_id", flat=True)
+        )
+    return cached
+
+
+def ids(request):
+    """Ids of the products in the request's wishlist, signed in or not."""
+    if request.user.is_authenticated:
+        return user_ids(request.user)
+    return frozenset(request.session.get(SESSION_KEY, []))
+
+
+def forget(user):
+    """Drops the ids user_ids() cached on user, a request.user proxy or not."""
+    vars(getattr(user, "_wrapped", user)).pop("_wishlist_ids", None)
+
+
+def recount(product_ids):
+    """Sets wishlist_count of the given products from the through table."""
+    from .models import Product
+
+    Through = _through()
+    counts = (
+        Through.objects.filter(product_id=OuterRef("pk"))
+        .values("product_id").annotate(n=Count("*")).values("n")
+    )
+    Product.objects.filter(pk__in=list(product_ids)).update(
+        wishlist_count=Coalesce(Subquery(counts), Value(0))
+    )
+
+
+def add(request, product_id):
+    if not request.user.is_authenticated:
+        wishlist = request.session.get(SESSION_KEY, [])
+        if product_id not in wishlist:
+            request.session[SESSION_KEY] = wishlist + [product_id]
+        return
+
+    try:
+        with transaction.atomic():
+            _through().objects.create(product_id=product_id, customuser_id=request.user.pk)
+    except IntegrityError:
+        return  # Already there.
+    recount([product_id])
+    forget(request.user)
+
+
+def remove(request, product_id):
+    if not request.user.is_authenticated:
+        wishlist = request.session.get(SESSION_KEY, [])
+        if product_id in wishlist:
+            request.session[SESSION_KEY] = [pid for pid in wishlist if pid != product_id]
+        return
+
+    deleted, _ = _through().objects.filter(
+        product_id=product_id, customuser_id=request.user.pk
+    ).delete()
+    if deleted:
+        recount([product_id])
+    forget(request.user)
+
+
+def toggle(request, product_id):
+    """Adds or removes product_id; returns whether it is now in the wishlist."""
+    if not request.user.is_authenticated:
+        if product_id in request.session.get(SESSION_KEY, []):
+            remove(request, product_id)
+            return False
+        add(request, product_id)
+        return True
+
+    exists = _through().objects.filter(
+        product_id=product_id, customuser_id=request.user.pk
+    ).exists()
+    if exists:
+        remove(request, product_id)
+    else:
+        add(request, product_id)
+    return not exists
+
+
+def merge_guest(session, user):
+    """Moves a guest wishlist into user's on login."""
+    from .models import Product
+
+    guest = session.pop(SESSION_KEY, [])
+    found = list(Product.objects.filter(pk__in=guest).values_list("pk", flat=True))
+    if found:
+        _through().objects.bulk_create(
+            [_through()(product_id=pid, customuser_id=user.pk) for pid in found],
+            ignore_conflicts=True,
+        )
+        recount(found)
+        forget(user)
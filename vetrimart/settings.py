@@ -218,6 +218,7 @@ WAREHOUSE_LON = 76.6932
 
 HF_API_KEY = os.getenv("HF_API_KEY")
 HF_MODEL = os.getenv("HF_MODEL", "google/gemma-2b-it")
+HF_API_URL = os.getenv("HF_API_URL", "https://router.huggingface.co/v1/chat/completions")
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
 FAISS_INDEX_PATH = os.getenv("FAISS_INDEX_PATH", str(BASE_DIR / "faiss_index.index"))
 TOP_K = int(os.getenv("TOP_K", "5"))